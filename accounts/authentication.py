@@ -0,0 +1,140 @@
+"""
+Signed, expiring API tokens
+A token is the user's id, username and flags signed with SECRET_KEY, so
+authenticating one needs no database query: the only lookup is the
+revocation list in the API_TOKEN_CACHE_ALIAS cache. Logout revokes one
+token; a password change, deactivation or change of the staff/superuser
+flags revokes all of a user's tokens
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.crypto import get_random_string
+from rest_framework import authentication
+from rest_framework.exceptions import AuthenticationFailed
+
+TOKEN_SALT = 'accounts.api-token'
+KEYWORD = 'Bearer'
+REVOKED_KEY = 'api-token:revoked:{jti}'
+REVOKED_USER_KEY = 'api-token:revoked-user:{user_id}'
+
+
+def token_ttl():
+    return getattr(settings, 'API_TOKEN_TTL', 60 * 60)
+
+
+def revocation_cache_alias():
+    return getattr(settings, 'API_TOKEN_CACHE_ALIAS', 'api-tokens')
+
+
+def revocation_cache():
+    """
+    The cache holding revocations; it must be a dedicated alias, shared by
+    every worker, so a revocation is seen everywhere and isn't evicted by
+    unrelated entries before the token expires
+    """
+    alias = revocation_cache_alias()
+    if alias not in settings.CACHES:
+        raise ImproperlyConfigured(f"API_TOKEN_CACHE_ALIAS '{alias}' is not configured in CACHES")
+    return caches[alias]
+
+
+def issue_token(user):
+    """Signed token for user, valid for API_TOKEN_TTL seconds"""
+    return signing.dumps({
+        'uid': user.pk,
+        'usr': user.get_username(),
+        'stf': user.is_staff,
+        'su': user.is_superuser,
+        'jti': get_random_string(16),
+        'iat': time.time(),
+    }, salt=TOKEN_SALT, compress=True)
+
+
+def load_claims(token):
+    """Claims of a well-formed, unexpired token; revocation is checked separately"""
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=token_ttl())
+    except signing.SignatureExpired:
+        raise AuthenticationFailed('Token has expired.')
+    except signing.BadSignature:
+        raise AuthenticationFailed('Invalid token.')
+
+
+def revocation_keys(claims):
+    return REVOKED_KEY.format(jti=claims['jti']), REVOKED_USER_KEY.format(user_id=claims['uid'])
+
+
+def check_not_revoked(claims, revoked):
+    """revoked is the cache entries for revocation_keys(claims)"""
+    token_key, user_key = revocation_keys(claims)
+    if token_key in revoked or claims['iat'] <= revoked.get(user_key, float('-inf')):
+        raise AuthenticationFailed('Token has been revoked.')
+    return claims
+
+
+def verify_token(token):
+    claims = load_claims(token)
+    return check_not_revoked(claims, revocation_cache().get_many(revocation_keys(claims)))
+
+
+async def averify_token(token):
+    claims = load_claims(token)
+    return check_not_revoked(claims, await revocation_cache().aget_many(revocation_keys(claims)))
+
+
+def revoke_token(claims):
+    """Revoke one token until it would have expired anyway"""
+    remaining = claims['iat'] + token_ttl() - time.time()
+    if remaining > 0:
+        revocation_cache().set(REVOKED_KEY.format(jti=claims['jti']), True, int(remaining) + 1)
+
+
+def revoke_user_tokens(user_id):
+    """Revoke every token issued to a user so far"""
+    revocation_cache().set(REVOKED_USER_KEY.format(user_id=user_id), time.time(), token_ttl() + 1)
+
+
+def token_user(claims):
+    """
+    User built from the claims alone, good for permission checks and for
+    filtering by user; load the row before reading or saving other fields
+    """
+    user = User(
+        id=claims['uid'], username=claims['usr'], is_staff=claims['stf'],
+        is_superuser=claims['su'], is_active=True,
+    )
+    user._state.adding = False
+    return user
+
+
+def get_token(request):
+    """The bearer token of the Authorization header, None when there is none"""
+    header = authentication.get_authorization_header(request).split()
+    if not header or header[0].lower() != KEYWORD.lower().encode():
+        return None
+    if len(header) != 2:
+        raise AuthenticationFailed('Invalid token header.')
+    try:
+        return header[1].decode()
+    except UnicodeError:
+        raise AuthenticationFailed('Invalid token header.')
+
+
+class SignedTokenAuthentication(authentication.BaseAuthentication):
+    """`Authorization: Bearer <token>` with a token from issue_token(); sets request.auth to its claims"""
+
+    def authenticate(self, request):
+        token = get_token(request)
+        if token is None:
+            return None
+        claims = verify_token(token)
+        return token_user(claims), claims
+
+    def authenticate_header(self, request):
+        # Makes DRF answer authentication failures with 401, not 403
+        return KEYWORD
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core import checks
+
+from .authentication import revocation_cache_alias
+
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.security, checks.Tags.caches)
+def check_revocation_cache(app_configs, **kwargs):
+    """Revoked API tokens must stay revoked in every worker until they expire"""
+    alias = revocation_cache_alias()
+    cache_settings = settings.CACHES.get(alias)
+    if cache_settings is None:
+        return [checks.Error(
+            f"API_TOKEN_CACHE_ALIAS '{alias}' is not configured in CACHES.",
+            hint='Add a shared cache (file, Redis or Memcached) under that alias.',
+            id='accounts.E001',
+        )]
+    errors = []
+    if alias == 'default':
+        errors.append(checks.Warning(
+            'API token revocations share the default cache, where other entries can evict them.',
+            hint='Give API_TOKEN_CACHE_ALIAS a dedicated cache alias.',
+            id='accounts.W001',
+        ))
+    if cache_settings.get('BACKEND') in PER_PROCESS_BACKENDS:
+        errors.append(checks.Warning(
+            f"The '{alias}' cache is per process, so a revoked API token stays valid in other workers.",
+            hint='Use a shared backend (file, Redis or Memcached).',
+            id='accounts.W002',
+        ))
+    return errors
@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .authentication import revoke_user_tokens
+
+# Carried in the token claims, so changing them must invalidate existing tokens
+PRIVILEGE_FIELDS = ('is_staff', 'is_superuser')
+
+
+@receiver(pre_save, sender=User)
+def remember_privileges(sender, instance, update_fields=None, **kwargs):
+    """Load the stored privilege flags so post_save can tell whether they changed"""
+    instance._stored_privileges = None
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(PRIVILEGE_FIELDS):
+        return
+    instance._stored_privileges = (
+        User.objects.filter(pk=instance.pk).values_list(*PRIVILEGE_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=User)
+def revoke_tokens_on_credentials_change(sender, instance, created, **kwargs):
+    """A new password, a deactivated account or changed privileges invalidate the user's API tokens"""
+    if created:
+        return
+    # set_password() keeps the raw password in _password until save() completes
+    if instance._password is not None or not instance.is_active:
+        revoke_user_tokens(instance.pk)
+        return
+    stored = getattr(instance, '_stored_privileges', None)
+    if stored is not None and stored != tuple(getattr(instance, field) for field in PRIVILEGE_FIELDS):
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_tokens_on_delete(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
@@ -1,3 +1,144 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from moods.cache import invalidate_active_moods
+from moods.models import Mood
+from .authentication import issue_token, revocation_cache
+from .checks import check_revocation_cache
+
+
+class SignedTokenTests(TestCase):
+    """Tests for the signed API tokens issued at login"""
+
+    def setUp(self):
+        cache.clear()
+        revocation_cache().clear()
+        self.addCleanup(revocation_cache().clear)
+        invalidate_active_moods()
+        self.user = User.objects.create_user(username='tester', password='testpass123', email='t@example.com')
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post(
+            '/api/auth/login/', {'username': 'tester', 'password': 'testpass123'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['token']
+
+    def bearer(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def test_login_issues_token_that_authenticates_without_queries(self):
+        client = self.bearer(self.login())
+        client.get('/api/moods/')  # Warm the mood catalog cache
+
+        with self.assertNumQueries(0):
+            response = client.get('/api/moods/')
+        self.assertEqual(response.status_code, 200)
+
+        # Just the history page
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/api/movies/recommendations/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertIn('FROM "movies_recommendation"', context.captured_queries[0]['sql'])
+
+    def test_profile_loads_user_behind_token(self):
+        client = self.bearer(self.login())
+        self.assertEqual(client.get('/api/auth/profile/').json()['email'], 't@example.com')
+
+        response = client.put('/api/auth/profile/', {'first_name': 'Test'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Test')
+        self.assertEqual(self.user.email, 't@example.com')
+
+    def test_logout_revokes_token(self):
+        token = self.login()
+        client = self.bearer(token)
+        self.assertEqual(client.post('/api/auth/logout/').status_code, 200)
+        response = self.bearer(token).get('/api/movies/recommendations/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+        self.assertEqual(response.json()['detail'], 'Token has been revoked.')
+
+    def test_password_change_and_deactivation_revoke_all_tokens(self):
+        first, second = issue_token(self.user), issue_token(self.user)
+        self.user.first_name = 'Unrelated'
+        self.user.save()
+        self.assertEqual(self.bearer(first).get('/api/movies/recommendations/').status_code, 200)
+
+        self.user.set_password('newpass456')
+        self.user.save()
+        for token in (first, second):
+            self.assertEqual(self.bearer(token).get('/api/movies/recommendations/').status_code, 401)
+
+        # Tokens issued after the change still work, until the account is deactivated
+        token = issue_token(self.user)
+        self.assertEqual(self.bearer(token).get('/api/movies/recommendations/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.bearer(token).get('/api/movies/recommendations/').status_code, 401)
+
+    def test_privilege_changes_revoke_all_tokens(self):
+        self.user.is_staff = True
+        self.user.save()
+        token = issue_token(self.user)
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(self.bearer(token).get('/api/movies/recommendations/').status_code, 200)
+
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.bearer(token).get('/api/movies/recommendations/').status_code, 401)
+
+        token = issue_token(self.user)
+        User.objects.get(pk=self.user.pk).save(update_fields=['is_superuser'])  # Unchanged
+        self.assertEqual(self.bearer(token).get('/api/movies/recommendations/').status_code, 200)
+
+    def test_missing_credentials_get_a_bearer_challenge(self):
+        response = self.client.get('/api/movies/recommendations/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    def test_revocation_cache_must_be_configured(self):
+        with override_settings(API_TOKEN_CACHE_ALIAS='missing'):
+            self.assertEqual([error.id for error in check_revocation_cache(None)], ['accounts.E001'])
+            with self.assertRaises(ImproperlyConfigured):
+                revocation_cache()
+        with override_settings(API_TOKEN_CACHE_ALIAS='default'):
+            self.assertEqual([error.id for error in check_revocation_cache(None)], ['accounts.W001', 'accounts.W002'])
+        self.assertEqual(check_revocation_cache(None), [])
+
+    @override_settings(API_TOKEN_TTL=60)
+    def test_expired_and_tampered_tokens_are_rejected(self):
+        token = issue_token(self.user)
+        with mock.patch('time.time', return_value=time.time() + 61):
+            response = self.bearer(token).get('/api/movies/recommendations/')
+        self.assertEqual(response.json()['detail'], 'Token has expired.')
+
+        response = self.bearer(token[:-2] + 'xx').get('/api/movies/recommendations/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['detail'], 'Invalid token.')
+
+    async def test_async_recommend_accepts_token_without_csrf(self):
+        mood = await Mood.objects.aget(name='Happy')
+        token = issue_token(self.user)
+        with mock.patch('movies.views.AsyncRecommendationService.recommend', return_value=([], [])) as recommend:
+            response = await self.async_client.post(
+                '/api/movies/recommend/async/', {'mood_id': mood.id},
+                content_type='application/json', headers={'Authorization': f'Bearer {token}'},
+            )
+        self.assertEqual(response.status_code, 404)  # Reached the view: no movies from the mock
+        self.assertEqual(recommend.call_args.args[0].pk, self.user.pk)
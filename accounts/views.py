@@ -8,6 +8,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from .authentication import SignedTokenAuthentication, issue_token, revoke_token, token_ttl
 from .serializers import (
     UserRegistrationSerializer,
     UserLoginSerializer,
@@ -49,7 +50,9 @@ def login_view(request):
                 'id': user.id,
                 'username': user.username,
                 'email': user.email
-            }
+            },
+            'token': issue_token(user),
+            'expires_in': token_ttl()
         }, status=status.HTTP_200_OK)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -58,7 +61,9 @@ def login_view(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
-    """User logout endpoint"""
+    """User logout endpoint; also revokes the bearer token the request was made with"""
+    if isinstance(request.successful_authenticator, SignedTokenAuthentication):
+        revoke_token(request.auth)
     logout(request)
     return Response({'message': 'Logout successful'}, status=status.HTTP_200_OK)
 
@@ -67,12 +72,17 @@ def logout_view(request):
 @permission_classes([IsAuthenticated])
 def profile_view(request):
     """Get or update user profile"""
+    user = request.user
+    if isinstance(request.successful_authenticator, SignedTokenAuthentication):
+        # A token only carries the id and username: load the rest of the profile
+        user = User.objects.get(pk=user.pk)
+    
     if request.method == 'GET':
-        serializer = UserProfileSerializer(request.user)
+        serializer = UserProfileSerializer(user)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     elif request.method == 'PUT':
-        serializer = UserProfileSerializer(request.user, data=request.data, partial=True)
+        serializer = UserProfileSerializer(user, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response({
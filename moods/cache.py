@@ -0,0 +1,62 @@
+"""
+Two-level cache for the active mood catalog
+Each process keeps a copy for MOOD_LOCAL_CACHE_TTL seconds in front of the
+shared Django cache; Mood signals clear both
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from movieflick.conditional import make_etag
+from .models import Mood
+from .serializers import MoodSerializer
+
+
+CACHE_KEY = 'moods:active-catalog'
+
+_local_entry = None
+_local_expires_at = 0
+_local_lock = threading.Lock()
+
+
+def get_active_moods():
+    """
+    Get the serialized active moods as a dict with:
+    moods (list), by_id (id -> mood), etag (list ETag) and etags (id -> ETag)
+    """
+    global _local_entry, _local_expires_at
+    entry = _local_entry
+    if entry is not None and _local_expires_at > time.monotonic():
+        return entry
+
+    entry = cache.get(CACHE_KEY)
+    if entry is None:
+        entry = build_catalog()
+        cache.set(CACHE_KEY, entry, getattr(settings, 'MOOD_CACHE_TIMEOUT', 24 * 60 * 60))
+
+    with _local_lock:
+        _local_entry = entry
+        _local_expires_at = time.monotonic() + getattr(settings, 'MOOD_LOCAL_CACHE_TTL', 30)
+    return entry
+
+
+def build_catalog():
+    """Load and serialize the active moods from the database"""
+    moods = [dict(mood) for mood in MoodSerializer(Mood.objects.filter(is_active=True), many=True).data]
+    return {
+        'moods': moods,
+        'by_id': {mood['id']: mood for mood in moods},
+        'etag': make_etag(moods),
+        'etags': {mood['id']: make_etag(mood) for mood in moods},
+    }
+
+
+def invalidate_active_moods():
+    """Drop the cached catalog in this process and in the shared cache"""
+    global _local_entry, _local_expires_at
+    with _local_lock:
+        _local_entry = None
+        _local_expires_at = 0
+    cache.delete(CACHE_KEY)
@@ -1,11 +1,13 @@
 from rest_framework import serializers
+from movieflick.metrics import TimedListSerializer, TimedSerializationMixin
 from .models import Mood
 
 
-class MoodSerializer(serializers.ModelSerializer):
+class MoodSerializer(TimedSerializationMixin, serializers.ModelSerializer):
     """Serializer for Mood model"""
     class Meta:
         model = Mood
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'name', 'description', 'emoji', 'is_active']
         read_only_fields = ['id', 'name', 'description', 'emoji', 'is_active']
 
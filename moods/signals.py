@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_active_moods
+from .models import Mood
+
+
+@receiver(post_save, sender=Mood)
+@receiver(post_delete, sender=Mood)
+def invalidate_mood_catalog(sender, **kwargs):
+    """Any change to a mood invalidates the cached catalog"""
+    invalidate_active_moods()
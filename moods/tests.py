@@ -1,3 +1,67 @@
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from .cache import invalidate_active_moods
+from .models import Mood
+
+
+class MoodCatalogCacheTests(TestCase):
+    """Tests for the cached, conditional-GET mood endpoints"""
+
+    def setUp(self):
+        cache.clear()
+        invalidate_active_moods()
+        self.client = APIClient()
+
+    def test_list_is_served_from_cache(self):
+        self.client.get('/api/moods/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/moods/')
+        self.assertEqual(len(response.data), 5)
+        self.assertIn('max-age=300', response['Cache-Control'])
+
+    def test_list_returns_304_for_matching_etag(self):
+        etag = self.client.get('/api/moods/')['ETag']
+
+        response = self.client.get('/api/moods/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('Accept', response['Vary'])
+
+    def test_responses_vary_on_accept(self):
+        json_response = self.client.get('/api/moods/', HTTP_ACCEPT='application/json')
+        html_response = self.client.get('/api/moods/', HTTP_ACCEPT='text/html')
+
+        self.assertNotEqual(json_response['Content-Type'], html_response['Content-Type'])
+        for response in (json_response, html_response):
+            self.assertIn('Accept', response['Vary'])
+
+    def test_detail_returns_304_for_matching_etag(self):
+        mood = Mood.objects.get(name='Happy')
+        etag = self.client.get(f'/api/moods/{mood.id}/')['ETag']
+
+        response = self.client.get(f'/api/moods/{mood.id}/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_saving_a_mood_invalidates_the_catalog(self):
+        etag = self.client.get('/api/moods/')['ETag']
+        Mood.objects.get(name='Sad').delete()
+
+        response = self.client.get('/api/moods/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 4)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_inactive_mood_is_not_found(self):
+        mood = Mood.objects.get(name='Happy')
+        mood.is_active = False
+        mood.save()
+
+        response = self.client.get(f'/api/moods/{mood.id}/')
+
+        self.assertEqual(response.status_code, 404)
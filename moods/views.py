@@ -2,29 +2,42 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from .models import Mood
-from .serializers import MoodSerializer
+from django.conf import settings
+from movieflick.conditional import not_modified_response, set_validators
+from .cache import get_active_moods
+
+
+def mood_cache_control():
+    """Cache-Control directives for the mood endpoints"""
+    return {'public': True, 'max_age': getattr(settings, 'MOOD_CACHE_MAX_AGE', 300)}
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def mood_list_view(request):
-    """List all active moods"""
-    moods = Mood.objects.filter(is_active=True)
-    serializer = MoodSerializer(moods, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    """List all active moods (cached, supports If-None-Match)"""
+    catalog = get_active_moods()
+    not_modified = not_modified_response(request, etag=catalog['etag'], **mood_cache_control())
+    if not_modified is not None:
+        return not_modified
+    response = Response(catalog['moods'], status=status.HTTP_200_OK)
+    return set_validators(response, etag=catalog['etag'], **mood_cache_control())
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def mood_detail_view(request, pk):
-    """Get mood details by ID"""
-    try:
-        mood = Mood.objects.get(pk=pk, is_active=True)
-    except Mood.DoesNotExist:
+    """Get mood details by ID (cached, supports If-None-Match)"""
+    catalog = get_active_moods()
+    mood = catalog['by_id'].get(pk)
+    if mood is None:
         return Response(
             {'error': 'Mood not found'},
             status=status.HTTP_404_NOT_FOUND
         )
-    serializer = MoodSerializer(mood)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    etag = catalog['etags'][pk]
+    not_modified = not_modified_response(request, etag=etag, **mood_cache_control())
+    if not_modified is not None:
+        return not_modified
+    response = Response(mood, status=status.HTTP_200_OK)
+    return set_validators(response, etag=etag, **mood_cache_control())
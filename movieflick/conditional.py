@@ -0,0 +1,43 @@
+"""
+Helpers for conditional GET (ETag / Last-Modified) in API views
+"""
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(data):
+    """Strong ETag for JSON-serializable data"""
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str).encode()
+    return quote_etag(hashlib.sha1(encoded).hexdigest())
+
+
+def not_modified_response(request, etag=None, last_modified=None, **cache_control):
+    """
+    Return a 304 (or 412) response when the request's If-None-Match /
+    If-Modified-Since validators match, otherwise None
+    `last_modified` is an aware datetime
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag=etag, last_modified=last_modified, **cache_control)
+    return response
+
+
+def set_validators(response, etag=None, last_modified=None, **cache_control):
+    """
+    Set ETag, Last-Modified and Cache-Control headers on a response
+    DRF picks the renderer (JSON or browsable API) from Accept, so the
+    response also varies on it
+    """
+    patch_vary_headers(response, ['Accept'])
+    if etag:
+        response.headers['ETag'] = etag
+    if last_modified:
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    if cache_control:
+        patch_cache_control(response, **cache_control)
+    return response
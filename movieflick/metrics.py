@@ -0,0 +1,178 @@
+"""
+In-process request metrics, exported in the Prometheus text format
+Each worker process keeps its own registry; scrape every worker (or sum
+them in Prometheus) when running more than one
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Prometheus-style histogram with labels"""
+
+    def __init__(self, name, documentation, buckets, labelnames=('view',)):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def collect(self):
+        """Exposition lines for this histogram"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            labels = [f'{name}="{escape_label(value)}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                bucket_labels = ','.join([*labels, f'le="{bound}"'])
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {cumulative}')
+            series_labels = '{' + ','.join(labels) + '}' if labels else ''
+            lines.append(f'{self.name}_sum{series_labels} {total}')
+            lines.append(f'{self.name}_count{series_labels} {count}')
+        return lines
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram(
+    'movieflick_request_duration_seconds', 'Total request latency', LATENCY_BUCKETS,
+    labelnames=('view', 'method', 'status'),
+)
+DB_QUERIES = Histogram('movieflick_db_queries', 'Database queries per request', COUNT_BUCKETS)
+DB_DURATION = Histogram('movieflick_db_duration_seconds', 'Time spent in database queries per request', LATENCY_BUCKETS)
+TMDB_CALLS = Histogram('movieflick_tmdb_calls', 'TMDB API calls per request (cache hits excluded)', COUNT_BUCKETS)
+TMDB_DURATION = Histogram('movieflick_tmdb_call_duration_seconds', 'Latency of individual TMDB API calls', LATENCY_BUCKETS)
+SERIALIZE_DURATION = Histogram(
+    'movieflick_serialize_duration_seconds', 'Time spent serializing and rendering responses', LATENCY_BUCKETS,
+)
+
+REGISTRY = [REQUEST_DURATION, DB_QUERIES, DB_DURATION, TMDB_CALLS, TMDB_DURATION, SERIALIZE_DURATION]
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+def clear_metrics():
+    for metric in REGISTRY:
+        metric.clear()
+
+
+class RequestTimings:
+    """Timings gathered while serving one sampled request"""
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.tmdb_calls = []
+        self.serialize_time = 0.0
+        # Queries and TMDB calls may be recorded from fan-out threads
+        self.lock = threading.Lock()
+
+    def add_query(self, elapsed):
+        with self.lock:
+            self.db_queries += 1
+            self.db_time += elapsed
+
+    def add_tmdb_call(self, elapsed):
+        with self.lock:
+            self.tmdb_calls.append(elapsed)
+
+    def add_serialization(self, elapsed):
+        with self.lock:
+            self.serialize_time += elapsed
+
+
+_current_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def current_timings():
+    """Timings of the request being served, or None when it isn't sampled"""
+    return _current_timings.get()
+
+
+@contextmanager
+def collect_timings():
+    timings = RequestTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def record_tmdb_call(elapsed):
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add_tmdb_call(elapsed)
+
+
+@contextmanager
+def timed_serialization():
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_serialization(time.perf_counter() - start)
+
+
+class TimedSerializationMixin:
+    """Count time spent building `serializer.data` as serialization time"""
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class TimedListSerializer(TimedSerializationMixin, serializers.ListSerializer):
+    pass
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer that counts rendering as serialization time"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed_serialization():
+            return super().render(data, accepted_media_type, renderer_context)
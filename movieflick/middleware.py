@@ -0,0 +1,105 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+
+def count_query(execute, sql, params, many, context):
+    """Execute wrapper feeding the sampled request's timings, if any"""
+    timings = metrics.current_timings()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(time.perf_counter() - start)
+
+
+def install_query_counter(connection, **kwargs):
+    # Installed once per connection: queries may run on sync_to_async
+    # threads, which a per-request execute_wrapper() block would miss
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+connection_created.connect(install_query_counter)
+
+
+class PerformanceMiddleware:
+    """
+    Records total latency, DB query count/time, TMDB calls and serialization
+    time per view for a sample of requests (METRICS_SAMPLE_RATE), exports
+    them as histograms on /metrics and as a Server-Timing header
+    Unsampled requests pay for one random() call, and each of their queries
+    for the context variable lookup in count_query: the wrapper stays on
+    every connection so queries on sync_to_async threads are counted too
+    """
+    sync_capable = True
+    async_capable = True
+
+    EXCLUDED_PATHS = ('/metrics',)
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled(request):
+            return self.get_response(request)
+
+        for connection in connections.all():
+            install_query_counter(connection)
+        start = time.perf_counter()
+        with metrics.collect_timings() as timings:
+            response = self.get_response(request)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.sampled(request):
+            return await self.get_response(request)
+
+        start = time.perf_counter()
+        with metrics.collect_timings() as timings:
+            response = await self.get_response(request)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    def sampled(self, request):
+        sample_rate = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+        if sample_rate <= 0 or request.path in self.EXCLUDED_PATHS:
+            return False
+        return sample_rate >= 1 or random.random() < sample_rate
+
+    def finish(self, request, response, timings, total):
+        self.observe(request, response, timings, total)
+        if getattr(settings, 'METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = self.server_timing(timings, total)
+        return response
+
+    def observe(self, request, response, timings, total):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unresolved'
+
+        metrics.REQUEST_DURATION.observe(total, view=view, method=request.method, status=response.status_code)
+        metrics.DB_QUERIES.observe(timings.db_queries, view=view)
+        metrics.DB_DURATION.observe(timings.db_time, view=view)
+        metrics.TMDB_CALLS.observe(len(timings.tmdb_calls), view=view)
+        for elapsed in timings.tmdb_calls:
+            metrics.TMDB_DURATION.observe(elapsed, view=view)
+        metrics.SERIALIZE_DURATION.observe(timings.serialize_time, view=view)
+
+    def server_timing(self, timings, total):
+        return ', '.join([
+            f'db;dur={timings.db_time * 1000:.2f};desc="{timings.db_queries} queries"',
+            f'tmdb;dur={sum(timings.tmdb_calls) * 1000:.2f};desc="{len(timings.tmdb_calls)} calls"',
+            f'serialize;dur={timings.serialize_time * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
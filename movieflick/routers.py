@@ -0,0 +1,51 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+REPLICA = 'replica'
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+@contextmanager
+def read_from_replica():
+    """
+    Send the reads made inside (a block, or a view when used as a decorator)
+    to the replica, if one is configured. Only for reads that can tolerate
+    replication lag: nothing written in the same request is guaranteed there
+    """
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Reads inside read_from_replica() go to the 'replica' database when
+    DATABASES has one; every write, and every other read, uses the primary
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            _use_replica.get()
+            and REPLICA in settings.DATABASES
+            and not connections['default'].in_atomic_block
+        ):
+            return REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        # Not None: Django would write an instance back to the database it was read from
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets the primary's schema through replication
+        return db != REPLICA
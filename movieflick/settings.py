@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 from decouple import config
 
+from movieflick.sqlite3 import sqlite_database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -31,6 +33,144 @@ ALLOWED_HOSTS = []
 # TMDB API Key
 TMDB_API_KEY = config('TMDB_API_KEY', default='')
 
+# TMDB response cache: 'local' (per process), 'django' (shared via CACHES) or 'none'
+TMDB_CACHE_BACKEND = config('TMDB_CACHE_BACKEND', default='local')
+TMDB_CACHE_MAX_ENTRIES = config('TMDB_CACHE_MAX_ENTRIES', default=512, cast=int)
+TMDB_CACHE_ALIAS = config('TMDB_CACHE_ALIAS', default='default')
+
+# TMDB HTTP client: pooled keep-alive connections with retries on 429/5xx
+TMDB_BASE_URL = config('TMDB_BASE_URL', default='https://api.themoviedb.org/3')
+TMDB_POOL_SIZE = config('TMDB_POOL_SIZE', default=10, cast=int)
+TMDB_CONNECT_TIMEOUT = config('TMDB_CONNECT_TIMEOUT', default=3.05, cast=float)
+TMDB_READ_TIMEOUT = config('TMDB_READ_TIMEOUT', default=10, cast=float)
+TMDB_MAX_RETRIES = config('TMDB_MAX_RETRIES', default=2, cast=int)
+TMDB_BACKOFF_FACTOR = config('TMDB_BACKOFF_FACTOR', default=0.3, cast=float)
+TMDB_BACKOFF_JITTER = config('TMDB_BACKOFF_JITTER', default=0.2, cast=float)
+TMDB_BACKOFF_MAX = config('TMDB_BACKOFF_MAX', default=5, cast=float)
+
+# Connections in the async client's pool (the async recommend views)
+TMDB_ASYNC_POOL_SIZE = config('TMDB_ASYNC_POOL_SIZE', default=100, cast=int)
+
+# TMDB circuit breaker: trips on failure rate or slow-call rate over the last
+# TMDB_BREAKER_WINDOW calls and fails fast for TMDB_BREAKER_COOLDOWN seconds
+TMDB_BREAKER_WINDOW = config('TMDB_BREAKER_WINDOW', default=20, cast=int)
+TMDB_BREAKER_MIN_CALLS = config('TMDB_BREAKER_MIN_CALLS', default=5, cast=int)
+TMDB_BREAKER_ERROR_RATE = config('TMDB_BREAKER_ERROR_RATE', default=0.5, cast=float)
+TMDB_BREAKER_SLOW_CALL = config('TMDB_BREAKER_SLOW_CALL', default=2.0, cast=float)
+TMDB_BREAKER_SLOW_RATE = config('TMDB_BREAKER_SLOW_RATE', default=0.5, cast=float)
+TMDB_BREAKER_COOLDOWN = config('TMDB_BREAKER_COOLDOWN', default=30.0, cast=float)
+
+# Last-known-good TMDB responses served while TMDB is down, refreshed in the background
+TMDB_STALE_TTL = config('TMDB_STALE_TTL', default=7 * 24 * 60 * 60, cast=int)
+TMDB_STALE_CACHE_ALIAS = config('TMDB_STALE_CACHE_ALIAS', default='default')
+TMDB_STALE_REVALIDATE_INTERVAL = config('TMDB_STALE_REVALIDATE_INTERVAL', default=10, cast=int)
+
+# Identical TMDB calls in flight share one fetch: within a process, and across
+# workers for up to TMDB_COALESCE_WAIT seconds (0 disables) through this cache.
+# Point it at a shared backend (Redis, Memcached, database) to span workers
+TMDB_COALESCE = config('TMDB_COALESCE', default=True, cast=bool)
+TMDB_SHARED_CACHE_ALIAS = config('TMDB_SHARED_CACHE_ALIAS', default='default')
+TMDB_COALESCE_WAIT = config('TMDB_COALESCE_WAIT', default=5.0, cast=float)
+
+# Outbound token bucket: TMDB_RATE_LIMIT calls per second (0 disables) with bursts
+# of TMDB_RATE_LIMIT_BURST, kept in 'cache' (TMDB_SHARED_CACHE_ALIAS), 'file'
+# (flock on TMDB_RATE_LIMIT_FILE, one host) or 'local' (per process).
+# Calls that would wait longer than TMDB_RATE_LIMIT_WAIT fail fast instead.
+# Rate plus burst stays under TMDB's ~50 requests per second per IP
+TMDB_RATE_LIMIT = config('TMDB_RATE_LIMIT', default=40.0, cast=float)
+TMDB_RATE_LIMIT_BURST = config('TMDB_RATE_LIMIT_BURST', default=10.0, cast=float)
+TMDB_RATE_LIMIT_BACKEND = config('TMDB_RATE_LIMIT_BACKEND', default='cache')
+TMDB_RATE_LIMIT_FILE = config('TMDB_RATE_LIMIT_FILE', default='')
+TMDB_RATE_LIMIT_WAIT = config('TMDB_RATE_LIMIT_WAIT', default=5.0, cast=float)
+
+# TMDB transport: 'live', 'record' (live + save responses) or 'replay' (offline from fixtures)
+TMDB_TRANSPORT = config('TMDB_TRANSPORT', default='live')
+TMDB_FIXTURE_DIR = config('TMDB_FIXTURE_DIR', default=str(BASE_DIR / 'tmdb_fixtures'))
+TMDB_FIXTURE_COMPRESSION = config('TMDB_FIXTURE_COMPRESSION', default='zlib')
+# Seconds added to each replayed response, or 'recorded' for the latency seen while recording
+TMDB_REPLAY_LATENCY = config('TMDB_REPLAY_LATENCY', default='0')
+
+# Query every genre mapped to a mood concurrently instead of only the first one
+TMDB_FANOUT_GENRES = config('TMDB_FANOUT_GENRES', default=False, cast=bool)
+TMDB_FANOUT_WORKERS = config('TMDB_FANOUT_WORKERS', default=8, cast=int)
+TMDB_FANOUT_DEADLINE = config('TMDB_FANOUT_DEADLINE', default=5.0, cast=float)
+
+# Raw TMDB payloads live in movies_moviepayload: 'zlib', 'zstd' (needs zstandard) or 'json'
+MOVIE_PAYLOAD_COMPRESSION = config('MOVIE_PAYLOAD_COMPRESSION', default='zlib')
+
+# Request metrics: fraction of requests instrumented, Server-Timing header,
+# and the bearer token required to scrape /metrics (without one, /metrics
+# is only served with DEBUG on)
+METRICS_SAMPLE_RATE = config('METRICS_SAMPLE_RATE', default=1.0, cast=float)
+METRICS_SERVER_TIMING = config('METRICS_SERVER_TIMING', default=True, cast=bool)
+METRICS_AUTH_TOKEN = config('METRICS_AUTH_TOKEN', default='')
+
+# Build movie list / history pages from .values() rows instead of model serializers
+FAST_SERIALIZERS = config('FAST_SERIALIZERS', default=False, cast=bool)
+
+# Mood catalog cache: per-process copy in front of the shared cache, and
+# the max-age sent to clients and proxies
+MOOD_CACHE_TIMEOUT = config('MOOD_CACHE_TIMEOUT', default=24 * 60 * 60, cast=int)
+MOOD_LOCAL_CACHE_TTL = config('MOOD_LOCAL_CACHE_TTL', default=30, cast=int)
+MOOD_CACHE_MAX_AGE = config('MOOD_CACHE_MAX_AGE', default=300, cast=int)
+
+# Local candidate pool: recommendations are served from the database and
+# TMDB only refills the pool in the background
+CANDIDATE_POOL_BACKGROUND_REFILL = config('CANDIDATE_POOL_BACKGROUND_REFILL', default=True, cast=bool)
+CANDIDATE_POOL_REFRESH_INTERVAL = config('CANDIDATE_POOL_REFRESH_INTERVAL', default=3600, cast=int)
+CANDIDATE_POOL_PAGES = config('CANDIDATE_POOL_PAGES', default=1, cast=int)
+CANDIDATE_POOL_SCAN_CHUNK = config('CANDIDATE_POOL_SCAN_CHUNK', default=50, cast=int)
+# Refill in the background once a user has fewer unseen candidates than this left
+CANDIDATE_POOL_LOW_WATER = config('CANDIDATE_POOL_LOW_WATER', default=10, cast=int)
+
+# Next recommendation batches per user and mood, precomputed by `manage.py precompute_worker`
+# for users who logged in within PRECOMPUTE_ACTIVE_DAYS; recommend falls back to the live path on a miss
+PRECOMPUTE_RECOMMENDATIONS = config('PRECOMPUTE_RECOMMENDATIONS', default=True, cast=bool)
+PRECOMPUTE_BATCH_SIZE = config('PRECOMPUTE_BATCH_SIZE', default=2, cast=int)
+PRECOMPUTE_ACTIVE_DAYS = config('PRECOMPUTE_ACTIVE_DAYS', default=14, cast=int)
+PRECOMPUTE_MAX_ATTEMPTS = config('PRECOMPUTE_MAX_ATTEMPTS', default=5, cast=int)
+PRECOMPUTE_RETRY_DELAY = config('PRECOMPUTE_RETRY_DELAY', default=30, cast=int)
+PRECOMPUTE_JOB_TIMEOUT = config('PRECOMPUTE_JOB_TIMEOUT', default=300, cast=int)
+
+# Rows per fetch and per written chunk in recommendation history exports
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Movies already recommended to a user are skipped. When no local movie is left,
+# a request fetches the first RECOMMEND_SYNC_PAGES discover pages in one concurrent
+# round; the precompute worker walks up to RECOMMEND_MAX_PAGES pages one at a time
+SEEN_SET_TIMEOUT = config('SEEN_SET_TIMEOUT', default=7 * 24 * 60 * 60, cast=int)
+RECOMMEND_SYNC_PAGES = config('RECOMMEND_SYNC_PAGES', default=2, cast=int)
+RECOMMEND_MAX_PAGES = config('RECOMMEND_MAX_PAGES', default=5, cast=int)
+
+# Signed API tokens issued at login: valid for API_TOKEN_TTL seconds, checked
+# against a revocation list in the API_TOKEN_CACHE_ALIAS cache. That cache must
+# be shared by every worker and must not evict entries early. The default is a
+# file cache under API_TOKEN_CACHE_LOCATION, shared by the workers on one host
+# without a database query; across hosts, set API_TOKEN_CACHE_BACKEND and
+# API_TOKEN_CACHE_LOCATION to a Redis or Memcached server
+API_TOKEN_TTL = config('API_TOKEN_TTL', default=60 * 60, cast=int)
+API_TOKEN_CACHE_ALIAS = config('API_TOKEN_CACHE_ALIAS', default='api-tokens')
+API_TOKEN_CACHE = {
+    'BACKEND': config('API_TOKEN_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+    'LOCATION': config('API_TOKEN_CACHE_LOCATION', default=str(BASE_DIR / '.cache' / 'api-tokens')),
+}
+if API_TOKEN_CACHE['BACKEND'] in (
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.db.DatabaseCache',
+):
+    # Never cull revocations before the tokens they cancel expire
+    API_TOKEN_CACHE['OPTIONS'] = {'MAX_ENTRIES': 10 ** 7}
+
+# 'default' is per process; API_TOKEN_CACHE_ALIAS is shared (see above)
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'api-tokens': API_TOKEN_CACHE,
+}
+
+# HTML views keep cookie sessions; cached_db reads them from the cache and
+# only falls back to the django_session table on a miss
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.cached_db')
+
 
 # Application definition
 
@@ -50,6 +190,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'movieflick.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,12 +224,31 @@ WSGI_APPLICATION = 'movieflick.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# DATABASE_PROFILE 'production' turns on WAL, synchronous=NORMAL, a busy timeout,
+# IMMEDIATE write transactions and persistent connections (movieflick.sqlite3).
+# With DATABASE_REPLICA_NAME set, history, list and detail reads go to that copy
+# of the database (kept in sync by replication, or `manage.py sync_sqlite_replica`)
+DATABASE_PROFILE = config('DATABASE_PROFILE', default='development')
+DATABASE_BUSY_TIMEOUT = config('DATABASE_BUSY_TIMEOUT', default=5.0, cast=float)
+DATABASE_CONN_MAX_AGE = config('DATABASE_CONN_MAX_AGE', default=600, cast=int)
+DATABASE_REPLICA_NAME = config('DATABASE_REPLICA_NAME', default='')
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': sqlite_database(
+        config('DATABASE_NAME', default=str(BASE_DIR / 'db.sqlite3')), DATABASE_PROFILE,
+        busy_timeout=DATABASE_BUSY_TIMEOUT, conn_max_age=DATABASE_CONN_MAX_AGE,
+    ),
 }
+if DATABASE_REPLICA_NAME:
+    DATABASES['replica'] = {
+        **sqlite_database(
+            DATABASE_REPLICA_NAME, DATABASE_PROFILE,
+            busy_timeout=DATABASE_BUSY_TIMEOUT, conn_max_age=DATABASE_CONN_MAX_AGE,
+        ),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['movieflick.routers.PrimaryReplicaRouter']
 
 
 # Password validation
@@ -136,11 +296,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'accounts.authentication.SignedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'movieflick.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
 }
@@ -0,0 +1,47 @@
+"""
+SQLite database profiles and file copies
+Imported by settings, so only the backend module (base) may import Django
+"""
+import sqlite3
+
+PROFILES = ('development', 'production')
+
+# Run on every new connection of the production profile. WAL lets readers
+# work alongside the single writer; synchronous=NORMAL is durable in WAL
+# mode except for the last transactions on a power loss
+PRODUCTION_INIT_COMMAND = 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL'
+
+
+def sqlite_database(name, profile='development', busy_timeout=5.0, conn_max_age=600):
+    """
+    DATABASES entry for the SQLite file at name
+    development: Django's stock backend, one connection per request
+    production: WAL, synchronous=NORMAL, writers wait up to busy_timeout
+    seconds for the lock and take it when their transaction begins, and
+    connections are kept for conn_max_age seconds
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown database profile {profile!r}; expected one of {', '.join(PROFILES)}")
+    if profile == 'development':
+        return {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name}
+    return {
+        'ENGINE': 'movieflick.sqlite3',
+        'NAME': name,
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': busy_timeout,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': PRODUCTION_INIT_COMMAND,
+        },
+    }
+
+
+def copy_sqlite_database(source, target):
+    """Online copy of one SQLite file onto another with the backup API; safe while source is being written"""
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
@@ -0,0 +1,43 @@
+"""
+Django's SQLite backend plus the two connection options Django 5.1 adds
+OPTIONS['init_command'] is run on every new connection (e.g. pragmas) and
+OPTIONS['transaction_mode'] (DEFERRED, IMMEDIATE or EXCLUSIVE) is used to
+BEGIN transactions. A deferred transaction that reads, then writes, fails
+at once with "database is locked" when another connection holds the write
+lock; an IMMEDIATE one takes the lock up front and waits out the timeout
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    @property
+    def transaction_mode(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"settings.DATABASES['{self.alias}']['OPTIONS']['transaction_mode'] must be one of "
+                f"{', '.join(TRANSACTION_MODES)}, not {mode!r}"
+            )
+        return mode and mode.upper()
+
+    def get_connection_params(self):
+        self.transaction_mode  # Fail on a bad setting before connecting
+        kwargs = super().get_connection_params()
+        kwargs.pop('init_command', None)
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for statement in self.settings_dict['OPTIONS'].get('init_command', '').split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.transaction_mode
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
@@ -6,6 +6,7 @@ from . import views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.home_view, name='home'),
+    path('metrics', views.metrics_view, name='metrics'),
     # API endpoints
     path('api/auth/', include('accounts.urls_api')),
     path('api/moods/', include('moods.urls')),
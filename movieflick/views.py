@@ -1,5 +1,10 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
 from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from . import metrics
 
 def home_view(request):
     """Home view - redirects to appropriate page based on authentication"""
@@ -8,3 +13,18 @@ def home_view(request):
     else:
         return redirect('accounts:login')
 
+
+@require_GET
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint for the request metrics of this process
+    Needs METRICS_AUTH_TOKEN as a bearer token; without one configured the
+    endpoint only exists with DEBUG on
+    """
+    token = getattr(settings, 'METRICS_AUTH_TOKEN', '')
+    if not token:
+        if not settings.DEBUG:
+            raise Http404
+    elif not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render_metrics(), content_type=metrics.CONTENT_TYPE)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Movie, Recommendation
+from .models import Movie, MoodCandidate, PrecomputeJob, Recommendation
 
 
 @admin.register(Movie)
@@ -16,3 +16,19 @@ class RecommendationAdmin(admin.ModelAdmin):
     list_filter = ['mood', 'viewed', 'recommended_at']
     search_fields = ['user__username', 'movie__title']
     readonly_fields = ['recommended_at']
+
+
+@admin.register(MoodCandidate)
+class MoodCandidateAdmin(admin.ModelAdmin):
+    list_display = ['mood', 'rank', 'movie', 'popularity', 'refreshed_at']
+    list_filter = ['mood']
+    search_fields = ['movie__title']
+    raw_id_fields = ['movie']
+
+
+@admin.register(PrecomputeJob)
+class PrecomputeJobAdmin(admin.ModelAdmin):
+    list_display = ['user', 'mood', 'status', 'attempts', 'run_after', 'claimed_by']
+    list_filter = ['status', 'mood']
+    search_fields = ['user__username', 'last_error']
+    raw_id_fields = ['user']
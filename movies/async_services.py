@@ -0,0 +1,271 @@
+"""
+Async recommend path for ASGI deployments
+TMDB calls go through a shared httpx.AsyncClient, so a request waiting on
+TMDB holds no worker thread. Caches, the circuit breaker, the stale store
+and the transport mode are the ones TMDBService uses
+"""
+import asyncio
+import random
+import weakref
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .services import (
+    LiveTransport,
+    RecommendationService,
+    TMDBService,
+    TMDBUnavailable,
+    WorkerFlight,
+)
+from .throttling import AsyncSingleFlight
+
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# One client (and connection pool) per event loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def build_async_client():
+    """Build a keep-alive httpx client sized for many in-flight TMDB calls"""
+    pool_size = getattr(settings, 'TMDB_ASYNC_POOL_SIZE', 100)
+    connect_timeout, read_timeout = TMDBService._get_timeout()
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=read_timeout),
+        limits=limits,
+        transport=httpx.AsyncHTTPTransport(limits=limits, retries=getattr(settings, 'TMDB_MAX_RETRIES', 2)),
+        headers={'Accept': 'application/json'},
+    )
+
+
+def get_async_client():
+    """Get the shared TMDB client of the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = build_async_client()
+    return client
+
+
+async def close_async_client():
+    """Close the running loop's client so the next call rebuilds it from settings"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+class AsyncLiveTransport:
+    """
+    Calls the TMDB API over the shared async client
+    Retries 429/5xx like the sync session: jittered exponential backoff,
+    honoring Retry-After, both capped at TMDB_BACKOFF_MAX
+    Failures are raised as requests exceptions, like every other transport
+    """
+
+    async def get(self, endpoint, params):
+        url = f"{TMDBService._get_base_url()}{endpoint}"
+        params = {**params, 'api_key': TMDBService._get_api_key()}
+        retries = getattr(settings, 'TMDB_MAX_RETRIES', 2)
+
+        for attempt in range(retries + 1):
+            try:
+                response = await get_async_client().get(url, params=params)
+            except httpx.TimeoutException as e:
+                raise requests.exceptions.Timeout(str(e)) from e
+            except httpx.HTTPError as e:
+                raise requests.exceptions.ConnectionError(str(e)) from e
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                break
+            await asyncio.sleep(self.backoff(attempt, response.headers.get('Retry-After')))
+
+        if response.is_error:
+            raise requests.exceptions.HTTPError(f"{response.status_code} Error for url: {endpoint}")
+        return response.json()
+
+    def backoff(self, attempt, retry_after=None):
+        backoff_max = getattr(settings, 'TMDB_BACKOFF_MAX', 5)
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), backoff_max)
+            except ValueError:
+                pass
+        delay = getattr(settings, 'TMDB_BACKOFF_FACTOR', 0.3) * (2 ** attempt)
+        delay += random.uniform(0, getattr(settings, 'TMDB_BACKOFF_JITTER', 0.2))
+        return min(delay, backoff_max)
+
+
+class ThreadedTransport:
+    """Runs a sync transport (record, replay or a test double) off the event loop"""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def get(self, endpoint, params):
+        return await sync_to_async(self.transport.get, thread_sensitive=False)(endpoint, params)
+
+
+def get_async_transport():
+    """Async counterpart of TMDBService.get_transport()"""
+    transport = TMDBService.get_transport()
+    if isinstance(transport, LiveTransport):
+        return AsyncLiveTransport()
+    return ThreadedTransport(transport)
+
+
+async def cache_get(cache, key):
+    aget = getattr(cache, 'aget', None)
+    return await aget(key) if aget else cache.get(key)
+
+
+async def cache_set(cache, key, value, ttl):
+    aset = getattr(cache, 'aset', None)
+    if aset:
+        await aset(key, value, ttl)
+    else:
+        cache.set(key, value, ttl)
+
+
+class AsyncTMDBService:
+    """
+    Async versions of the TMDBService discover calls
+    Request building, caching policy, breaker and rate limit decisions and
+    response handling are TMDBService's own helpers; only the waits and the
+    cache and transport calls are awaited here
+    """
+
+    _single_flight = AsyncSingleFlight()
+
+    @classmethod
+    async def make_request(cls, endpoint, params=None, use_cache=True):
+        """Async TMDBService._make_request: same caching, breaker and stale fallback"""
+        params, cache_key, cache, ttl = TMDBService._prepare_request(endpoint, params, use_cache)
+        if cache is not None:
+            cached = await cache_get(cache, cache_key)
+            if cached is not None:
+                return cached
+
+        stale_key = TMDBService.STALE_KEY.format(key=cache_key)
+        if not TMDBService.get_circuit_breaker().is_closed:
+            stale = await cache_get(TMDBService.get_stale_store(), stale_key)
+            if stale is not None:
+                await sync_to_async(TMDBService.schedule_revalidate, thread_sensitive=False)(endpoint, params)
+                return stale
+            TMDBService._claim_trial()
+
+        try:
+            data = await cls._fetch_coalesced(endpoint, params, cache_key)
+        except TMDBUnavailable:
+            stale = await cache_get(TMDBService.get_stale_store(), stale_key)
+            if stale is None:
+                raise
+            return stale
+
+        if cache is not None:
+            await cache_set(cache, cache_key, data, ttl)
+        return data
+
+    @classmethod
+    async def _fetch_coalesced(cls, endpoint, params, cache_key):
+        """Async TMDBService._fetch_coalesced; in-process sharing is per event loop"""
+        if not getattr(settings, 'TMDB_COALESCE', True):
+            return await cls._fetch(endpoint, params, cache_key)
+        return await cls._single_flight.do(cache_key, cls._fetch_across_workers, endpoint, params, cache_key)
+
+    @classmethod
+    async def _fetch_across_workers(cls, endpoint, params, cache_key):
+        """Async TMDBService._fetch_across_workers"""
+        flight = WorkerFlight.for_request(cache_key)
+        if flight is None:
+            return await cls._fetch(endpoint, params, cache_key)
+
+        if not await flight.cache.aadd(flight.lock_key, True, flight.timeout):
+            while True:
+                outcome = flight.outcome(await flight.cache.aget_many(flight.keys))
+                if outcome is WorkerFlight.FETCH:
+                    return await cls._fetch(endpoint, params, cache_key)
+                if outcome is not WorkerFlight.WAIT:
+                    return outcome
+                await asyncio.sleep(flight.poll_interval)
+
+        try:
+            data = await cls._fetch(endpoint, params, cache_key)
+            await flight.cache.aset(flight.result_key, data, flight.timeout)
+            return data
+        finally:
+            await flight.cache.adelete(flight.lock_key)
+
+    @classmethod
+    async def throttle(cls):
+        """Async TMDBService.throttle: the token is taken off the loop and the wait holds no thread"""
+        if TMDBService.get_rate_limiter() is None:
+            return
+        delay = await sync_to_async(TMDBService.reserve_token, thread_sensitive=False)()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @classmethod
+    async def _fetch(cls, endpoint, params, cache_key):
+        await cls.throttle()
+        with TMDBService._tracked_call():
+            data = await get_async_transport().get(endpoint, params)
+        await cache_set(
+            TMDBService.get_stale_store(), TMDBService.STALE_KEY.format(key=cache_key), data,
+            TMDBService.get_stale_ttl(),
+        )
+        return data
+
+    @classmethod
+    async def discover_by_genre(cls, genre_id, page=1):
+        """Fetch one page of discover results for a single genre"""
+        response_data = await cls.make_request('/discover/movie', TMDBService.discover_params(genre_id, page))
+        return response_data.get('results', [])
+
+    @classmethod
+    async def fetch_pages_by_mood(cls, mood_name, pages, fan_out=None):
+        """Async TMDBService.fetch_pages_by_mood"""
+        return await cls._fetch_genres_concurrently(TMDBService.genres_to_query(mood_name, fan_out), pages=pages)
+
+    @classmethod
+    async def _fetch_genres_concurrently(cls, genre_ids, page=1, pages=None):
+        """Query each genre (on each of `pages`) concurrently under one deadline (TMDB_FANOUT_DEADLINE)"""
+        deadline = getattr(settings, 'TMDB_FANOUT_DEADLINE', 5.0)
+        pages = list(pages or [page])
+        tasks = {
+            asyncio.ensure_future(cls.discover_by_genre(genre_id, page)): (page, genre_id)
+            for page in pages
+            for genre_id in genre_ids
+        }
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        return TMDBService.merge_fan_out({tasks[task]: task for task in done}, genre_ids, pages, deadline)
+
+
+class AsyncRecommendationService:
+    """Async RecommendationService.recommend for ASGI views"""
+
+    @classmethod
+    async def recommend(cls, user, mood, count=2):
+        """
+        Same picks and writes as RecommendationService.recommend; TMDB is
+        awaited without holding a thread
+        The async ORM can't open transactions, so each transactional step
+        (serve_local, serve_fetched) runs in one thread hop; the read in
+        between uses the async ORM
+        """
+        seen, movies, recommendations = await sync_to_async(RecommendationService.serve_local)(user, mood, count)
+        if not movies:
+            pages = range(1, getattr(settings, 'RECOMMEND_SYNC_PAGES', 2) + 1)
+            fetched = await AsyncTMDBService.fetch_pages_by_mood(mood.name, pages)
+            movie_ids = {
+                tmdb_id: pk async for tmdb_id, pk in RecommendationService.stored_movie_ids(fetched)
+            }
+            tmdb_movies_data = RecommendationService.select_unseen(fetched, movie_ids, count, seen)
+            movies, recommendations = await sync_to_async(RecommendationService.serve_fetched)(
+                user, mood, seen, tmdb_movies_data
+            )
+        return movies, recommendations
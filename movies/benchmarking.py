@@ -0,0 +1,407 @@
+"""
+Helpers shared by the benchmark management commands
+Includes a local stub of the TMDB discover API so benchmarks never touch the network
+"""
+import json
+import math
+import os
+import random
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, WSGIServer
+from django.db import connection, connections
+
+
+RESULTS_PER_PAGE = 20
+
+
+def fake_discover_results(genre_ids, page=1):
+    """Build a deterministic page of discover results for the given genres"""
+    results = []
+    for genre_id in genre_ids:
+        for index in range(RESULTS_PER_PAGE):
+            position = (page - 1) * RESULTS_PER_PAGE + index
+            tmdb_id = genre_id * 100000 + position + 1
+            results.append({
+                'id': tmdb_id,
+                'title': f'Stub Movie {tmdb_id}',
+                'overview': f'Stub overview for genre {genre_id}, position {position}.',
+                'release_date': f'{2000 + position % 25}-01-{1 + position % 28:02d}',
+                'poster_path': f'/poster{tmdb_id}.jpg',
+                'backdrop_path': f'/backdrop{tmdb_id}.jpg',
+                'vote_average': round(5 + (position % 50) / 10, 1),
+                'popularity': round(1000.0 / (position + 1), 3),
+                'genre_ids': [genre_id],
+            })
+    results.sort(key=lambda movie: movie['popularity'], reverse=True)
+    return results[:RESULTS_PER_PAGE]
+
+
+class StubTMDBHandler(BaseHTTPRequestHandler):
+    """Serves /discover/movie with configurable latency, error rate and rate limit"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        with server.stats_lock:
+            server.request_count += 1
+            throttled = False
+            if server.rate_limit:
+                # Fixed one-second windows, like TMDB's per-IP limit
+                window = int(time.monotonic())
+                if window != server.window:
+                    server.window, server.window_count = window, 0
+                server.window_count += 1
+                throttled = server.window_count > server.rate_limit
+                server.throttled_count += throttled
+        if throttled:
+            self._send_json(429, {'status_message': 'Stub rate limit exceeded'}, {'Retry-After': '1'})
+            return
+        if server.latency:
+            time.sleep(server.latency)
+
+        if server.error_rate and random.random() < server.error_rate:
+            self._send_json(503, {'status_message': 'Stub error'}, {'Retry-After': '0'})
+            return
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path.endswith('/discover/movie'):
+            genres = query.get('with_genres', ['18'])[0]
+            genre_ids = [int(genre) for genre in genres.replace(',', '|').split('|') if genre]
+            page = max(1, int(query.get('page', ['1'])[0]))
+            self._send_json(200, {
+                'page': page,
+                'results': fake_discover_results(genre_ids, page),
+                'total_pages': 500,
+                'total_results': 500 * RESULTS_PER_PAGE,
+            })
+        else:
+            self._send_json(404, {'status_message': 'Not found'})
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubTMDBServer:
+    """
+    Local TMDB stub running in a background thread
+    Use as a context manager; base_url points at the running server
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, rate_limit=0, host='127.0.0.1', port=0):
+        self.httpd = ThreadingHTTPServer((host, port), StubTMDBHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.error_rate = error_rate
+        self.httpd.rate_limit = rate_limit
+        self.httpd.window = None
+        self.httpd.window_count = 0
+        self.httpd.request_count = 0
+        self.httpd.throttled_count = 0
+        self.httpd.stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/3'
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    @property
+    def throttled_count(self):
+        """Requests answered with 429 by the stub's rate limit"""
+        return self.httpd.throttled_count
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class QueryCountingApp:
+    """
+    WSGI wrapper that counts database queries per request, grouped by the
+    flow named in the X-Bench-Flow request header
+    """
+    FLOW_HEADER = 'HTTP_X_BENCH_FLOW'
+
+    def __init__(self, application):
+        self.application = application
+        self.lock = threading.Lock()
+        self.queries = defaultdict(int)
+        self.requests = Counter()
+
+    def __call__(self, environ, start_response):
+        flow = environ.get(self.FLOW_HEADER, 'other')
+        count = 0
+
+        def counter(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for db_connection in connections.all():
+                stack.enter_context(db_connection.execute_wrapper(counter))
+            # Consume the body inside the wrappers so streamed queries count too
+            body = b''.join(self.application(environ, start_response))
+
+        with self.lock:
+            self.queries[flow] += count
+            self.requests[flow] += 1
+        return [body]
+
+    def queries_per_request(self, flow):
+        with self.lock:
+            if not self.requests[flow]:
+                return 0.0
+            return self.queries[flow] / self.requests[flow]
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    # Keep-alive responses otherwise stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LiveDjangoServer:
+    """
+    The project's WSGI application served by a threaded server in a
+    background thread, with per-flow query counting
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.app = QueryCountingApp(WSGIHandler())
+        self.httpd = ThreadedWSGIServer((host, port), QuietWSGIRequestHandler, allow_reuse_address=False)
+        self.httpd.set_app(self.app)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class InFlightGauge:
+    """Counts requests being served right now and the peak reached"""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def exit(self):
+        with self._lock:
+            self.current -= 1
+
+    def wrap_wsgi(self, application):
+        def wrapped(environ, start_response):
+            self.enter()
+            try:
+                return [b''.join(application(environ, start_response))]
+            finally:
+                self.exit()
+        return wrapped
+
+    def wrap_asgi(self, application):
+        async def wrapped(scope, receive, send):
+            if scope['type'] != 'http':
+                return await application(scope, receive, send)
+            self.enter()
+            try:
+                return await application(scope, receive, send)
+            finally:
+                self.exit()
+        return wrapped
+
+
+class PooledWSGIServer(WSGIServer):
+    """
+    WSGI server with a fixed pool of worker threads, like a gthread worker
+    Responses close the connection, so a thread is only held per request
+    """
+    request_queue_size = 1024
+
+    def __init__(self, *args, max_threads=8, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='wsgi-worker')
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            connections.close_all()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LiveWSGIServer:
+    """The project's WSGI application on a PooledWSGIServer in a background thread"""
+
+    def __init__(self, application, max_threads=8, host='127.0.0.1', port=0):
+        self.httpd = PooledWSGIServer((host, port), QuietWSGIRequestHandler, max_threads=max_threads)
+        self.httpd.set_app(application)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class LiveASGIServer:
+    """An ASGI application on a single uvicorn worker in a background thread"""
+
+    def __init__(self, application, host='127.0.0.1', port=0):
+        import uvicorn
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, port))
+        self.server = uvicorn.Server(uvicorn.Config(
+            application, lifespan='off', log_level='warning', access_log=False, backlog=2048,
+        ))
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.socket.getsockname()[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.run, kwargs={'sockets': [self.socket]}, daemon=True)
+        self._thread.start()
+        while not self.server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError('ASGI server failed to start')
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self._thread.join(timeout=10)
+        self.socket.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+@contextmanager
+def throwaway_database():
+    """
+    Create and migrate a test database for the duration of a benchmark
+    SQLite gets a temporary file rather than the shared in-memory default,
+    so server threads open real connections
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if connection.vendor == 'sqlite':
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmpdir, 'benchmark.sqlite3')
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize_latencies(samples):
+    """Summarize latencies (seconds) as milliseconds"""
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
@@ -0,0 +1,154 @@
+"""
+Streaming exports of recommendation history as NDJSON or CSV
+Rows are read with .iterator(chunk_size=EXPORT_CHUNK_SIZE) and encoded (and
+optionally gzipped) one chunk at a time, so memory stays flat however long
+the history is
+"""
+import csv
+import io
+import json
+import zlib
+
+from django.conf import settings
+from rest_framework import renderers
+
+from .models import Recommendation
+
+COLUMNS = (
+    'id', 'recommended_at', 'viewed', 'user_rating', 'user_id', 'username',
+    'mood_id', 'mood', 'movie_id', 'tmdb_id', 'title', 'release_date', 'rating',
+)
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Lets content negotiation accept application/x-ndjson on the export
+    view, which streams its rows itself; only error payloads (one line) are
+    rendered here
+    """
+    media_type = CONTENT_TYPES['ndjson']
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return (json.dumps(data, separators=(',', ':')) + '\n').encode()
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """text/csv counterpart of NDJSONRenderer; an error payload is a header row and one row of messages"""
+    media_type = CONTENT_TYPES['csv']
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(data)
+        writer.writerow(['; '.join(value) if isinstance(value, list) else value for value in data.values()])
+        return buffer.getvalue().encode()
+
+
+def export_queryset(queryset=None):
+    """Recommendations with their user, mood and movie joined, oldest first, loading only the exported columns"""
+    queryset = Recommendation.objects.all() if queryset is None else queryset
+    return (
+        queryset
+        .select_related('user', 'mood', 'movie')
+        .only(
+            'recommended_at', 'viewed', 'user_rating', 'user__username', 'mood__name',
+            'movie__tmdb_id', 'movie__title', 'movie__release_date', 'movie__rating',
+        )
+        .order_by('recommended_at', 'id')
+    )
+
+
+def export_row(recommendation):
+    movie = recommendation.movie
+    return (
+        recommendation.pk,
+        recommendation.recommended_at.isoformat(),
+        recommendation.viewed,
+        recommendation.user_rating,
+        recommendation.user_id,
+        recommendation.user.username,
+        recommendation.mood_id,
+        recommendation.mood.name,
+        movie.pk,
+        movie.tmdb_id,
+        movie.title,
+        movie.release_date.isoformat() if movie.release_date else None,
+        movie.rating,
+    )
+
+
+class Exporter:
+    """
+    Encodes recommendations as NDJSON or CSV, in chunks of chunk_size rows
+    stream() and astream() yield bytes for StreamingHttpResponse or a file
+    """
+
+    def __init__(self, export_format, compress=False, chunk_size=None):
+        if export_format not in CONTENT_TYPES:
+            raise ValueError(f"Unknown export format {export_format!r}; expected one of {', '.join(CONTENT_TYPES)}")
+        self.format = export_format
+        self.chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+        self.rows = 0
+        self._pending = 0
+        self._buffer = io.StringIO()
+        self._csv = csv.writer(self._buffer, lineterminator='\n') if export_format == 'csv' else None
+        # wbits 16 + MAX_WBITS: gzip framing, so the output is a valid .gz file
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+        if self._csv is not None:
+            self._csv.writerow(COLUMNS)
+
+    @property
+    def content_type(self):
+        return CONTENT_TYPES[self.format]
+
+    def write(self, recommendation):
+        """Buffer one row; returns the encoded chunk when one is complete, else b''"""
+        row = export_row(recommendation)
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._buffer.write(json.dumps(dict(zip(COLUMNS, row)), separators=(',', ':')))
+            self._buffer.write('\n')
+        self.rows += 1
+        self._pending += 1
+        return self._drain() if self._pending >= self.chunk_size else b''
+
+    def close(self):
+        """The rest of the output"""
+        data = self._drain()
+        if self._compressor is not None:
+            data += self._compressor.flush()
+        return data
+
+    def _drain(self):
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._pending = 0
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        return data
+
+    def stream(self, queryset):
+        for recommendation in queryset.iterator(chunk_size=self.chunk_size):
+            data = self.write(recommendation)
+            if data:
+                yield data
+        yield self.close()
+
+    async def astream(self, queryset):
+        # Under ASGI a synchronous iterator would be read into memory whole
+        async for recommendation in queryset.aiterator(chunk_size=self.chunk_size):
+            data = self.write(recommendation)
+            if data:
+                yield data
+        yield self.close()
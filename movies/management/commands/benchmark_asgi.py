@@ -0,0 +1,202 @@
+import asyncio
+import importlib.util
+import json
+import time
+from collections import Counter
+from unittest import mock
+
+import httpx
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils.crypto import get_random_string
+
+from moods.models import Mood
+from movies.benchmarking import (
+    InFlightGauge,
+    LiveASGIServer,
+    LiveWSGIServer,
+    StubTMDBServer,
+    summarize_latencies,
+    throwaway_database,
+)
+from movies.seen import SeenSet
+from movies.services import RecommendationService, TMDBService, reset_http_session
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the sync recommend endpoint on a fixed pool of WSGI threads with the async one on a '
+        'single ASGI worker, with many concurrent users waiting on a slow local TMDB stub'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Concurrent virtual users')
+        parser.add_argument('--iterations', type=int, default=3, help='Recommend calls per user')
+        parser.add_argument('--latency', type=float, default=0.2, help='TMDB stub latency in seconds')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads')
+        parser.add_argument('--stub-rate-limit', type=int, default=0,
+                            help='Requests per second the TMDB stub serves before answering 429 (0: unlimited)')
+        parser.add_argument('--rate-limit', type=float,
+                            help='Outbound TMDB calls per second (TMDB_RATE_LIMIT; 0 disables, default from settings)')
+        parser.add_argument('--rate-limit-burst', type=float,
+                            help='Token bucket size (TMDB_RATE_LIMIT_BURST, default from settings)')
+        parser.add_argument('--no-coalesce', action='store_true',
+                            help='Send every TMDB call out even when an identical one is in flight (TMDB_COALESCE=False)')
+        parser.add_argument('--local-first', action='store_true',
+                            help='Let the candidate pool and catalog answer instead of forcing a TMDB call per request')
+        parser.add_argument('--output', help='Write the results as JSON to this path')
+
+    def handle(self, *args, **options):
+        if importlib.util.find_spec('uvicorn') is None:
+            raise CommandError('benchmark_asgi needs an ASGI server: pip install uvicorn')
+
+        with throwaway_database():
+            results = self.run(options)
+
+        for mode, stats in results['modes'].items():
+            self.stdout.write(
+                f"{mode:<5} n={stats['count']} errors={stats['errors']} rps={stats['rps']:.1f} "
+                f"p50={stats['p50_ms']:.0f}ms p95={stats['p95_ms']:.0f}ms p99={stats['p99_ms']:.0f}ms "
+                f"peak in-flight={stats['peak_in_flight']} TMDB calls={stats['tmdb_requests']} "
+                f"(throttled {stats['tmdb_throttled']}) statuses={stats['statuses']}"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def run(self, options):
+        mood_ids = list(Mood.objects.filter(is_active=True).values_list('id', flat=True))
+        users = self.create_sessions(options['users'])
+        connection.close()
+
+        patches = []
+        if not options['local_first']:
+            # Every recommendation has to go to TMDB, the path the async view is for
+            patches.append(mock.patch.object(
+                RecommendationService, 'pick_local',
+                side_effect=lambda user, mood, count: (SeenSet.for_user(user), []),
+            ))
+
+        limits = {}
+        if options['rate_limit'] is not None:
+            limits['TMDB_RATE_LIMIT'] = options['rate_limit']
+        if options['rate_limit_burst'] is not None:
+            limits['TMDB_RATE_LIMIT_BURST'] = options['rate_limit_burst']
+        if options['no_coalesce']:
+            limits['TMDB_COALESCE'] = False
+
+        modes = {}
+        with StubTMDBServer(latency=options['latency'], rate_limit=options['stub_rate_limit']) as stub, \
+                override_settings(
+                    ALLOWED_HOSTS=['127.0.0.1', 'localhost'],
+                    TMDB_BASE_URL=stub.base_url,
+                    TMDB_API_KEY='bench',
+                    TMDB_CACHE_BACKEND='none',
+                    CANDIDATE_POOL_BACKGROUND_REFILL=False,
+                    METRICS_SAMPLE_RATE=0,
+                    **limits,
+                ):
+            for patch in patches:
+                patch.start()
+            try:
+                TMDBService.set_response_cache(None)
+                TMDBService.set_transport(None)
+                TMDBService.set_circuit_breaker(None)
+                TMDBService.set_rate_limiter(None)
+                reset_http_session()
+
+                gauge = InFlightGauge()
+                app = gauge.wrap_wsgi(WSGIHandler())
+                with LiveWSGIServer(app, max_threads=options['threads']) as server:
+                    modes['wsgi'] = self.drive(server.base_url, '/api/movies/recommend/', users, mood_ids, options)
+                modes['wsgi']['peak_in_flight'] = gauge.peak
+                modes['wsgi'].update(self.tmdb_counts(stub))
+
+                TMDBService.set_circuit_breaker(None)
+                TMDBService.set_rate_limiter(None)
+                gauge = InFlightGauge()
+                app = gauge.wrap_asgi(get_asgi_application())
+                with LiveASGIServer(app) as server:
+                    modes['asgi'] = self.drive(server.base_url, '/api/movies/recommend/async/', users, mood_ids, options)
+                modes['asgi']['peak_in_flight'] = gauge.peak
+                modes['asgi'].update(self.tmdb_counts(stub, since=modes['wsgi']))
+            finally:
+                for patch in patches:
+                    patch.stop()
+                TMDBService.set_response_cache(None)
+                TMDBService.set_transport(None)
+                TMDBService.set_circuit_breaker(None)
+                TMDBService.set_rate_limiter(None)
+                reset_http_session()
+
+        return {
+            'database': connection.vendor,
+            'config': {
+                key: options[key]
+                for key in ('users', 'iterations', 'latency', 'threads', 'local_first', 'stub_rate_limit',
+                            'rate_limit', 'rate_limit_burst', 'no_coalesce')
+            },
+            'modes': modes,
+        }
+
+    def tmdb_counts(self, stub, since=None):
+        """Stub requests and 429s so far, minus the ones of an earlier mode"""
+        since = since or {}
+        return {
+            'tmdb_requests': stub.request_count - since.get('tmdb_requests', 0),
+            'tmdb_throttled': stub.throttled_count - since.get('tmdb_throttled', 0),
+        }
+
+    def create_sessions(self, count):
+        """Logged-in session and CSRF cookies per user, without paying for password hashing"""
+        users = []
+        for index in range(count):
+            user = User.objects.create_user(username=f'asgi-bench-{index}')
+            client = Client()
+            client.force_login(user)
+            csrf_token = get_random_string(32)
+            users.append({
+                'Cookie': f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}; "
+                          f"{settings.CSRF_COOKIE_NAME}={csrf_token}",
+                'X-CSRFToken': csrf_token,
+            })
+        return users
+
+    def drive(self, base_url, path, users, mood_ids, options):
+        return asyncio.run(self.drive_async(base_url + path, users, mood_ids, options))
+
+    async def drive_async(self, url, users, mood_ids, options):
+        samples = []
+        statuses = Counter()
+        limits = httpx.Limits(max_connections=len(users), max_keepalive_connections=len(users))
+
+        async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+            async def virtual_user(index, headers):
+                for iteration in range(options['iterations']):
+                    mood_id = mood_ids[(index + iteration) % len(mood_ids)]
+                    start = time.perf_counter()
+                    try:
+                        response = await client.post(url, json={'mood_id': mood_id}, headers=headers)
+                        statuses[str(response.status_code)] += 1
+                    except httpx.HTTPError:
+                        statuses['error'] += 1
+                    samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(virtual_user(index, headers) for index, headers in enumerate(users)))
+            wall = time.perf_counter() - start
+
+        return {
+            **summarize_latencies(samples),
+            'wall_seconds': round(wall, 3),
+            'rps': round(len(samples) / wall, 2),
+            'errors': sum(count for status, count in statuses.items() if status != '200'),
+            'statuses': dict(statuses),
+        }
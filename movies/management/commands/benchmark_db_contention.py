@@ -0,0 +1,246 @@
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+
+from movieflick.routers import REPLICA, read_from_replica
+from movieflick.sqlite3 import PROFILES, copy_sqlite_database, sqlite_database
+from moods.models import Mood
+from movies.benchmarking import fake_discover_results, summarize_latencies, throwaway_database
+from movies.models import Recommendation
+from movies.services import RecommendationService
+
+
+class Command(BaseCommand):
+    help = (
+        'Run recommend-style write transactions from several processes at once, with history readers '
+        'alongside, against a throwaway SQLite file under each database profile; report throughput, '
+        'latency and "database is locked" errors'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help='Writer processes')
+        parser.add_argument('--readers', type=int, default=2, help='History reader processes')
+        parser.add_argument('--transactions', type=int, default=100, help='Write transactions per writer')
+        parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES),
+                            help='Database profiles to compare')
+        parser.add_argument('--busy-timeout', type=float, help='Seconds a connection waits for a lock '
+                            '(default DATABASE_BUSY_TIMEOUT; the development profile uses sqlite3\'s 5s)')
+        parser.add_argument('--replica', action='store_true',
+                            help='Readers go through the replica router to a second SQLite file, '
+                                 'copied from the primary every --replica-sync seconds')
+        parser.add_argument('--replica-sync', type=float, default=0.5, help='Seconds between replica copies')
+        parser.add_argument('--output', help='Write the results as JSON to this path')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('benchmark_db_contention measures SQLite locking; the default database must be SQLite')
+        if options['writers'] < 1 or options['transactions'] < 1:
+            raise CommandError('--writers and --transactions must be positive')
+        if options['busy_timeout'] is None:
+            options['busy_timeout'] = getattr(settings, 'DATABASE_BUSY_TIMEOUT', 5.0)
+
+        with throwaway_database():
+            try:
+                results = self.run(options)
+            finally:
+                # Nothing may hold the throwaway file open while it's destroyed
+                connections.close_all()
+
+        for profile, stats in results['profiles'].items():
+            writes, reads = stats['writes'], stats['reads']
+            self.stdout.write(
+                f"{profile:<12} writes: {writes['tps']:.1f}/s p50={writes['p50_ms']:.1f}ms "
+                f"p99={writes['p99_ms']:.1f}ms locked={writes['errors'].get('locked', 0)} "
+                f"other={writes['errors'].get('other', 0)} "
+                f"| reads: {reads['rps']:.1f}/s p50={reads['p50_ms']:.1f}ms p99={reads['p99_ms']:.1f}ms "
+                f"locked={reads['errors'].get('locked', 0)} other={reads['errors'].get('other', 0)}"
+            )
+            for message in stats['error_messages']:
+                self.stderr.write(f"{profile}: {message}")
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def run(self, options):
+        primary = connection.settings_dict['NAME']
+        user_ids = [
+            User.objects.create_user(username=f'contention-{index}').pk
+            for index in range(max(options['writers'], options['readers']))
+        ]
+        mood = Mood.objects.filter(is_active=True).order_by('id').first()
+        connection.close()
+
+        replica = f'{primary}.replica' if options['replica'] else None
+        results = {}
+        try:
+            for profile in options['profiles']:
+                # The journal mode is stored in the file: start every profile from rollback journaling
+                with connection.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode=DELETE')
+                connection.close()
+                databases = {'default': self.database(profile, primary, options)}
+                if replica:
+                    self.prepare_replica(primary, replica)
+                    databases[REPLICA] = self.database(profile, replica, options)
+                results[profile] = self.run_profile(databases, user_ids, mood.pk, options)
+        finally:
+            if replica:
+                self.remove_database_files(replica)
+        return {
+            'database': 'sqlite',
+            'config': {
+                key: options[key]
+                for key in ('writers', 'readers', 'transactions', 'busy_timeout', 'replica', 'replica_sync')
+            },
+            'profiles': results,
+        }
+
+    def prepare_replica(self, primary, replica):
+        """
+        Give the readers a fresh copy of the migrated primary, schema
+        included, before they start; an old copy's WAL files are dropped first
+        """
+        self.remove_database_files(replica)
+        copy_sqlite_database(primary, replica)
+        copy = sqlite3.connect(replica)
+        try:
+            tables = {name for name, in copy.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        finally:
+            copy.close()
+        missing = {User._meta.db_table, Recommendation._meta.db_table} - tables
+        if missing:
+            raise CommandError(f"The replica copy has no {', '.join(sorted(missing))} table")
+
+    def remove_database_files(self, name):
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(name + suffix):
+                os.remove(name + suffix)
+
+    def database(self, profile, name, options):
+        """Complete settings for a connection to name under profile"""
+        database = sqlite_database(name, profile, busy_timeout=options['busy_timeout'])
+        return {
+            **connection.settings_dict,
+            'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': False,
+            'OPTIONS': {},
+            **database,
+            'TEST': {},
+        }
+
+    def run_profile(self, databases, user_ids, mood_id, options):
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        done = context.Event()
+        start_line = context.Barrier(options['writers'] + options['readers'] + 1)
+
+        writers = [
+            context.Process(target=self.worker, args=('write', index, databases, user_ids, mood_id, options,
+                                                      queue, done, start_line))
+            for index in range(options['writers'])
+        ]
+        readers = [
+            context.Process(target=self.worker, args=('read', index, databases, user_ids, mood_id, options,
+                                                      queue, done, start_line))
+            for index in range(options['readers'])
+        ]
+        for process in writers + readers:
+            process.start()
+
+        start_line.wait(timeout=60)
+        start = time.perf_counter()
+        last_sync = start
+        finished = 0
+        reports = []
+        while finished < len(writers):
+            if REPLICA in databases and time.perf_counter() - last_sync >= options['replica_sync']:
+                copy_sqlite_database(databases['default']['NAME'], databases[REPLICA]['NAME'])
+                last_sync = time.perf_counter()
+            while not queue.empty():
+                reports.append(queue.get())
+                finished += reports[-1]['kind'] == 'write'
+            time.sleep(0.01)
+        wall = time.perf_counter() - start
+        done.set()
+        while len(reports) < len(writers) + len(readers):
+            reports.append(queue.get())
+        for process in writers + readers:
+            process.join()
+
+        stats = {
+            'error_messages': sorted({message for report in reports for message in report['messages']}),
+        }
+        for kind, rate in (('write', 'tps'), ('read', 'rps')):
+            samples = [sample for report in reports if report['kind'] == kind for sample in report['samples']]
+            errors = Counter()
+            for report in reports:
+                if report['kind'] == kind:
+                    errors.update(report['errors'])
+            stats[f'{kind}s'] = {
+                **summarize_latencies(samples),
+                rate: round(len(samples) / wall, 2),
+                'errors': dict(errors),
+            }
+        stats['wall_seconds'] = round(wall, 3)
+        return stats
+
+    def worker(self, kind, index, databases, user_ids, mood_id, options, queue, done, start_line):
+        """Runs in a forked process with its own connections to the profile's databases"""
+        settings.DATABASES.pop(REPLICA, None)
+        for alias, database in databases.items():
+            settings.DATABASES[alias] = database
+            connections[alias] = connections.create_connection(alias)
+
+        random.seed(index)
+        user = User(pk=user_ids[index])
+        mood = Mood(pk=mood_id, name='Happy')
+        samples, errors, messages = [], Counter(), set()
+        try:
+            start_line.wait()
+            for iteration in range(options['transactions']) if kind == 'write' else iter(done.is_set, True):
+                start = time.perf_counter()
+                try:
+                    if kind == 'write':
+                        self.write(user, mood)
+                    else:
+                        self.read(user)
+                except OperationalError as e:
+                    if 'locked' in str(e):
+                        errors['locked'] += 1
+                    else:
+                        errors['other'] += 1
+                        messages.add(f'{kind}: {e}')
+                else:
+                    samples.append(time.perf_counter() - start)
+                # Closed after each request unless the profile keeps connections, as request_finished does
+                for conn in connections.all(initialized_only=True):
+                    conn.close_if_unusable_or_obsolete()
+        finally:
+            queue.put({'kind': kind, 'samples': samples, 'errors': dict(errors), 'messages': sorted(messages)})
+
+    def write(self, user, mood):
+        """The recommend write path: check the user's history, then record movies and recommendations"""
+        page = fake_discover_results([random.randrange(1, 40)], page=random.randrange(1, 50))[:2]
+        with transaction.atomic():
+            Recommendation.objects.filter(user=user).exists()
+            RecommendationService.record(user, mood, page)
+
+    def read(self, user):
+        with read_from_replica():
+            list(
+                Recommendation.objects
+                .filter(user=user)
+                .with_movie()
+                .select_related('mood')
+                .order_by('-recommended_at')[:20]
+            )
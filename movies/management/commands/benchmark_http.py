@@ -0,0 +1,240 @@
+import json
+import random
+import subprocess
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from movies.benchmarking import LiveDjangoServer, StubTMDBServer, summarize_latencies, throwaway_database
+from movies.services import TMDBService, reset_http_session
+
+
+FLOWS = ['login', 'moods', 'recommend', 'history', 'mark_viewed']
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive login, mood list, recommend, history and mark-viewed over HTTP against a '
+        'throwaway test database and a local TMDB stub; report RPS, latency percentiles and queries per request'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=8, help='Concurrent virtual users')
+        parser.add_argument('--iterations', type=int, default=25, help='Mood/recommend/history/view rounds per user')
+        parser.add_argument('--latency', type=float, default=0.02, help='TMDB stub latency in seconds')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of TMDB stub calls answered with 503')
+        parser.add_argument('--stub-rate-limit', type=int, default=0,
+                            help='Requests per second the TMDB stub serves before answering 429 (0: unlimited)')
+        parser.add_argument('--rate-limit', type=float,
+                            help='Outbound TMDB calls per second (TMDB_RATE_LIMIT; 0 disables, default from settings)')
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Disable the TMDB response cache so every recommend miss goes out')
+        parser.add_argument('--token-auth', action='store_true',
+                            help='Authenticate with the bearer token from login instead of the session cookie')
+        parser.add_argument('--fixtures', help='Replay recorded TMDB responses from this directory instead of the stub')
+        parser.add_argument('--replay-latency', default='0', help="Seconds per replayed response, or 'recorded'")
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for mood selection')
+        parser.add_argument('--output', help='Write the results as JSON to this path')
+        parser.add_argument('--compare', help='Print deltas against a previous --output file')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['iterations'] < 1:
+            raise CommandError('--users and --iterations must be positive')
+        baseline = self.load_baseline(options['compare'])
+
+        with throwaway_database():
+            results = self.run(options)
+
+        self.report(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def run(self, options):
+        random.seed(options['seed'])
+        password = 'benchmark-pass-123'
+        users = [
+            User.objects.create_user(username=f'bench-user-{index}', password=password)
+            for index in range(options['users'])
+        ]
+        connection.close()
+
+        samples = defaultdict(list)
+        statuses = defaultdict(Counter)
+        lock = threading.Lock()
+
+        def timed(session, flow, method, url, **kwargs):
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, headers={'X-Bench-Flow': flow}, timeout=30, **kwargs)
+                status = response.status_code
+            except requests.RequestException:
+                response, status = None, 'error'
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples[flow].append(elapsed)
+                statuses[flow][str(status)] += 1
+            return response
+
+        transport = {}
+        if options['rate_limit'] is not None:
+            transport['TMDB_RATE_LIMIT'] = options['rate_limit']
+        if options['no_cache']:
+            transport['TMDB_CACHE_BACKEND'] = 'none'
+        if options['fixtures']:
+            transport.update({
+                'TMDB_TRANSPORT': 'replay',
+                'TMDB_FIXTURE_DIR': options['fixtures'],
+                'TMDB_REPLAY_LATENCY': options['replay_latency'],
+            })
+
+        stub = StubTMDBServer(
+            latency=options['latency'], error_rate=options['error_rate'], rate_limit=options['stub_rate_limit'],
+        )
+        with stub, \
+                override_settings(
+                    ALLOWED_HOSTS=['127.0.0.1', 'localhost'],
+                    TMDB_BASE_URL=stub.base_url,
+                    TMDB_API_KEY='bench',
+                    **transport,
+                ):
+            reset_http_session()
+            TMDBService.set_transport(None)
+            TMDBService.set_response_cache(None)
+            TMDBService.set_rate_limiter(None)
+            if TMDBService.get_response_cache() is not None:
+                TMDBService.get_response_cache().clear()
+            with LiveDjangoServer() as server:
+                base_url = server.base_url
+
+                def virtual_user(user):
+                    session = requests.Session()
+                    response = timed(session, 'login', 'POST', f'{base_url}/api/auth/login/',
+                                     json={'username': user.username, 'password': password})
+                    if options['token_auth'] and response is not None and response.ok:
+                        session.cookies.clear()
+                        session.headers['Authorization'] = f"Bearer {response.json()['token']}"
+                    else:
+                        session.headers['X-CSRFToken'] = session.cookies.get('csrftoken', '')
+
+                    for _ in range(options['iterations']):
+                        response = timed(session, 'moods', 'GET', f'{base_url}/api/moods/')
+                        moods = response.json() if response is not None and response.ok else []
+                        if not moods:
+                            continue
+                        mood = random.choice(moods)
+                        response = timed(session, 'recommend', 'POST', f'{base_url}/api/movies/recommend/',
+                                         json={'mood_id': mood['id']})
+                        recommendation_ids = []
+                        if response is not None and response.ok:
+                            recommendation_ids = response.json()['recommendations']
+                        timed(session, 'history', 'GET', f'{base_url}/api/movies/recommendations/')
+                        if recommendation_ids:
+                            timed(session, 'mark_viewed', 'POST',
+                                  f'{base_url}/api/movies/recommendations/{recommendation_ids[0]}/view/')
+                    session.close()
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=len(users)) as executor:
+                    list(executor.map(virtual_user, users))
+                wall = time.perf_counter() - start
+
+                flows = {}
+                for flow in FLOWS:
+                    flows[flow] = {
+                        **summarize_latencies(samples[flow]),
+                        'rps': round(len(samples[flow]) / wall, 2),
+                        'queries_per_request': round(server.app.queries_per_request(flow), 2),
+                        'statuses': dict(statuses[flow]),
+                    }
+            tmdb_requests = stub.request_count
+            tmdb_throttled = stub.throttled_count
+            reset_http_session()
+            TMDBService.set_transport(None)
+            TMDBService.set_response_cache(None)
+            TMDBService.set_rate_limiter(None)
+
+        total = sum(len(flow_samples) for flow_samples in samples.values())
+        return {
+            'commit': self.git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'config': {
+                'users': options['users'],
+                'iterations': options['iterations'],
+                'latency': options['latency'],
+                'error_rate': options['error_rate'],
+                'stub_rate_limit': options['stub_rate_limit'],
+                'rate_limit': (
+                    getattr(settings, 'TMDB_RATE_LIMIT', 0) if options['rate_limit'] is None else options['rate_limit']
+                ),
+                'response_cache': not options['no_cache'],
+                'token_auth': options['token_auth'],
+                'seed': options['seed'],
+                'fixtures': options['fixtures'],
+                'replay_latency': options['replay_latency'] if options['fixtures'] else None,
+                'fast_serializers': getattr(settings, 'FAST_SERIALIZERS', False),
+                'fanout_genres': getattr(settings, 'TMDB_FANOUT_GENRES', False),
+            },
+            'wall_seconds': round(wall, 3),
+            'requests': total,
+            'rps': round(total / wall, 2),
+            'tmdb_requests': tmdb_requests,
+            'tmdb_throttled': tmdb_throttled,
+            'flows': flows,
+        }
+
+    def report(self, results, baseline):
+        self.stdout.write(
+            f"{results['requests']} requests in {results['wall_seconds']}s "
+            f"({results['rps']} rps, {results['tmdb_requests']} TMDB calls, "
+            f"{results.get('tmdb_throttled', 0)} throttled) at {results['commit'] or 'unknown commit'}"
+        )
+        self.stdout.write(f"{'flow':<12} {'n':>6} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8}  statuses")
+        for flow, stats in results['flows'].items():
+            statuses = ' '.join(f'{code}:{count}' for code, count in sorted(stats['statuses'].items()))
+            self.stdout.write(
+                f"{flow:<12} {stats['count']:>6} {stats['rps']:>8.1f} {stats['p50_ms']:>7.1f}ms "
+                f"{stats['p95_ms']:>7.1f}ms {stats['p99_ms']:>7.1f}ms {stats['queries_per_request']:>8.1f}  {statuses}"
+            )
+            previous = (baseline or {}).get('flows', {}).get(flow)
+            if previous:
+                self.stdout.write(
+                    f"{'':<12} vs {baseline.get('commit') or 'baseline'}: "
+                    f"p50 {self.delta(previous['p50_ms'], stats['p50_ms'])} "
+                    f"p99 {self.delta(previous['p99_ms'], stats['p99_ms'])} "
+                    f"queries {stats['queries_per_request'] - previous['queries_per_request']:+.1f}"
+                )
+
+    def delta(self, before, after):
+        if not before:
+            return 'n/a'
+        return f'{(after - before) / before * 100:+.1f}%'
+
+    def load_baseline(self, path):
+        if not path:
+            return None
+        try:
+            with open(path) as baseline:
+                return json.load(baseline)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Can't read baseline {path}: {e}")
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,96 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from moods.models import Mood
+from movies.benchmarking import fake_discover_results
+from movies.models import Movie, Recommendation
+from movies.serializers import (
+    MovieSerializer,
+    MovieValuesSerializer,
+    RecommendationSerializer,
+    RecommendationValuesSerializer,
+)
+from movies.services import TMDBService
+
+
+class Command(BaseCommand):
+    help = 'Compare per-row CPU cost of the model serializers and the .values() fast path (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help='Page sizes to render')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the best is reported')
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        with transaction.atomic():
+            self.seed(max(sizes))
+            for size in sizes:
+                self.compare('movies', size, options['repeat'], self.movie_paths(size))
+                self.compare('recommendations', size, options['repeat'], self.recommendation_paths(size))
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        user = User.objects.create_user(username='serializer-benchmark')
+        mood = Mood.objects.first() or Mood.objects.create(name='Serializer benchmark')
+        pages = -(-count // 20)
+        results = [movie for page in range(1, pages + 1) for movie in fake_discover_results([9999], page)]
+        movies = TMDBService.create_or_update_movies(results[:count])
+        Recommendation.objects.bulk_create(
+            [Recommendation(user=user, movie=movie, mood=mood) for movie in movies],
+            batch_size=500,
+        )
+        self.user = user
+
+    def movie_paths(self, size):
+        queryset = Movie.objects.lean().filter(tmdb_id__gte=9999 * 100000).order_by('-created_at', '-id')
+        fast = MovieValuesSerializer()
+        return (
+            lambda: list(queryset[:size]),
+            lambda rows: MovieSerializer(rows, many=True).data,
+            lambda: list(queryset.values(*fast.value_fields)[:size]),
+            fast.serialize,
+        )
+
+    def recommendation_paths(self, size):
+        queryset = Recommendation.objects.filter(user=self.user).order_by('-recommended_at', '-id')
+        fast = RecommendationValuesSerializer()
+        return (
+            lambda: list(queryset.with_movie().select_related('mood', 'user')[:size]),
+            lambda rows: RecommendationSerializer(rows, many=True).data,
+            lambda: list(queryset.values(*fast.value_fields)[:size]),
+            fast.serialize,
+        )
+
+    def compare(self, name, size, repeat, paths):
+        fetch_models, serialize_models, fetch_values, serialize_values = paths
+        renderer = JSONRenderer()
+
+        model_fetch, model_render, model_body = self.measure(fetch_models, serialize_models, renderer, repeat)
+        fast_fetch, fast_render, fast_body = self.measure(fetch_values, serialize_values, renderer, repeat)
+        identical = 'identical' if model_body == fast_body else 'DIFFERENT'
+
+        self.stdout.write(f'{name} x{size} ({identical} JSON)')
+        for label, fetch, render in (('serializer', model_fetch, model_render), ('fast path', fast_fetch, fast_render)):
+            self.stdout.write(
+                f'  {label:<11} fetch={fetch / size * 1e6:.2f}us/row '
+                f'serialize+render={render / size * 1e6:.2f}us/row '
+                f'total={(fetch + render) * 1000:.1f}ms'
+            )
+        self.stdout.write(f'  speedup     serialize+render x{model_render / fast_render:.1f}')
+
+    def measure(self, fetch, serialize, renderer, repeat):
+        """Best-of-`repeat` CPU time for fetching rows and for serializing + rendering them"""
+        best_fetch = best_render = float('inf')
+        for _ in range(repeat):
+            start = time.process_time()
+            rows = fetch()
+            fetched = time.process_time()
+            body = renderer.render(serialize(rows))
+            rendered = time.process_time()
+            best_fetch = min(best_fetch, fetched - start)
+            best_render = min(best_render, rendered - fetched)
+        return best_fetch, best_render, body
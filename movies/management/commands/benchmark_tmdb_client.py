@@ -0,0 +1,61 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from movies.benchmarking import StubTMDBServer, summarize_latencies
+from movies.services import TMDBService, reset_http_session
+
+
+class Command(BaseCommand):
+    help = 'Compare per-call requests.get against the pooled TMDB client using a local stub server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Calls per client')
+        parser.add_argument('--latency', type=float, default=0.0, help='Stub latency in seconds')
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        params = {'with_genres': 35, 'sort_by': 'popularity.desc', 'page': 1}
+
+        with StubTMDBServer(latency=options['latency']) as stub:
+            url = f'{stub.base_url}/discover/movie'
+
+            def legacy_call():
+                response = requests.get(url, params={**params, 'api_key': 'bench'}, timeout=10)
+                response.raise_for_status()
+                return response.json()
+
+            def pooled_call():
+                return TMDBService._make_request('/discover/movie', params, use_cache=False)
+
+            # Measure the client alone: no outbound rate limit or call coalescing
+            with override_settings(TMDB_BASE_URL=stub.base_url, TMDB_API_KEY='bench',
+                                   TMDB_RATE_LIMIT=0, TMDB_COALESCE=False):
+                reset_http_session()
+                TMDBService.set_rate_limiter(None)
+                try:
+                    results = {
+                        'requests.get': self._measure(legacy_call, count),
+                        'pooled session': self._measure(pooled_call, count),
+                    }
+                finally:
+                    reset_http_session()
+                    TMDBService.set_rate_limiter(None)
+
+        for name, summary in results.items():
+            self.stdout.write(
+                f"{name:<16} n={summary['count']} "
+                f"p50={summary['p50_ms']:.3f}ms p99={summary['p99_ms']:.3f}ms "
+                f"mean={summary['mean_ms']:.3f}ms"
+            )
+
+    def _measure(self, call, count):
+        call()  # warm up
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter()
+            call()
+            samples.append(time.perf_counter() - start)
+        return summarize_latencies(samples)
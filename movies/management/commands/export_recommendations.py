@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movieflick.routers import read_from_replica
+from movies.exports import CONTENT_TYPES, Exporter, export_queryset
+
+
+class Command(BaseCommand):
+    help = 'Stream recommendation history, oldest first, as NDJSON or CSV to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', metavar='USERNAME',
+                            help="Only this user's history (repeatable; default: every user)")
+        parser.add_argument('--format', choices=list(CONTENT_TYPES), default='ndjson', dest='export_format')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched and written at a time (default EXPORT_CHUNK_SIZE)')
+        parser.add_argument('--output', default='-', help="File to write, or '-' for stdout")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        with read_from_replica():
+            recommendations = export_queryset()
+            if options['usernames']:
+                recommendations = recommendations.filter(user__username__in=options['usernames'])
+            recommendations = recommendations.using(recommendations.db)
+
+        exporter = Exporter(options['export_format'], compress=options['gzip'], chunk_size=options['chunk_size'])
+        if options['output'] == '-':
+            self.write(exporter, recommendations, sys.stdout.buffer)
+        else:
+            try:
+                with open(options['output'], 'wb') as output:
+                    self.write(exporter, recommendations, output)
+            except OSError as e:
+                raise CommandError(f"Can't write {options['output']}: {e}")
+        self.stderr.write(f'{exporter.rows} recommendations exported')
+
+    def write(self, exporter, recommendations, output):
+        for chunk in exporter.stream(recommendations):
+            output.write(chunk)
+        output.flush()
@@ -0,0 +1,83 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+from django.db.models.functions import Length
+
+from movies.models import Movie, MoviePayload
+from movies.payloads import decode_payload
+
+
+class Command(BaseCommand):
+    help = 'Report movies_movie size and scan time with raw TMDB payloads inline (before) vs in MoviePayload (after)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Full scans per measurement')
+
+    def handle(self, *args, **options):
+        movie_count = Movie.objects.count()
+        if not movie_count:
+            self.stdout.write('No movies in the database; run refresh_candidate_pool first')
+            return
+
+        stored_bytes = MoviePayload.objects.aggregate(total=Sum(Length('data')))['total'] or 0
+        raw_bytes = sum(
+            len(json.dumps(decode_payload(encoding, data)).encode())
+            for encoding, data in MoviePayload.objects.values_list('encoding', 'data').iterator()
+        )
+        hot_bytes = self.table_bytes(Movie._meta.db_table)
+        payload_bytes = self.table_bytes(MoviePayload._meta.db_table)
+
+        # Before: every scan of movies_movie also read the payload, approximated with a join
+        before_scan = self.time_scan(
+            lambda: list(Movie.objects.values_list(*self.hot_columns(), 'payload__data')),
+            options['repeat'],
+        )
+        after_scan = self.time_scan(
+            lambda: list(Movie.objects.values_list(*self.hot_columns())),
+            options['repeat'],
+        )
+
+        self.stdout.write(f'Movies:                      {movie_count}')
+        self.stdout.write(f'Raw payload JSON (inline):   {self.format_bytes(raw_bytes)}')
+        self.stdout.write(f'Stored payload (compressed): {self.format_bytes(stored_bytes)}')
+        if hot_bytes is not None:
+            self.stdout.write(f'movies_movie before:         ~{self.format_bytes(hot_bytes + raw_bytes)}')
+            self.stdout.write(f'movies_movie after:          {self.format_bytes(hot_bytes)}')
+            self.stdout.write(f'movies_moviepayload:         {self.format_bytes(payload_bytes or 0)}')
+        self.stdout.write(f'Full scan before (approx.):  {before_scan * 1000:.2f}ms')
+        self.stdout.write(f'Full scan after:             {after_scan * 1000:.2f}ms')
+
+    def hot_columns(self):
+        return [field.attname for field in Movie._meta.concrete_fields]
+
+    def table_bytes(self, table):
+        """On-disk size of a table where the backend can tell us, else None"""
+        with connection.cursor() as cursor:
+            try:
+                if connection.vendor == 'sqlite':
+                    cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = %s', [table])
+                elif connection.vendor == 'postgresql':
+                    cursor.execute('SELECT pg_total_relation_size(%s)', [table])
+                else:
+                    return None
+            except Exception:
+                return None
+            return cursor.fetchone()[0]
+
+    def time_scan(self, scan, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            scan()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def format_bytes(self, size):
+        for unit in ('B', 'KB', 'MB', 'GB'):
+            if size < 1024 or unit == 'GB':
+                return f'{size:.1f}{unit}'
+            size /= 1024
@@ -0,0 +1,41 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils.crypto import get_random_string
+
+from moods.models import Mood
+from movies.services import PrecomputeQueue
+
+
+class Command(BaseCommand):
+    help = "Drain the precompute queue: build each queued user's next recommendation batch per mood"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=10, help='Jobs claimed per round')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due instead of polling')
+        parser.add_argument('--enqueue-active', action='store_true',
+                            help='First queue every active user for every active mood')
+
+    def handle(self, *args, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}:{get_random_string(6)}'[:64]
+        if options['enqueue_active']:
+            mood_ids = list(Mood.objects.filter(is_active=True).values_list('id', flat=True))
+            PrecomputeQueue.enqueue_active(mood_ids)
+
+        processed = 0
+        try:
+            while True:
+                close_old_connections()
+                claimed = PrecomputeQueue.work(worker, limit=options['batch'])
+                processed += claimed
+                if not claimed:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'{worker}: {processed} jobs processed'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from moods.models import Mood
+from movies.services import CandidatePool
+
+
+class Command(BaseCommand):
+    help = 'Pre-fetch TMDB discover pages for each mood into the local candidate pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=5, help='Discover pages to fetch per genre')
+        parser.add_argument('--mood', action='append', dest='moods', help='Only refresh this mood (repeatable)')
+
+    def handle(self, *args, **options):
+        moods = Mood.objects.filter(is_active=True)
+        if options['moods']:
+            moods = moods.filter(name__in=options['moods'])
+        if not moods.exists():
+            raise CommandError('No matching active moods')
+
+        for mood in moods:
+            try:
+                stored = CandidatePool.refresh(mood, pages=options['pages'])
+            except Exception as e:
+                raise CommandError(f'Failed to refresh {mood.name}: {e}')
+            self.stdout.write(self.style.SUCCESS(f'{mood.name}: {stored} candidates'))
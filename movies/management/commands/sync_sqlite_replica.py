@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from movieflick.routers import REPLICA
+from movieflick.sqlite3 import copy_sqlite_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database onto the replica file (DATABASE_REPLICA_NAME), "
+        "standing in for replication when trying the replica router locally"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep copying every this many seconds (0: copy once)')
+
+    def handle(self, *args, **options):
+        databases = settings.DATABASES
+        if REPLICA not in databases:
+            raise CommandError('No replica configured: set DATABASE_REPLICA_NAME')
+        for alias in ('default', REPLICA):
+            if databases[alias]['ENGINE'] not in ('django.db.backends.sqlite3', 'movieflick.sqlite3'):
+                raise CommandError(f"sync_sqlite_replica only copies SQLite databases ('{alias}' isn't one)")
+
+        source, target = str(databases['default']['NAME']), str(databases[REPLICA]['NAME'])
+        try:
+            while True:
+                start = time.perf_counter()
+                copy_sqlite_database(source, target)
+                self.stdout.write(f'Copied {source} to {target} in {(time.perf_counter() - start) * 1000:.0f}ms')
+                if not options['interval']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
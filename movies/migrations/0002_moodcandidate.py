@@ -0,0 +1,34 @@
+# Generated by Django 5.0 on 2026-10-18 18:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moods', '0002_auto_20260101_1705'),
+        ('movies', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoodCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField()),
+                ('popularity', models.FloatField(default=0)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('mood', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='moods.mood')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mood_candidates', to='movies.movie')),
+            ],
+            options={
+                'ordering': ['mood', 'rank'],
+                'indexes': [models.Index(fields=['mood', 'rank'], name='moodcandidate_mood_rank')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='moodcandidate',
+            constraint=models.UniqueConstraint(fields=('mood', 'movie'), name='unique_mood_candidate'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0 on 2026-10-18 19:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from movies.payloads import ZLIB, decode_payload, encode_payload
+
+
+def move_payloads_to_side_table(apps, schema_editor):
+    """Copy Movie.external_api_data into compressed MoviePayload rows"""
+    Movie = apps.get_model('movies', 'Movie')
+    MoviePayload = apps.get_model('movies', 'MoviePayload')
+
+    batch = []
+    movies = Movie.objects.only('id', 'external_api_data').iterator(chunk_size=500)
+    for movie in movies:
+        encoding, blob = encode_payload(movie.external_api_data or {}, ZLIB)
+        batch.append(MoviePayload(movie_id=movie.id, encoding=encoding, data=blob))
+        if len(batch) >= 500:
+            MoviePayload.objects.bulk_create(batch)
+            batch = []
+    MoviePayload.objects.bulk_create(batch)
+
+
+def move_payloads_back(apps, schema_editor):
+    """Restore Movie.external_api_data from MoviePayload"""
+    Movie = apps.get_model('movies', 'Movie')
+    MoviePayload = apps.get_model('movies', 'MoviePayload')
+
+    for payload in MoviePayload.objects.iterator(chunk_size=500):
+        Movie.objects.filter(pk=payload.movie_id).update(
+            external_api_data=decode_payload(payload.encoding, payload.data)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_moodcandidate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoviePayload',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='payload', serialize=False, to='movies.movie')),
+                ('encoding', models.CharField(choices=[('json', 'json'), ('zlib', 'zlib'), ('zstd', 'zstd')], default='json', max_length=8)),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(move_payloads_to_side_table, move_payloads_back),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 19:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_moviepayload'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='movie',
+            name='external_api_data',
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0 on 2026-10-18 19:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_movie_genres(apps, schema_editor):
+    """Build MovieGenre rows from the existing Movie.genre_ids"""
+    Movie = apps.get_model('movies', 'Movie')
+    MovieGenre = apps.get_model('movies', 'MovieGenre')
+
+    batch = []
+    for movie_id, genre_ids in Movie.objects.values_list('id', 'genre_ids').iterator(chunk_size=500):
+        for genre_id in dict.fromkeys(genre_ids or []):
+            batch.append(MovieGenre(movie_id=movie_id, genre_id=genre_id))
+        if len(batch) >= 500:
+            MovieGenre.objects.bulk_create(batch)
+            batch = []
+    MovieGenre.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_remove_movie_external_api_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieGenre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('genre_id', models.PositiveIntegerField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='genres', to='movies.movie')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['genre_id', 'movie'], name='moviegenre_genre_movie')],
+            },
+        ),
+        migrations.RunPython(populate_movie_genres, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='moviegenre',
+            constraint=models.UniqueConstraint(fields=('movie', 'genre_id'), name='unique_movie_genre'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0 on 2026-10-18 19:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moods', '0002_auto_20260101_1705'),
+        ('movies', '0005_moviegenre'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recommendation',
+            index=models.Index(fields=['user', '-recommended_at', '-id'], name='rec_user_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='recommendation',
+            index=models.Index(fields=['user', 'mood', '-recommended_at', '-id'], name='rec_user_mood_recent'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.0 on 2026-10-18 19:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moods', '0002_auto_20260101_1705'),
+        ('movies', '0006_recommendation_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')], default='pending', max_length=8)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField()),
+                ('claimed_by', models.CharField(blank=True, default='', max_length=64)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('mood', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precompute_jobs', to='moods.mood')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precompute_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PrecomputedPick',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('mood', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precomputed_picks', to='moods.mood')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.movie')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precomputed_picks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'mood', 'rank'], name='precomputedpick_user_mood_rank')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='precomputedpick',
+            constraint=models.UniqueConstraint(fields=('user', 'mood', 'movie'), name='unique_precomputed_pick'),
+        ),
+        migrations.AddIndex(
+            model_name='precomputejob',
+            index=models.Index(fields=['status', 'run_after'], name='precomputejob_status_run'),
+        ),
+        migrations.AddConstraint(
+            model_name='precomputejob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('user', 'mood'), name='unique_pending_precompute_job'),
+        ),
+    ]
@@ -1,6 +1,56 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Count, F
 from django.contrib.auth.models import User
 from moods.models import Mood
+from .payloads import ENCODINGS, JSON, decode_payload, encode_payload
+
+
+class MovieQuerySet(models.QuerySet):
+    """Movie queries that skip columns API responses never read"""
+    HEAVY_FIELDS = ('genre_ids',)
+
+    def lean(self):
+        return self.defer(*self.HEAVY_FIELDS)
+
+    def in_genre(self, genre_id):
+        """Movies tagged with genre_id, via the MovieGenre index"""
+        return self.filter(genres__genre_id=genre_id)
+
+    def with_genres(self, genre_ids):
+        """
+        Movies tagged with any of genre_ids, annotated with genre_overlap
+        (how many of them match) and ranked by it, then by rating
+        """
+        return (
+            self.filter(genres__genre_id__in=genre_ids)
+            .annotate(genre_overlap=Count('genres'))
+            .order_by('-genre_overlap', F('rating').desc(nulls_last=True), '-id')
+        )
+
+    def filter_catalog(self, genre=None, min_rating=None, max_rating=None,
+                       released_after=None, released_before=None):
+        """Apply the optional catalog filters used by the movie list endpoint"""
+        queryset = self
+        if genre is not None:
+            queryset = queryset.in_genre(genre)
+        if min_rating is not None:
+            queryset = queryset.filter(rating__gte=min_rating)
+        if max_rating is not None:
+            queryset = queryset.filter(rating__lte=max_rating)
+        if released_after is not None:
+            queryset = queryset.filter(release_date__gte=released_after)
+        if released_before is not None:
+            queryset = queryset.filter(release_date__lte=released_before)
+        return queryset
+
+
+class RecommendationQuerySet(models.QuerySet):
+    def with_movie(self):
+        """Join the movie without its heavy columns"""
+        return self.select_related('movie').defer(
+            *[f'movie__{name}' for name in MovieQuerySet.HEAVY_FIELDS]
+        )
 
 
 class Movie(models.Model):
@@ -13,16 +63,97 @@ class Movie(models.Model):
     tmdb_id = models.IntegerField(unique=True)
     rating = models.FloatField(blank=True, null=True)
     genre_ids = models.JSONField(default=list, blank=True)
-    external_api_data = models.JSONField(default=dict, blank=True)  # Store full API response
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = MovieQuerySet.as_manager()
+
+    # Full API response assigned but not yet written to MoviePayload
+    _pending_payload = None
+
     class Meta:
         ordering = ['-created_at']
 
     def __str__(self):
         return self.title
 
+    @property
+    def external_api_data(self):
+        """Full TMDB API response, loaded lazily from MoviePayload"""
+        if self._pending_payload is not None:
+            return self._pending_payload
+        if self.pk is None:
+            return {}
+        try:
+            return self.payload.data_dict
+        except MoviePayload.DoesNotExist:
+            return {}
+
+    @external_api_data.setter
+    def external_api_data(self, value):
+        # None is stored as an empty payload, like the old JSONField default
+        self._pending_payload = {} if value is None else value
+
+    def build_payload(self):
+        """Build the unsaved MoviePayload for the pending API response"""
+        return MoviePayload.from_data(self, self._pending_payload or {})
+
+    def build_genres(self):
+        """Build the unsaved MovieGenre rows for genre_ids"""
+        return [
+            MovieGenre(movie=self, genre_id=genre_id)
+            for genre_id in dict.fromkeys(self.genre_ids or [])
+        ]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'genre_ids' in update_fields:
+            MovieGenre.objects.filter(movie=self).delete()
+            MovieGenre.objects.bulk_create(self.build_genres())
+        if self._pending_payload is not None:
+            payload = self.build_payload()
+            payload.save()
+            self._pending_payload = None
+            self.payload = payload
+
+
+class MovieGenre(models.Model):
+    """Normalized copy of Movie.genre_ids so genre queries can use an index"""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='genres')
+    genre_id = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'genre_id'], name='unique_movie_genre'),
+        ]
+        indexes = [
+            models.Index(fields=['genre_id', 'movie'], name='moviegenre_genre_movie'),
+        ]
+
+    def __str__(self):
+        return f"{self.movie_id}: {self.genre_id}"
+
+
+class MoviePayload(models.Model):
+    """Raw TMDB API response for a movie, kept out of the hot movies_movie table"""
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='payload')
+    encoding = models.CharField(max_length=8, choices=[(name, name) for name in ENCODINGS], default=JSON)
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Payload for {self.movie_id} ({self.encoding})"
+
+    @classmethod
+    def from_data(cls, movie, data):
+        encoding, blob = encode_payload(data, getattr(settings, 'MOVIE_PAYLOAD_COMPRESSION', 'zlib'))
+        return cls(movie=movie, encoding=encoding, data=blob)
+
+    @property
+    def data_dict(self):
+        return decode_payload(self.encoding, self.data)
+
 
 class Recommendation(models.Model):
     """Recommendation model linking User, Movie, and Mood"""
@@ -33,8 +164,89 @@ class Recommendation(models.Model):
     viewed = models.BooleanField(default=False)
     user_rating = models.IntegerField(blank=True, null=True)  # Optional: user rating 1-5
 
+    objects = RecommendationQuerySet.as_manager()
+
     class Meta:
         ordering = ['-recommended_at']
+        indexes = [
+            # History, detail and template views: a user's rows, newest first
+            models.Index(fields=['user', '-recommended_at', '-id'], name='rec_user_recent'),
+            # History filtered by mood
+            models.Index(fields=['user', 'mood', '-recommended_at', '-id'], name='rec_user_mood_recent'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.movie.title} ({self.mood.name})"
+
+
+class MoodCandidate(models.Model):
+    """Precomputed local candidate pool for a mood, ranked best first"""
+    mood = models.ForeignKey(Mood, on_delete=models.CASCADE, related_name='candidates')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='mood_candidates')
+    rank = models.PositiveIntegerField()
+    popularity = models.FloatField(default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['mood', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['mood', 'movie'], name='unique_mood_candidate'),
+        ]
+        indexes = [
+            models.Index(fields=['mood', 'rank'], name='moodcandidate_mood_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.mood.name} #{self.rank}: {self.movie.title}"
+
+
+class PrecomputeJob(models.Model):
+    """Queued request to precompute a user's next recommendation batch for a mood"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='precompute_jobs')
+    mood = models.ForeignKey(Mood, on_delete=models.CASCADE, related_name='precompute_jobs')
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField()
+    claimed_by = models.CharField(max_length=64, blank=True, default='')
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Queueing the same work twice is a no-op while it is still waiting
+            models.UniqueConstraint(
+                fields=['user', 'mood'], condition=models.Q(status='pending'), name='unique_pending_precompute_job',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='precomputejob_status_run'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}/{self.mood_id} ({self.status})"
+
+
+class PrecomputedPick(models.Model):
+    """A movie in a user's precomputed next batch for a mood, ranked best first"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='precomputed_picks')
+    mood = models.ForeignKey(Mood, on_delete=models.CASCADE, related_name='precomputed_picks')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'mood', 'movie'], name='unique_precomputed_pick'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'mood', 'rank'], name='precomputedpick_user_mood_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}/{self.mood_id} #{self.rank}: {self.movie_id}"
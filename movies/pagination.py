@@ -0,0 +1,122 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over a fixed, unique ordering
+    The cursor holds the ordering values of the last row of the page, so each
+    page is one indexed range query no matter how deep the client pages
+    """
+    ordering = ('-id',)
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.build_position_filter(position))
+
+        results = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        page_size = api_settings.PAGE_SIZE or self.max_page_size
+        requested = request.query_params.get(self.page_size_query_param)
+        if requested:
+            try:
+                page_size = int(requested)
+            except ValueError:
+                pass
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        if isinstance(last, dict):
+            # .values() rows, as used by the fast serializers
+            last = self.model(**{name: last[name] for name in self.ordering_fields})
+        values = [
+            self.model._meta.get_field(name).value_to_string(last)
+            for name in self.ordering_fields
+        ]
+        cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        return None
+
+    @property
+    def ordering_fields(self):
+        return [name.lstrip('-') for name in self.ordering]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                self.model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.ordering_fields, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def build_position_filter(self, position):
+        """
+        Rows strictly after `position` in the ordering, e.g. for (-a, -b):
+        a < x OR (a = x AND b < y)
+        """
+        condition = Q()
+        equal_prefix = {}
+        for name, value in zip(self.ordering, position):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= Q(**equal_prefix, **{f'{field}__{lookup}': value})
+            equal_prefix[field] = value
+        return condition
+
+
+class RecommendationCursorPagination(KeysetPagination):
+    """Newest recommendations first, ties broken by id"""
+    ordering = ('-recommended_at', '-id')
+
+
+class MovieCursorPagination(KeysetPagination):
+    """Newest movies first, ties broken by id"""
+    ordering = ('-created_at', '-id')
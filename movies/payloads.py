@@ -0,0 +1,50 @@
+"""
+Encoding of raw TMDB payloads stored in MoviePayload
+zlib is always available; zstd is used only when the optional `zstandard`
+package is installed
+"""
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+JSON = 'json'
+ZLIB = 'zlib'
+ZSTD = 'zstd'
+
+ENCODINGS = [JSON, ZLIB, ZSTD]
+
+
+def encode_payload(data, compression=ZLIB):
+    """
+    Serialize a payload, compressing it with `compression`
+    Returns (encoding, bytes); falls back to zlib when zstd isn't installed
+    """
+    raw = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode()
+    if compression == ZSTD and zstandard is None:
+        compression = ZLIB
+    if compression == ZSTD:
+        return ZSTD, zstandard.ZstdCompressor().compress(raw)
+    if compression == ZLIB:
+        return ZLIB, zlib.compress(raw)
+    if compression == JSON:
+        return JSON, raw
+    raise ValueError(f"Unknown payload compression: {compression}")
+
+
+def decode_payload(encoding, blob):
+    """Inverse of encode_payload"""
+    blob = bytes(blob)
+    if encoding == ZLIB:
+        blob = zlib.decompress(blob)
+    elif encoding == ZSTD:
+        if zstandard is None:
+            raise RuntimeError('zstandard is required to read zstd-compressed payloads')
+        blob = zstandard.ZstdDecompressor().decompress(blob)
+    elif encoding != JSON:
+        raise ValueError(f"Unknown payload encoding: {encoding}")
+    return json.loads(blob)
@@ -0,0 +1,84 @@
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Recommendation
+
+
+class SeenSet:
+    """
+    Compact per-user set of movie ids that were already recommended
+    Stored in the cache as a zlib-compressed bitmap indexed by Movie.pk; it is
+    built from Recommendation once and then updated incrementally
+    """
+
+    CACHE_KEY = 'seen-set:{user_id}'
+
+    def __init__(self, user_id, bitmap=None):
+        self.user_id = user_id
+        self._bitmap = bytearray(bitmap or b'')
+
+    @classmethod
+    def cache_key(cls, user_id):
+        return cls.CACHE_KEY.format(user_id=user_id)
+
+    @classmethod
+    def for_user(cls, user):
+        """Load the user's seen-set from the cache, rebuilding it on a miss"""
+        stored = cache.get(cls.cache_key(user.pk))
+        if stored is not None:
+            return cls(user.pk, zlib.decompress(stored))
+
+        seen = cls.from_history(user.pk)
+        seen.save()
+        return seen
+
+    @classmethod
+    def from_history(cls, user_id):
+        """Build the seen-set from Recommendation, bypassing the cache"""
+        seen = cls(user_id)
+        movie_ids = (
+            Recommendation.objects
+            .filter(user_id=user_id)
+            .order_by()
+            .values_list('movie_id', flat=True)
+            .distinct()
+        )
+        seen._set_bits(movie_ids)
+        return seen
+
+    @classmethod
+    def invalidate(cls, user_id):
+        """Drop the cached seen-set so it is rebuilt on next use"""
+        cache.delete(cls.cache_key(user_id))
+
+    def __contains__(self, movie_id):
+        byte_index, bit = divmod(movie_id, 8)
+        return byte_index < len(self._bitmap) and bool(self._bitmap[byte_index] & (1 << bit))
+
+    def __len__(self):
+        return sum(bin(byte).count('1') for byte in self._bitmap)
+
+    def add(self, movie_ids):
+        """
+        Mark movies as seen and write the bitmap back to the cache
+        Concurrent requests for the same user may drop each other's bits;
+        the cost is an occasional repeat, never a wrong recommendation
+        """
+        self._set_bits(movie_ids)
+        self.save()
+
+    def save(self):
+        cache.set(
+            self.cache_key(self.user_id),
+            zlib.compress(bytes(self._bitmap)),
+            getattr(settings, 'SEEN_SET_TIMEOUT', 7 * 24 * 60 * 60),
+        )
+
+    def _set_bits(self, movie_ids):
+        for movie_id in movie_ids:
+            byte_index, bit = divmod(movie_id, 8)
+            if byte_index >= len(self._bitmap):
+                self._bitmap.extend(bytes(byte_index + 1 - len(self._bitmap)))
+            self._bitmap[byte_index] |= 1 << bit
@@ -1,13 +1,31 @@
+from functools import lru_cache
+
+from django.core.exceptions import ImproperlyConfigured
 from rest_framework import serializers
+from movieflick.metrics import TimedListSerializer, TimedSerializationMixin, timed_serialization
 from .models import Movie, Recommendation
 from moods.serializers import MoodSerializer
 from django.contrib.auth.models import User
 
 
-class MovieSerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
+    """
+    Lets callers restrict output with a `fields` argument,
+    e.g. RecommendationSerializer(qs, many=True, fields=['id', 'movie'])
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class MovieSerializer(TimedSerializationMixin, serializers.ModelSerializer):
     """Serializer for Movie model"""
     class Meta:
         model = Movie
+        list_serializer_class = TimedListSerializer
         fields = [
             'id', 'title', 'overview', 'release_date', 
             'poster_url', 'backdrop_url', 'rating', 
@@ -16,7 +34,16 @@ class MovieSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
-class RecommendationSerializer(serializers.ModelSerializer):
+class MovieFilterSerializer(serializers.Serializer):
+    """Validates the optional query params of the movie list endpoint"""
+    genre = serializers.IntegerField(required=False)
+    min_rating = serializers.FloatField(required=False, min_value=0, max_value=10)
+    max_rating = serializers.FloatField(required=False, min_value=0, max_value=10)
+    released_after = serializers.DateField(required=False)
+    released_before = serializers.DateField(required=False)
+
+
+class RecommendationSerializer(TimedSerializationMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Recommendation model"""
     movie = MovieSerializer(read_only=True)
     mood = MoodSerializer(read_only=True)
@@ -24,6 +51,7 @@ class RecommendationSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Recommendation
+        list_serializer_class = TimedListSerializer
         fields = [
             'id', 'user', 'movie', 'mood', 
             'recommended_at', 'viewed', 'user_rating'
@@ -31,6 +59,109 @@ class RecommendationSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'user', 'recommended_at']
 
 
+class ValuesSerializer:
+    """
+    Opt-in fast path for read-only list responses
+    Walks `serializer_class` once, compiles its fields into (key, lookup,
+    converter) extractors and then builds each item straight from a
+    `.values()` row. Output is identical to `serializer_class(...).data`
+    """
+    serializer_class = None
+    # StringRelatedField has no column to read; map its output path to one
+    string_lookups = {}
+
+    # DRF fields whose to_representation is a no-op on the value the
+    # database driver already returns
+    PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField)
+
+    def __init__(self, fields=None):
+        self.plan = self.compile(tuple(fields) if fields is not None else None)
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def compile(cls, fields=None):
+        serializer = cls.serializer_class()
+        plan = cls.compile_serializer(serializer, '')
+        if fields is not None:
+            plan = tuple(step for step in plan if step[0] in fields)
+        return plan
+
+    @classmethod
+    def compile_serializer(cls, serializer, prefix):
+        plan = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or '.' in field.source:
+                raise ImproperlyConfigured(f"{cls.__name__} can't compile field '{prefix}{name}'")
+            lookup = prefix + field.source
+            if isinstance(field, serializers.ListSerializer):
+                raise ImproperlyConfigured(f"{cls.__name__} can't compile many=True field '{lookup}'")
+            if isinstance(field, serializers.BaseSerializer):
+                # The FK column stands in for the nested object when it is null
+                plan.append((name, lookup, None, tuple(cls.compile_serializer(field, lookup + '__'))))
+            elif isinstance(field, serializers.StringRelatedField):
+                if lookup not in cls.string_lookups:
+                    raise ImproperlyConfigured(f"{cls.__name__}.string_lookups has no entry for '{lookup}'")
+                plan.append((name, cls.string_lookups[lookup], str, None))
+            elif isinstance(field, serializers.RelatedField):
+                raise ImproperlyConfigured(f"{cls.__name__} can't compile related field '{lookup}'")
+            elif isinstance(field, cls.PASSTHROUGH_FIELDS):
+                plan.append((name, lookup, None, None))
+            elif isinstance(field, serializers.FloatField):
+                plan.append((name, lookup, float, None))
+            else:
+                plan.append((name, lookup, field.to_representation, None))
+        return plan
+
+    @property
+    def value_fields(self):
+        """The `.values()` lookups needed to build each item"""
+        lookups = []
+
+        def collect(plan):
+            for _, lookup, _, nested in plan:
+                lookups.append(lookup)
+                if nested is not None:
+                    collect(nested)
+        collect(self.plan)
+        return lookups
+
+    def to_representation(self, row):
+        return self.extract(self.plan, row)
+
+    def serialize(self, rows):
+        plan = self.plan
+        with timed_serialization():
+            return [self.extract(plan, row) for row in rows]
+
+    @staticmethod
+    def extract(plan, row):
+        data = {}
+        for name, lookup, convert, nested in plan:
+            value = row[lookup]
+            if value is None:
+                data[name] = None
+            elif nested is not None:
+                data[name] = ValuesSerializer.extract(nested, row)
+            elif convert is None:
+                data[name] = value
+            else:
+                data[name] = convert(value)
+        return data
+
+
+class MovieValuesSerializer(ValuesSerializer):
+    """Fast path equivalent of MovieSerializer"""
+    serializer_class = MovieSerializer
+
+
+class RecommendationValuesSerializer(ValuesSerializer):
+    """Fast path equivalent of RecommendationSerializer"""
+    serializer_class = RecommendationSerializer
+    string_lookups = {'user': 'user__username'}
+
+
 class RecommendationCreateSerializer(serializers.Serializer):
     """Serializer for creating recommendations"""
     mood_id = serializers.IntegerField()
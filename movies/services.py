@@ -1,6 +1,380 @@
+import contextvars
+import hashlib
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import chain, islice
+from urllib.parse import urlencode
+
 import requests
 from django.conf import settings
-from .models import Movie
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.db import IntegrityError, connection, connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from movieflick.metrics import record_tmdb_call
+from moods.cache import get_active_moods
+from .models import (
+    Movie,
+    MovieGenre,
+    MoviePayload,
+    MovieQuerySet,
+    MoodCandidate,
+    PrecomputedPick,
+    PrecomputeJob,
+    Recommendation,
+)
+from .seen import SeenSet
+from .throttling import CacheTokenBucket, FileTokenBucket, LocalTokenBucket, SingleFlight
+from .transports import FixtureStore, RecordingTransport, ReplayTransport
+
+
+logger = logging.getLogger(__name__)
+
+
+class TMDBRetry(Retry):
+    """Retry policy that caps TMDB's Retry-After at backoff_max"""
+    
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.backoff_max)
+
+
+_http_session = None
+_http_session_pid = None
+_http_session_lock = threading.Lock()
+
+
+def build_http_session():
+    """
+    Build a keep-alive session for TMDB calls
+    Retries 429/5xx responses with jittered exponential backoff and honors
+    the Retry-After header
+    """
+    retry = TMDBRetry(
+        total=getattr(settings, 'TMDB_MAX_RETRIES', 2),
+        connect=getattr(settings, 'TMDB_MAX_RETRIES', 2),
+        read=0,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({'GET'}),
+        backoff_factor=getattr(settings, 'TMDB_BACKOFF_FACTOR', 0.3),
+        backoff_jitter=getattr(settings, 'TMDB_BACKOFF_JITTER', 0.2),
+        backoff_max=getattr(settings, 'TMDB_BACKOFF_MAX', 5),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    pool_size = getattr(settings, 'TMDB_POOL_SIZE', 10)
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept'] = 'application/json'
+    return session
+
+
+def get_http_session():
+    """
+    Get the pooled TMDB session for this worker process
+    A forked worker builds its own session instead of sharing the parent's sockets
+    """
+    global _http_session, _http_session_pid
+    pid = os.getpid()
+    if _http_session is None or _http_session_pid != pid:
+        with _http_session_lock:
+            if _http_session is None or _http_session_pid != pid:
+                _http_session = build_http_session()
+                _http_session_pid = pid
+    return _http_session
+
+
+def reset_http_session():
+    """Close the pooled session so the next call rebuilds it from settings"""
+    global _http_session, _http_session_pid
+    with _http_session_lock:
+        if _http_session is not None:
+            _http_session.close()
+        _http_session = None
+        _http_session_pid = None
+
+
+class LiveTransport:
+    """Calls the TMDB API over the pooled session"""
+    
+    def __init__(self, service):
+        self.service = service
+    
+    def get(self, endpoint, params):
+        url = f"{self.service._get_base_url()}{endpoint}"
+        params = {**params, 'api_key': self.service._get_api_key()}
+        response = get_http_session().get(url, params=params, timeout=self.service._get_timeout())
+        response.raise_for_status()
+        return response.json()
+
+
+class LocalResponseCache:
+    """
+    In-process LRU cache for TMDB responses
+    Entries expire after their TTL and the least recently used entry is
+    evicted once max_entries is reached
+    """
+    
+    def __init__(self, max_entries=512, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    async def aget(self, key):
+        return self.get(key)
+    
+    async def aset(self, key, value, ttl):
+        self.set(key, value, ttl)
+
+
+class DjangoResponseCache:
+    """
+    TMDB response cache backed by a Django cache alias
+    Use a shared backend (Redis, Memcached, database) so all workers
+    see the same entries; size limits are left to the backend
+    """
+    
+    def __init__(self, alias='default'):
+        self.alias = alias
+    
+    @property
+    def _cache(self):
+        return caches[self.alias]
+    
+    def get(self, key):
+        return self._cache.get(key)
+    
+    def set(self, key, value, ttl):
+        self._cache.set(key, value, ttl)
+    
+    def clear(self):
+        self._cache.clear()
+    
+    async def aget(self, key):
+        return await self._cache.aget(key)
+    
+    async def aset(self, key, value, ttl):
+        await self._cache.aset(key, value, ttl)
+
+
+class TMDBUnavailable(Exception):
+    """TMDB failed or timed out, or the circuit breaker is refusing calls"""
+
+
+class CircuitOpenError(TMDBUnavailable):
+    """Raised without calling TMDB while the circuit breaker is open"""
+
+
+class RateLimited(TMDBUnavailable):
+    """
+    Raised without calling TMDB when no rate limit token frees up within
+    TMDB_RATE_LIMIT_WAIT, or the shared bucket stays locked
+    """
+
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker for TMDB calls
+    Trips open when, over the last `window` calls (at least `min_calls`),
+    the failure rate reaches `error_rate` or the share of calls slower than
+    `slow_call` seconds reaches `slow_rate`. After `cooldown` seconds it lets
+    a single trial call through (half-open) and closes again if it succeeds
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, window=20, min_calls=5, error_rate=0.5, slow_call=2.0,
+                 slow_rate=0.5, cooldown=30.0, clock=time.monotonic):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            window=getattr(settings, 'TMDB_BREAKER_WINDOW', 20),
+            min_calls=getattr(settings, 'TMDB_BREAKER_MIN_CALLS', 5),
+            error_rate=getattr(settings, 'TMDB_BREAKER_ERROR_RATE', 0.5),
+            slow_call=getattr(settings, 'TMDB_BREAKER_SLOW_CALL', 2.0),
+            slow_rate=getattr(settings, 'TMDB_BREAKER_SLOW_RATE', 0.5),
+            cooldown=getattr(settings, 'TMDB_BREAKER_COOLDOWN', 30.0),
+        )
+    
+    @property
+    def is_closed(self):
+        return self.state == self.CLOSED
+    
+    def allow_request(self):
+        """Whether a call may go out now; claims the trial slot when half-open"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self._opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+    
+    def retry_after(self):
+        """Seconds until the breaker lets a trial call through"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0
+            return max(0.0, self.cooldown - (self.clock() - self._opened_at))
+    
+    def release_trial(self):
+        """Free the half-open trial slot without recording an outcome"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+    
+    def record(self, elapsed, failed):
+        """Record the outcome of a call that allow_request() let through"""
+        slow = elapsed >= self.slow_call
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+                if failed or slow:
+                    self._open()
+                else:
+                    self._close()
+                return
+            if self.state == self.OPEN:
+                return
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for failed, _ in self._outcomes if failed)
+            slow_calls = sum(1 for _, slow in self._outcomes if slow)
+            if failures / calls >= self.error_rate or slow_calls / calls >= self.slow_rate:
+                self._open()
+    
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = self.clock()
+        self._outcomes.clear()
+        logger.warning('TMDB circuit breaker opened for %ss', self.cooldown)
+    
+    def _close(self):
+        self.state = self.CLOSED
+        self._outcomes.clear()
+        logger.info('TMDB circuit breaker closed')
+
+
+_fanout_executor = None
+_fanout_executor_pid = None
+_fanout_executor_lock = threading.Lock()
+
+
+def get_fanout_executor():
+    """Get the thread pool used for concurrent genre queries in this worker process"""
+    global _fanout_executor, _fanout_executor_pid
+    pid = os.getpid()
+    if _fanout_executor is None or _fanout_executor_pid != pid:
+        with _fanout_executor_lock:
+            if _fanout_executor is None or _fanout_executor_pid != pid:
+                _fanout_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'TMDB_FANOUT_WORKERS', 8),
+                    thread_name_prefix='tmdb-fanout',
+                )
+                _fanout_executor_pid = pid
+    return _fanout_executor
+
+
+class WorkerFlight:
+    """
+    Lock and result slot in TMDB_SHARED_CACHE_ALIAS for one TMDB request,
+    so a single worker fetches it while the others wait for its result
+    The sync and async fetch paths make the cache calls and sleeps; the
+    decisions are made here
+    """
+    WAIT = object()
+    FETCH = object()
+    
+    def __init__(self, cache_key, wait):
+        self.cache = caches[getattr(settings, 'TMDB_SHARED_CACHE_ALIAS', 'default')]
+        self.lock_key = TMDBService.FLIGHT_KEY.format(key=cache_key)
+        self.result_key = TMDBService.FLIGHT_RESULT_KEY.format(key=cache_key)
+        self.keys = [self.lock_key, self.result_key]
+        self.timeout = math.ceil(wait)
+        self.deadline = time.monotonic() + wait
+        self.poll_interval = getattr(settings, 'TMDB_COALESCE_POLL', 0.02)
+    
+    @classmethod
+    def for_request(cls, cache_key):
+        """The flight for a request, or None when TMDB_COALESCE_WAIT is 0"""
+        wait = getattr(settings, 'TMDB_COALESCE_WAIT', 5.0)
+        return cls(cache_key, wait) if wait > 0 else None
+    
+    def outcome(self, found):
+        """
+        What a waiter does after reading `keys` (found, as from get_many):
+        the holder's result, FETCH once the lock is gone without one or the
+        wait ran out, else WAIT and poll again
+        """
+        if self.result_key in found:
+            # Another worker reached TMDB, which proves nothing about the
+            # breaker's trial: hand back the slot this caller may hold
+            TMDBService.get_circuit_breaker().release_trial()
+            return found[self.result_key]
+        if self.lock_key not in found or time.monotonic() >= self.deadline:
+            return self.FETCH
+        return self.WAIT
 
 
 class TMDBService:
@@ -17,6 +391,26 @@ class TMDBService:
         'Romantic': [10749, 18],  # Romance, Drama
     }
     
+    # Response cache TTLs in seconds, per endpoint
+    CACHE_TTLS = {
+        '/discover/movie': 15 * 60,
+        '/genre/movie/list': 24 * 60 * 60,
+    }
+    DEFAULT_CACHE_TTL = 5 * 60
+    
+    _response_cache = None
+    _transport = None
+    _circuit_breaker = None
+    # None until built from settings, False when rate limiting is off
+    _rate_limiter = None
+    _single_flight = SingleFlight()
+    
+    REVALIDATE_LOCK_KEY = 'tmdb:revalidate:{key}'
+    FLIGHT_KEY = 'tmdb:flight:{key}'
+    FLIGHT_RESULT_KEY = 'tmdb:flight:{key}:result'
+    STALE_KEY = 'stale:{key}'
+    RATE_LIMIT_KEY = 'tmdb:ratelimit'
+    
     @classmethod
     def _get_api_key(cls):
         """Get TMDB API key from settings"""
@@ -26,59 +420,476 @@ class TMDBService:
         return api_key
     
     @classmethod
-    def _make_request(cls, endpoint, params=None):
-        """Make a request to TMDB API"""
-        api_key = cls._get_api_key()
-        url = f"{cls.BASE_URL}{endpoint}"
+    def _get_base_url(cls):
+        """Get TMDB base URL, overridable via TMDB_BASE_URL (e.g. for a local stub)"""
+        return getattr(settings, 'TMDB_BASE_URL', '') or cls.BASE_URL
+    
+    @classmethod
+    def _get_timeout(cls):
+        """Get the (connect, read) timeout pair for TMDB calls"""
+        return (
+            getattr(settings, 'TMDB_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'TMDB_READ_TIMEOUT', 10),
+        )
+    
+    @classmethod
+    def get_response_cache(cls):
+        """
+        Get the response cache configured by TMDB_CACHE_BACKEND
+        Returns None when caching is disabled
+        """
+        if cls._response_cache is None:
+            backend = getattr(settings, 'TMDB_CACHE_BACKEND', 'local')
+            if backend == 'local':
+                cls._response_cache = LocalResponseCache(
+                    max_entries=getattr(settings, 'TMDB_CACHE_MAX_ENTRIES', 512)
+                )
+            elif backend == 'django':
+                cls._response_cache = DjangoResponseCache(
+                    alias=getattr(settings, 'TMDB_CACHE_ALIAS', 'default')
+                )
+            elif backend != 'none':
+                raise ValueError(f"Unknown TMDB_CACHE_BACKEND: {backend}")
+        return cls._response_cache
+    
+    @classmethod
+    def set_response_cache(cls, cache):
+        """Replace the response cache (any object with get/set/clear)"""
+        cls._response_cache = cache
+    
+    @classmethod
+    def get_transport(cls):
+        """
+        Get the transport configured by TMDB_TRANSPORT: 'live', 'record'
+        (live, saving responses to TMDB_FIXTURE_DIR) or 'replay' (offline,
+        from TMDB_FIXTURE_DIR, delayed by TMDB_REPLAY_LATENCY)
+        """
+        if cls._transport is None:
+            mode = getattr(settings, 'TMDB_TRANSPORT', 'live')
+            live = LiveTransport(cls)
+            if mode == 'live':
+                cls._transport = live
+            else:
+                store = FixtureStore(
+                    getattr(settings, 'TMDB_FIXTURE_DIR', 'tmdb_fixtures'),
+                    compression=getattr(settings, 'TMDB_FIXTURE_COMPRESSION', 'zlib'),
+                )
+                if mode == 'record':
+                    cls._transport = RecordingTransport(live, store, cls._cache_key)
+                elif mode == 'replay':
+                    latency = getattr(settings, 'TMDB_REPLAY_LATENCY', 0.0)
+                    if latency != ReplayTransport.RECORDED:
+                        latency = float(latency)
+                    cls._transport = ReplayTransport(store, cls._cache_key, latency=latency)
+                else:
+                    raise ValueError(f"Unknown TMDB_TRANSPORT: {mode}")
+        return cls._transport
+    
+    @classmethod
+    def set_transport(cls, transport):
+        """Replace the transport (any object with get(endpoint, params)); None rebuilds it from settings"""
+        cls._transport = transport
+    
+    @classmethod
+    def get_circuit_breaker(cls):
+        """Get this process's TMDB circuit breaker"""
+        if cls._circuit_breaker is None:
+            cls._circuit_breaker = CircuitBreaker.from_settings()
+        return cls._circuit_breaker
+    
+    @classmethod
+    def set_circuit_breaker(cls, breaker):
+        """Replace the circuit breaker; None rebuilds it from settings"""
+        cls._circuit_breaker = breaker
+    
+    @classmethod
+    def get_rate_limiter(cls):
+        """
+        Get the outbound token bucket configured by TMDB_RATE_LIMIT (calls per
+        second, 0 disables) and TMDB_RATE_LIMIT_BACKEND: 'cache' (shared through
+        TMDB_SHARED_CACHE_ALIAS), 'file' (flock on TMDB_RATE_LIMIT_FILE, shared
+        by workers on one host) or 'local' (this process only)
+        Returns None when rate limiting is off
+        """
+        if cls._rate_limiter is None:
+            rate = float(getattr(settings, 'TMDB_RATE_LIMIT', 0))
+            burst = float(getattr(settings, 'TMDB_RATE_LIMIT_BURST', 0) or rate)
+            backend = getattr(settings, 'TMDB_RATE_LIMIT_BACKEND', 'cache')
+            if rate <= 0:
+                cls._rate_limiter = False
+            elif backend == 'cache':
+                cls._rate_limiter = CacheTokenBucket(
+                    alias=getattr(settings, 'TMDB_SHARED_CACHE_ALIAS', 'default'),
+                    key=cls.RATE_LIMIT_KEY, rate=rate, burst=burst,
+                )
+            elif backend == 'file':
+                path = getattr(settings, 'TMDB_RATE_LIMIT_FILE', '') or os.path.join(
+                    tempfile.gettempdir(), 'movieflick-tmdb-ratelimit'
+                )
+                cls._rate_limiter = FileTokenBucket(path, rate=rate, burst=burst)
+            elif backend == 'local':
+                cls._rate_limiter = LocalTokenBucket(rate, burst=burst)
+            else:
+                raise ValueError(f"Unknown TMDB_RATE_LIMIT_BACKEND: {backend}")
+        return cls._rate_limiter or None
+    
+    @classmethod
+    def set_rate_limiter(cls, limiter):
+        """Replace the rate limiter (any object with reserve(max_wait)); None rebuilds it from settings"""
+        cls._rate_limiter = limiter
+    
+    @classmethod
+    def get_stale_store(cls):
+        """
+        Last-known-good responses, kept for TMDB_STALE_TTL in a shared cache
+        so they can be served while TMDB is down
+        """
+        return DjangoResponseCache(alias=getattr(settings, 'TMDB_STALE_CACHE_ALIAS', 'default'))
+    
+    @classmethod
+    def get_stale_ttl(cls):
+        return getattr(settings, 'TMDB_STALE_TTL', 7 * 24 * 60 * 60)
+    
+    @classmethod
+    def get_cache_ttl(cls, endpoint):
+        """Get the cache TTL in seconds for an endpoint"""
+        ttls = {**cls.CACHE_TTLS, **getattr(settings, 'TMDB_CACHE_TTLS', {})}
+        return ttls.get(endpoint, cls.DEFAULT_CACHE_TTL)
+    
+    @staticmethod
+    def _cache_key(endpoint, params):
+        """
+        Build a cache key from the endpoint and normalized params
+        The api_key is left out so rotating keys doesn't invalidate the cache
+        """
+        normalized = sorted(
+            (str(key), str(value))
+            for key, value in (params or {}).items()
+            if key != 'api_key' and value is not None
+        )
+        digest = hashlib.sha1(
+            f"{endpoint}?{urlencode(normalized)}".encode()
+        ).hexdigest()
+        return f"tmdb:{digest}"
+    
+    @classmethod
+    def _prepare_request(cls, endpoint, params, use_cache):
+        """
+        Normalize a call for _make_request and its async twin
+        Returns (params, cache_key, cache, ttl); cache is None when the
+        response isn't to be cached
+        """
+        params = dict(params or {})
+        ttl = cls.get_cache_ttl(endpoint)
+        cache = cls.get_response_cache() if use_cache and ttl > 0 else None
+        return params, cls._cache_key(endpoint, params), cache, ttl
+    
+    @classmethod
+    def _claim_trial(cls):
+        """Raise CircuitOpenError unless the breaker lets this call through"""
+        if not cls.get_circuit_breaker().allow_request():
+            raise CircuitOpenError('TMDB API is unavailable (circuit open)')
+    
+    @classmethod
+    def _make_request(cls, endpoint, params=None, use_cache=True):
+        """
+        Make a request to TMDB API, serving from the response cache when possible
+        While the circuit breaker is open, or when the call fails, the
+        last-known-good response is served instead and refreshed in the
+        background; without one, TMDBUnavailable is raised
+        """
+        params, cache_key, cache, ttl = cls._prepare_request(endpoint, params, use_cache)
+        if cache is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
         
-        if params is None:
-            params = {}
-        params['api_key'] = api_key
+        stale_key = cls.STALE_KEY.format(key=cache_key)
+        if not cls.get_circuit_breaker().is_closed:
+            stale = cls.get_stale_store().get(stale_key)
+            if stale is not None:
+                cls.schedule_revalidate(endpoint, params)
+                return stale
+            cls._claim_trial()
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            return response.json()
+            data = cls._fetch_coalesced(endpoint, params, cache_key)
+        except TMDBUnavailable:
+            stale = cls.get_stale_store().get(stale_key)
+            if stale is None:
+                raise
+            return stale
+        
+        if cache is not None:
+            cache.set(cache_key, data, ttl)
+        return data
+    
+    @classmethod
+    def _fetch_coalesced(cls, endpoint, params, cache_key):
+        """
+        _fetch, shared with identical calls already in flight in this process
+        or another worker (unless TMDB_COALESCE is off)
+        """
+        if not getattr(settings, 'TMDB_COALESCE', True):
+            return cls._fetch(endpoint, params, cache_key)
+        return cls._single_flight.do(cache_key, cls._fetch_across_workers, endpoint, params, cache_key)
+    
+    @classmethod
+    def _fetch_across_workers(cls, endpoint, params, cache_key):
+        """
+        Fetch as the one worker holding the flight lock for this request, or
+        wait up to TMDB_COALESCE_WAIT for the holder's result (0 disables)
+        Waiters fetch for themselves if the holder fails or runs out the clock
+        """
+        flight = WorkerFlight.for_request(cache_key)
+        if flight is None:
+            return cls._fetch(endpoint, params, cache_key)
+        
+        if not flight.cache.add(flight.lock_key, True, flight.timeout):
+            while True:
+                outcome = flight.outcome(flight.cache.get_many(flight.keys))
+                if outcome is WorkerFlight.FETCH:
+                    return cls._fetch(endpoint, params, cache_key)
+                if outcome is not WorkerFlight.WAIT:
+                    return outcome
+                time.sleep(flight.poll_interval)
+        
+        try:
+            data = cls._fetch(endpoint, params, cache_key)
+            # Published before the lock goes, so waiters that see it gone find the result
+            flight.cache.set(flight.result_key, data, flight.timeout)
+            return data
+        finally:
+            flight.cache.delete(flight.lock_key)
+    
+    @classmethod
+    def reserve_token(cls):
+        """
+        Take an outbound rate limit token and return how long to wait for it
+        (0 when rate limiting is off); raises RateLimited rather than wait
+        past TMDB_RATE_LIMIT_WAIT
+        """
+        limiter = cls.get_rate_limiter()
+        if limiter is None:
+            return 0
+        delay = limiter.reserve(getattr(settings, 'TMDB_RATE_LIMIT_WAIT', 5.0))
+        if delay is None:
+            raise RateLimited('TMDB API is unavailable (outbound rate limit reached)')
+        return delay
+    
+    @classmethod
+    def throttle(cls):
+        """Wait for an outbound rate limit token (see reserve_token)"""
+        delay = cls.reserve_token()
+        if delay > 0:
+            time.sleep(delay)
+    
+    @classmethod
+    @contextmanager
+    def _tracked_call(cls):
+        """
+        Time the TMDB call made in the block for the circuit breaker and the
+        request metrics; transport errors are raised as TMDBUnavailable
+        """
+        breaker = cls.get_circuit_breaker()
+        start = time.perf_counter()
+        try:
+            yield
         except requests.exceptions.RequestException as e:
-            raise Exception(f"TMDB API request failed: {str(e)}")
+            breaker.record(time.perf_counter() - start, failed=True)
+            raise TMDBUnavailable(f"TMDB API request failed: {str(e)}")
+        finally:
+            record_tmdb_call(time.perf_counter() - start)
+        breaker.record(time.perf_counter() - start, failed=False)
+    
+    @classmethod
+    def _fetch(cls, endpoint, params, cache_key):
+        """Call TMDB through the rate limiter and transport, feeding the circuit breaker and the stale store"""
+        cls.throttle()
+        with cls._tracked_call():
+            data = cls.get_transport().get(endpoint, params)
+        cls.get_stale_store().set(cls.STALE_KEY.format(key=cache_key), data, cls.get_stale_ttl())
+        return data
+    
+    @classmethod
+    def schedule_revalidate(cls, endpoint, params):
+        """
+        Refresh a stale response on a background thread
+        At most one refresh per request runs per TMDB_STALE_REVALIDATE_INTERVAL;
+        it only reaches TMDB once the breaker lets a trial call through
+        """
+        cache_key = cls._cache_key(endpoint, params)
+        interval = getattr(settings, 'TMDB_STALE_REVALIDATE_INTERVAL', 10)
+        if not caches['default'].add(cls.REVALIDATE_LOCK_KEY.format(key=cache_key), True, interval):
+            return False
+        
+        thread = threading.Thread(
+            target=cls._revalidate,
+            args=(endpoint, params, cache_key),
+            name='tmdb-revalidate',
+            daemon=True,
+        )
+        thread.start()
+        return True
+    
+    @classmethod
+    def _revalidate(cls, endpoint, params, cache_key):
+        if not cls.get_circuit_breaker().allow_request():
+            return
+        try:
+            data = cls._fetch_coalesced(endpoint, params, cache_key)
+        except TMDBUnavailable:
+            logger.warning('Background refresh of %s failed', endpoint)
+            return
+        cache = cls.get_response_cache()
+        ttl = cls.get_cache_ttl(endpoint)
+        if cache is not None and ttl > 0:
+            cache.set(cache_key, data, ttl)
     
     @classmethod
     def get_genres_for_mood(cls, mood_name):
         """Get genre IDs for a given mood"""
         return cls.MOOD_GENRE_MAP.get(mood_name, [18])  # Default to Drama if mood not found
     
+    @staticmethod
+    def discover_params(genre_id, page=1):
+        """Query params for one page of discover results for a single genre"""
+        return {
+            'with_genres': genre_id,
+            'sort_by': 'popularity.desc',
+            'page': page,
+        }
+    
     @classmethod
-    def fetch_movies_by_mood(cls, mood_name, count=2):
+    def discover_by_genre(cls, genre_id, page=1):
+        """Fetch one page of discover results for a single genre"""
+        response_data = cls._make_request('/discover/movie', cls.discover_params(genre_id, page))
+        return response_data.get('results', [])
+    
+    @classmethod
+    def fetch_movies_by_mood(cls, mood_name, count=2, fan_out=None, page=1):
         """
         Fetch movies from TMDB based on mood
-        Returns list of movie data dictionaries
+        Returns list of movie data dictionaries (count=None for the whole page)
+        With fan_out (default TMDB_FANOUT_GENRES) every mapped genre is queried
+        concurrently and the results are merged and ranked
         """
         genre_ids = cls.get_genres_for_mood(mood_name)
-        
-        # Use the first genre for the query (TMDB allows multiple genres with '|')
-        # For simplicity, we'll use the first genre
-        primary_genre = genre_ids[0] if genre_ids else 18
-        
-        params = {
-            'with_genres': primary_genre,
-            'sort_by': 'popularity.desc',
-            'page': 1,
-        }
+        if fan_out is None:
+            fan_out = getattr(settings, 'TMDB_FANOUT_GENRES', False)
         
         try:
-            response_data = cls._make_request('/discover/movie', params)
-            movies = response_data.get('results', [])
+            if fan_out and len(genre_ids) > 1:
+                movies = cls._fetch_genres_concurrently(genre_ids, page=page)
+            else:
+                # Only query the primary genre
+                primary_genre = genre_ids[0] if genre_ids else 18
+                movies = cls.discover_by_genre(primary_genre, page=page)
             
             # Limit to requested count (2 movies)
             return movies[:count]
+        except TMDBUnavailable:
+            raise
         except Exception as e:
             raise Exception(f"Failed to fetch movies: {str(e)}")
     
     @classmethod
-    def create_or_update_movie(cls, tmdb_movie_data):
+    def fetch_pages_by_mood(cls, mood_name, pages, fan_out=None):
         """
-        Create or update a Movie object from TMDB API data
-        Returns the Movie instance
+        Fetch several discover pages for a mood in one concurrent round
+        Returns the ranked, de-duplicated results of every page that answered
+        within TMDB_FANOUT_DEADLINE
+        """
+        return cls._fetch_genres_concurrently(cls.genres_to_query(mood_name, fan_out), pages=pages)
+    
+    @classmethod
+    def genres_to_query(cls, mood_name, fan_out=None):
+        """Every genre of the mood with fan_out (default TMDB_FANOUT_GENRES), else just the primary one"""
+        genre_ids = cls.get_genres_for_mood(mood_name)
+        if fan_out is None:
+            fan_out = getattr(settings, 'TMDB_FANOUT_GENRES', False)
+        return genre_ids if fan_out else genre_ids[:1] or [18]
+    
+    @classmethod
+    def _fetch_genres_concurrently(cls, genre_ids, page=1, pages=None):
+        """
+        Query each genre (on each of `pages`, default just `page`) in parallel
+        under one overall deadline (TMDB_FANOUT_DEADLINE)
+        Queries that fail or miss the deadline are dropped; raises only if all of them do
+        """
+        deadline = getattr(settings, 'TMDB_FANOUT_DEADLINE', 5.0)
+        pages = list(pages or [page])
+        executor = get_fanout_executor()
+        # Run each call in a copy of this context so request metrics see it
+        futures = {
+            executor.submit(contextvars.copy_context().run, cls.discover_by_genre, genre_id, page): (page, genre_id)
+            for page in pages
+            for genre_id in genre_ids
+        }
+        done, not_done = wait(futures, timeout=deadline)
+        for future in not_done:
+            future.cancel()
+        return cls.merge_fan_out({futures[future]: future for future in done}, genre_ids, pages, deadline)
+    
+    @classmethod
+    def merge_fan_out(cls, done, genre_ids, pages, deadline):
+        """
+        Rank the results of the fan-out queries in `done`, a dict of finished
+        futures (or tasks) by (page, genre_id); raises if none of them succeeded
+        """
+        results_by_query = {}
+        errors = []
+        for query, future in done.items():
+            try:
+                results_by_query[query] = future.result()
+            except Exception as e:
+                errors.append(str(e))
+        
+        if not results_by_query:
+            reason = '; '.join(errors) or f"no genre responded within {deadline}s"
+            raise TMDBUnavailable(f"All genre queries failed: {reason}")
+        
+        # Merge in page and mood genre order so ties keep the primary genre first
+        ordered_results = [
+            results_by_query[(page, genre_id)]
+            for page in pages
+            for genre_id in genre_ids
+            if (page, genre_id) in results_by_query
+        ]
+        return cls.rank_movies(ordered_results, genre_ids)
+    
+    @staticmethod
+    def rank_movies(result_lists, genre_ids):
+        """
+        Merge discover result lists, de-duplicating by TMDB id
+        Movies matching more of the mood's genres rank first, then by popularity
+        """
+        wanted = set(genre_ids)
+        merged = {}
+        for results in result_lists:
+            for movie in results:
+                tmdb_id = movie.get('id')
+                if tmdb_id is not None and tmdb_id not in merged:
+                    merged[tmdb_id] = movie
+        
+        def score(item):
+            position, movie = item
+            overlap = len(wanted.intersection(movie.get('genre_ids') or []))
+            return (-overlap, -(movie.get('popularity') or 0), position)
+        
+        ranked = sorted(enumerate(merged.values()), key=score)
+        return [movie for _, movie in ranked]
+    
+    # Movie columns refreshed when an existing tmdb_id is upserted
+    MOVIE_UPDATE_FIELDS = [
+        'title', 'overview', 'release_date', 'poster_url', 'backdrop_url',
+        'rating', 'genre_ids', 'updated_at',
+    ]
+    
+    @classmethod
+    def build_movie(cls, tmdb_movie_data):
+        """
+        Build an unsaved Movie object from TMDB API data
         """
         tmdb_id = tmdb_movie_data.get('id')
         if not tmdb_id:
@@ -96,26 +907,579 @@ class TMDBService:
         release_date = tmdb_movie_data.get('release_date')
         if release_date:
             try:
-                from datetime import datetime
                 release_date = datetime.strptime(release_date, '%Y-%m-%d').date()
             except (ValueError, TypeError):
                 release_date = None
         else:
             release_date = None
         
-        movie, created = Movie.objects.update_or_create(
+        return Movie(
             tmdb_id=tmdb_id,
-            defaults={
-                'title': tmdb_movie_data.get('title', ''),
-                'overview': tmdb_movie_data.get('overview', ''),
-                'release_date': release_date,
-                'poster_url': poster_url,
-                'backdrop_url': backdrop_url,
-                'rating': tmdb_movie_data.get('vote_average'),
-                'genre_ids': tmdb_movie_data.get('genre_ids', []),
-                'external_api_data': tmdb_movie_data,
-            }
+            title=tmdb_movie_data.get('title', ''),
+            overview=tmdb_movie_data.get('overview', ''),
+            release_date=release_date,
+            poster_url=poster_url,
+            backdrop_url=backdrop_url,
+            rating=tmdb_movie_data.get('vote_average'),
+            genre_ids=tmdb_movie_data.get('genre_ids', []),
+            external_api_data=tmdb_movie_data,
         )
+    
+    @classmethod
+    def create_or_update_movies(cls, tmdb_movies_data):
+        """
+        Create or update Movie objects from a list of TMDB API data
+        Upserts every movie in a single INSERT ... ON CONFLICT statement, then
+        the raw payloads and the MovieGenre index rows in bulk, and returns the
+        Movie instances in input order
+        """
+        # The same tmdb_id twice in one statement is an error on PostgreSQL,
+        # so keep the last occurrence of each
+        movies_by_tmdb_id = {}
+        for tmdb_movie_data in tmdb_movies_data:
+            movie = cls.build_movie(tmdb_movie_data)
+            movie.tmdb_id = int(movie.tmdb_id)
+            movies_by_tmdb_id[movie.tmdb_id] = movie
+        if not movies_by_tmdb_id:
+            return []
+        
+        # savepoint=False: when nested in a caller's transaction, skip the extra savepoint
+        with transaction.atomic(savepoint=False):
+            Movie.objects.bulk_create(
+                list(movies_by_tmdb_id.values()),
+                update_conflicts=True,
+                unique_fields=['tmdb_id'],
+                update_fields=cls.MOVIE_UPDATE_FIELDS,
+            )
+            # Re-read so existing rows keep their original pk and created_at
+            saved = (
+                Movie.objects.lean()
+                .order_by()
+                .in_bulk(list(movies_by_tmdb_id), field_name='tmdb_id')
+            )
+            payloads = []
+            genres = []
+            for tmdb_id, movie in movies_by_tmdb_id.items():
+                movie.pk = saved[tmdb_id].pk
+                payloads.append(movie.build_payload())
+                genres.extend(movie.build_genres())
+            MoviePayload.objects.bulk_create(
+                payloads,
+                update_conflicts=True,
+                unique_fields=['movie'],
+                update_fields=['encoding', 'data', 'updated_at'],
+            )
+            MovieGenre.objects.filter(movie_id__in=[movie.pk for movie in saved.values()]).delete()
+            MovieGenre.objects.bulk_create(genres)
+        
+        return [saved[int(data['id'])] for data in tmdb_movies_data]
+    
+    @classmethod
+    def create_or_update_movie(cls, tmdb_movie_data):
+        """
+        Create or update a Movie object from TMDB API data
+        Returns the Movie instance
+        """
+        return cls.create_or_update_movies([tmdb_movie_data])[0]
+
+
+class CandidatePool:
+    """
+    Local pool of pre-fetched movies per mood
+    Recommendations are served from the pool with an indexed query; TMDB is
+    only used to refill it, in the background or via refresh_candidate_pool
+    """
+    
+    REFILL_LOCK_KEY = 'candidate-pool:refill:{mood_id}'
+    
+    @classmethod
+    def refresh(cls, mood, pages=1):
+        """
+        Fetch `pages` discover pages for every genre of the mood and replace
+        the mood's candidates with the ranked result
+        Returns the number of candidates stored
+        """
+        # Every genre of the mood on every page, in one concurrent round
+        ranked = TMDBService.fetch_pages_by_mood(mood.name, range(1, pages + 1), fan_out=True)
+        
+        with transaction.atomic():
+            movies = TMDBService.create_or_update_movies(ranked)
+            MoodCandidate.objects.filter(mood=mood).delete()
+            MoodCandidate.objects.bulk_create([
+                MoodCandidate(
+                    mood=mood,
+                    movie=movie,
+                    rank=rank,
+                    popularity=tmdb_movie_data.get('popularity') or 0,
+                )
+                for rank, (movie, tmdb_movie_data) in enumerate(zip(movies, ranked), start=1)
+            ])
+            # Precomputed batches were picked from the old pool
+            PrecomputeQueue.invalidate_mood(mood)
+        return len(movies)
+    
+    @classmethod
+    def pick(cls, mood, count, exclude=(), skip=()):
+        """
+        Get the best `count` candidate movies for a mood, skipping movie ids in
+        `exclude` (e.g. a SeenSet) or `skip`
+        Walks the pool in rank order one chunk at a time, so users who have
+        seen the top of the pool only cost a few extra indexed range queries
+        """
+        chunk_size = max(count, getattr(settings, 'CANDIDATE_POOL_SCAN_CHUNK', 50))
+        movies = []
+        last_rank = 0
+        while len(movies) < count:
+            candidates = list(
+                MoodCandidate.objects
+                .filter(mood=mood, rank__gt=last_rank)
+                .select_related('movie')
+                .defer(*[f'movie__{name}' for name in MovieQuerySet.HEAVY_FIELDS])
+                .order_by('rank')[:chunk_size]
+            )
+            for candidate in candidates:
+                if candidate.movie_id not in exclude and candidate.movie_id not in skip:
+                    movies.append(candidate.movie)
+                    if len(movies) == count:
+                        break
+            if len(candidates) < chunk_size:
+                break
+            last_rank = candidates[-1].rank
+        return movies
+    
+    @classmethod
+    def pick_from_catalog(cls, mood, count, exclude=(), skip=()):
+        """
+        Get up to `count` movies from the whole local catalog that share the
+        mood's genres, skipping movie ids in `exclude` or `skip`
+        An indexed MovieGenre join, used when the ranked pool runs short
+        """
+        genre_ids = TMDBService.get_genres_for_mood(mood.name)
+        chunk_size = max(count, getattr(settings, 'CANDIDATE_POOL_SCAN_CHUNK', 50))
+        queryset = Movie.objects.lean().with_genres(genre_ids)
+        movies = []
+        offset = 0
+        while len(movies) < count:
+            chunk = list(queryset[offset:offset + chunk_size])
+            movies.extend(
+                movie for movie in chunk
+                if movie.pk not in exclude and movie.pk not in skip
+            )
+            if len(chunk) < chunk_size:
+                break
+            offset += chunk_size
+        return movies[:count]
+    
+    @classmethod
+    def schedule_refill(cls, mood):
+        """
+        Refill the mood's pool on a background thread
+        At most one refill per mood runs per CANDIDATE_POOL_REFRESH_INTERVAL
+        across all workers sharing the default cache
+        """
+        if not getattr(settings, 'CANDIDATE_POOL_BACKGROUND_REFILL', True):
+            return False
+        interval = getattr(settings, 'CANDIDATE_POOL_REFRESH_INTERVAL', 60 * 60)
+        if not cache.add(cls.REFILL_LOCK_KEY.format(mood_id=mood.id), True, interval):
+            return False
+        
+        thread = threading.Thread(
+            target=cls._refill,
+            args=(mood,),
+            name=f'candidate-pool-refill-{mood.id}',
+            daemon=True,
+        )
+        thread.start()
+        return True
+    
+    @classmethod
+    def _refill(cls, mood):
+        try:
+            cls.refresh(mood, pages=getattr(settings, 'CANDIDATE_POOL_PAGES', 1))
+        except Exception:
+            logger.exception('Candidate pool refill failed for mood %s', mood.name)
+            cache.delete(cls.REFILL_LOCK_KEY.format(mood_id=mood.id))
+        finally:
+            connection.close()
+
+
+class RecommendationService:
+    """Service class for generating and recording recommendations"""
+    
+    @classmethod
+    def recommend(cls, user, mood, count=2):
+        """
+        Pick movies the user hasn't been recommended yet and record them
+        Serves the user's precomputed batch when one is ready, else the local
+        candidate pool, then the rest of the local catalog; a short local pick
+        is served as is while the pool refills in the background. Only when
+        nothing local is left are TMDB discover pages fetched, in one
+        concurrent round (see fetch_unseen_movie_data)
+        Returns (movies, recommendations); both are empty if no movies were found
+        """
+        seen, movies, recommendations = cls.serve_local(user, mood, count)
+        if not movies:
+            tmdb_movies_data = cls.fetch_unseen_movie_data(mood, count, seen)
+            movies, recommendations = cls.serve_fetched(user, mood, seen, tmdb_movies_data)
+        return movies, recommendations
+    
+    @classmethod
+    def serve_local(cls, user, mood, count):
+        """
+        Record up to `count` movies picked from local data (see pick_local)
+        Claiming a precomputed batch and recording it share one transaction
+        Returns (seen, movies, recommendations); nothing is recorded when no
+        local movie is left
+        """
+        with transaction.atomic():
+            seen, movies = cls.pick_local(user, mood, count)
+            if not movies:
+                return seen, [], []
+            movies, recommendations = cls.record(user, mood, movies=movies)
+        seen.add(movie.pk for movie in movies)
+        return seen, movies, recommendations
+    
+    @classmethod
+    def serve_fetched(cls, user, mood, seen, tmdb_movies_data):
+        """
+        Record movies fetched from TMDB, or, when there are none, queue a
+        precompute job so the worker walks deeper pages before the next click
+        """
+        if not tmdb_movies_data:
+            PrecomputeQueue.enqueue([user.pk], [mood.pk])
+            return [], []
+        movies, recommendations = cls.record(user, mood, tmdb_movies_data)
+        seen.add(movie.pk for movie in movies)
+        return movies, recommendations
+    
+    @classmethod
+    def pick_local(cls, user, mood, count):
+        """
+        The user's precomputed batch if one is ready, else unseen movies from
+        the candidate pool, then from the rest of the local catalog; returns
+        (seen, movies) with up to `count` movies
+        """
+        seen = SeenSet.for_user(user)
+        movies = PrecomputedBatch.pop(user, mood, count, seen)
+        if movies:
+            return seen, movies
+        # Look past this pick: fewer than CANDIDATE_POOL_LOW_WATER unseen
+        # candidates left after it means the pool is running low for this user
+        low_water = getattr(settings, 'CANDIDATE_POOL_LOW_WATER', 10)
+        movies = CandidatePool.pick(mood, count + low_water, exclude=seen)
+        if len(movies) < count + low_water:
+            # Not while this transaction's locks are held, nor if it rolls back
+            transaction.on_commit(lambda: CandidatePool.schedule_refill(mood))
+        movies = movies[:count]
+        if len(movies) < count:
+            movies += CandidatePool.pick_from_catalog(
+                mood, count - len(movies), exclude=seen, skip={movie.pk for movie in movies}
+            )
+        return seen, movies
+    
+    @classmethod
+    def fetch_unseen_movie_data(cls, mood, count, seen):
+        """
+        Fetch the first RECOMMEND_SYNC_PAGES discover pages for the mood in one
+        concurrent round and return up to `count` unseen movies' TMDB data
+        Nothing is written; deeper pages are left to the precompute worker
+        """
+        pages = range(1, getattr(settings, 'RECOMMEND_SYNC_PAGES', 2) + 1)
+        return cls.unseen_movie_data(TMDBService.fetch_pages_by_mood(mood.name, pages), count, seen)
+    
+    @classmethod
+    def unseen_movie_data(cls, tmdb_movies_data, count, seen):
+        """
+        Up to `count` entries of TMDB data whose movie isn't in `seen`
+        Movies not stored locally yet can't have been recommended
+        """
+        movie_ids = dict(cls.stored_movie_ids(tmdb_movies_data))
+        return cls.select_unseen(tmdb_movies_data, movie_ids, count, seen)
+    
+    @staticmethod
+    def stored_movie_ids(tmdb_movies_data):
+        """Query of (tmdb_id, pk) for the movies in the TMDB data already stored locally"""
+        tmdb_ids = [data['id'] for data in tmdb_movies_data if data.get('id')]
+        return Movie.objects.filter(tmdb_id__in=tmdb_ids).order_by().values_list('tmdb_id', 'pk')
+    
+    @staticmethod
+    def select_unseen(tmdb_movies_data, movie_ids, count, seen):
+        """unseen_movie_data, given the local pk of each stored TMDB id"""
+        found = {}
+        for data in tmdb_movies_data:
+            tmdb_id = data.get('id')
+            movie_id = movie_ids.get(tmdb_id)
+            if tmdb_id and tmdb_id not in found and (movie_id is None or movie_id not in seen):
+                found[tmdb_id] = data
+                if len(found) == count:
+                    break
+        return list(found.values())
+    
+    @classmethod
+    def create_recommendations(cls, user, mood, movies):
+        """Create one Recommendation per saved movie in a single INSERT"""
+        now = timezone.now()
+        return Recommendation.objects.bulk_create([
+            Recommendation(user=user, movie=movie, mood=mood, recommended_at=now)
+            for movie in movies
+        ])
+    
+    @classmethod
+    def record(cls, user, mood, tmdb_movies_data=(), movies=()):
+        """
+        Upsert the TMDB movies, create one Recommendation per movie (saved
+        `movies` first) and queue the user's next batches
+        All writes share a single transaction, so the query count does not
+        depend on how many movies are recommended
+        """
+        with transaction.atomic():
+            movies = [*movies, *TMDBService.create_or_update_movies(tmdb_movies_data)]
+            recommendations = cls.create_recommendations(user, mood, movies)
+            PrecomputeQueue.enqueue_user(user)
+        return movies, recommendations
+
+
+def precompute_enabled():
+    return getattr(settings, 'PRECOMPUTE_RECOMMENDATIONS', True)
+
+
+class PrecomputedBatch:
+    """
+    Each user's next recommendations per mood, picked ahead of time by
+    precompute_worker so a recommend click costs one indexed read
+    """
+    
+    @classmethod
+    def pop(cls, user, mood, count, seen):
+        """
+        Take the user's next `count` movies for the mood, or [] on a miss
+        The same movies are dropped from the user's other moods' batches; a
+        batch served concurrently or gone stale (already seen) is a miss
+        """
+        if not precompute_enabled():
+            return []
+        movie_ids = cls._claim(user, mood, count)
+        if len(movie_ids) < count or any(movie_id in seen for movie_id in movie_ids):
+            return []
+        movies = Movie.objects.lean().in_bulk(movie_ids)
+        if len(movies) < count:
+            return []
+        return [movies[movie_id] for movie_id in movie_ids]
+    
+    @classmethod
+    def _claim(cls, user, mood, count):
+        """
+        Delete the user's next `count` picks for the mood, and the same movies'
+        picks for their other moods, and return the movie ids in rank order
+        Nothing is deleted when the batch holds fewer than `count` picks
+        One DELETE ... RETURNING statement where the database supports it, so
+        concurrent pops can't both claim a pick
+        """
+        db_connection = connections[router.db_for_write(PrecomputedPick)]
+        if not db_connection.features.can_return_columns_from_insert:
+            # No RETURNING (SQLite before 3.35): read, then delete
+            movie_ids = list(
+                PrecomputedPick.objects.filter(user=user, mood=mood)
+                .order_by('rank').values_list('movie_id', flat=True)[:count]
+            )
+            if len(movie_ids) < count:
+                return []
+            deleted, _ = PrecomputedPick.objects.filter(user=user, movie_id__in=movie_ids).delete()
+            return movie_ids if deleted >= count else []
+        
+        table = db_connection.ops.quote_name(PrecomputedPick._meta.db_table)
+        batch = f'SELECT movie_id FROM {table} WHERE user_id = %s AND mood_id = %s ORDER BY "rank" LIMIT %s'
+        with db_connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE user_id = %s AND movie_id IN ({batch}) '
+                f'AND (SELECT COUNT(*) FROM ({batch})) = %s '
+                f'RETURNING movie_id, mood_id, "rank"',
+                [user.pk, user.pk, mood.pk, count, user.pk, mood.pk, count, count],
+            )
+            claimed = sorted((rank, movie_id) for movie_id, mood_id, rank in cursor.fetchall() if mood_id == mood.pk)
+        return [movie_id for _, movie_id in claimed]
+    
+    @classmethod
+    def build(cls, user, mood, size=None):
+        """
+        Top up the user's batch for the mood to `size` (PRECOMPUTE_BATCH_SIZE)
+        unseen movies that aren't in any of their other batches, from the
+        candidate pool, the catalog and, when both run short, TMDB
+        Returns the number of movies added
+        """
+        size = size or getattr(settings, 'PRECOMPUTE_BATCH_SIZE', 2)
+        picks = list(PrecomputedPick.objects.filter(user=user).values_list('mood_id', 'movie_id', 'rank'))
+        ranks = [rank for mood_id, _, rank in picks if mood_id == mood.pk]
+        if len(ranks) >= size:
+            return 0
         
-        return movie
+        # The cached copy the web workers update as they serve; a pick that went
+        # stale meanwhile is caught when the batch is popped
+        seen = SeenSet.for_user(user)
+        skip = {movie_id for _, movie_id, _ in picks}
+        needed = size - len(ranks)
+        movies = CandidatePool.pick(mood, needed, exclude=seen, skip=skip)
+        skip.update(movie.pk for movie in movies)
+        if len(movies) < needed:
+            movies += CandidatePool.pick_from_catalog(mood, needed - len(movies), exclude=seen, skip=skip)
+            skip.update(movie.pk for movie in movies)
+        if len(movies) < needed:
+            movies += cls._fetch_unseen_movies(mood, needed - len(movies), seen, skip)
+        
+        first_rank = max(ranks, default=0) + 1
+        PrecomputedPick.objects.bulk_create([
+            PrecomputedPick(user=user, mood=mood, movie=movie, rank=rank)
+            for rank, movie in enumerate(movies, start=first_rank)
+        ], ignore_conflicts=True)
+        return len(movies)
+    
+    @classmethod
+    def _fetch_unseen_movies(cls, mood, count, seen, skip):
+        """
+        Walk TMDB discover pages (up to RECOMMEND_MAX_PAGES) until `count`
+        unseen movies are found; every fetched page is upserted locally
+        """
+        found = []
+        for page in range(1, getattr(settings, 'RECOMMEND_MAX_PAGES', 5) + 1):
+            tmdb_movies_data = TMDBService.fetch_movies_by_mood(mood.name, count=None, page=page)
+            if not tmdb_movies_data:
+                break
+            for movie in TMDBService.create_or_update_movies(tmdb_movies_data):
+                if movie.pk not in seen and movie.pk not in skip:
+                    skip.add(movie.pk)
+                    found.append(movie)
+                    if len(found) == count:
+                        return found
+        return found
 
+
+class PrecomputeQueue:
+    """
+    Database-backed queue of PrecomputeJob rows, drained by precompute_worker
+    Jobs are claimed with a conditional UPDATE, so any number of workers can
+    share the queue on any database backend
+    """
+    
+    @classmethod
+    def enqueue(cls, user_ids, mood_ids, delay=0):
+        """Queue a job per user and mood; pairs already waiting are skipped"""
+        if not precompute_enabled():
+            return
+        run_after = timezone.now() + timedelta(seconds=delay)
+        PrecomputeJob.objects.bulk_create([
+            PrecomputeJob(user_id=user_id, mood_id=mood_id, run_after=run_after)
+            for user_id in user_ids
+            for mood_id in mood_ids
+        ], ignore_conflicts=True)
+    
+    @classmethod
+    def enqueue_user(cls, user):
+        """Queue the user's next batch for every active mood"""
+        cls.enqueue([user.pk], list(get_active_moods()['by_id']))
+    
+    @classmethod
+    def enqueue_active(cls, mood_ids, user_ids=()):
+        """Queue every active user, and the users in `user_ids`, for each mood in chunks"""
+        user_ids = set(user_ids)
+        active_user_ids = (
+            user_id for user_id in cls.active_user_ids().iterator(chunk_size=500)
+            if user_id not in user_ids
+        )
+        queued = chain(user_ids, active_user_ids)
+        while chunk := list(islice(queued, 500)):
+            cls.enqueue(chunk, mood_ids)
+    
+    @classmethod
+    def invalidate_mood(cls, mood):
+        """
+        Discard precomputed picks that dropped out of the mood's refreshed pool
+        and queue the mood for every active user and each user who lost picks,
+        so their batches are topped up from the new pool; picks still in the
+        pool are kept
+        """
+        if not precompute_enabled():
+            return
+        stale = PrecomputedPick.objects.filter(mood=mood).exclude(
+            movie_id__in=MoodCandidate.objects.filter(mood=mood).values('movie_id')
+        )
+        user_ids = list(stale.order_by().values_list('user_id', flat=True).distinct())
+        stale.delete()
+        cls.enqueue_active([mood.pk], user_ids)
+    
+    @classmethod
+    def active_user_ids(cls):
+        """Users who logged in within PRECOMPUTE_ACTIVE_DAYS"""
+        cutoff = timezone.now() - timedelta(days=getattr(settings, 'PRECOMPUTE_ACTIVE_DAYS', 14))
+        return User.objects.filter(is_active=True, last_login__gte=cutoff).values_list('pk', flat=True)
+    
+    @classmethod
+    def claim(cls, worker, limit=10):
+        """
+        Claim up to `limit` due jobs for `worker` (a unique name)
+        Jobs left running longer than PRECOMPUTE_JOB_TIMEOUT by a worker that
+        died are claimed again
+        """
+        now = timezone.now()
+        timeout = timedelta(seconds=getattr(settings, 'PRECOMPUTE_JOB_TIMEOUT', 300))
+        claimable = (
+            Q(status=PrecomputeJob.PENDING, run_after__lte=now)
+            | Q(status=PrecomputeJob.RUNNING, claimed_at__lt=now - timeout)
+        )
+        job_ids = list(
+            PrecomputeJob.objects.filter(claimable).order_by('run_after', 'id').values_list('id', flat=True)[:limit]
+        )
+        if not job_ids:
+            return []
+        PrecomputeJob.objects.filter(claimable, pk__in=job_ids).update(
+            status=PrecomputeJob.RUNNING, claimed_by=worker, claimed_at=now,
+        )
+        return list(
+            PrecomputeJob.objects
+            .filter(pk__in=job_ids, status=PrecomputeJob.RUNNING, claimed_by=worker)
+            .select_related('user', 'mood')
+            .order_by('run_after', 'id')
+        )
+    
+    @classmethod
+    def run(cls, job):
+        """Build the job's batch, then drop the job or schedule a retry; returns whether it succeeded"""
+        try:
+            if job.user.is_active and job.mood.is_active:
+                PrecomputedBatch.build(job.user, job.mood)
+        except Exception as e:
+            cls.fail(job, e)
+            return False
+        PrecomputeJob.objects.filter(pk=job.pk).delete()
+        return True
+    
+    @classmethod
+    def fail(cls, job, error):
+        """
+        Retry with exponential backoff from PRECOMPUTE_RETRY_DELAY seconds;
+        after PRECOMPUTE_MAX_ATTEMPTS the job is kept as failed
+        """
+        attempts = job.attempts + 1
+        failed = attempts >= getattr(settings, 'PRECOMPUTE_MAX_ATTEMPTS', 5)
+        delay = getattr(settings, 'PRECOMPUTE_RETRY_DELAY', 30) * 2 ** (attempts - 1)
+        logger.warning('Precompute job %s failed (attempt %s): %s', job.pk, attempts, error)
+        try:
+            with transaction.atomic():
+                PrecomputeJob.objects.filter(pk=job.pk).update(
+                    status=PrecomputeJob.FAILED if failed else PrecomputeJob.PENDING,
+                    attempts=attempts,
+                    run_after=timezone.now() + timedelta(seconds=delay),
+                    claimed_by='',
+                    claimed_at=None,
+                    last_error=str(error)[:1000],
+                )
+        except IntegrityError:
+            # The same work was queued again meanwhile; that job takes over
+            PrecomputeJob.objects.filter(pk=job.pk).delete()
+    
+    @classmethod
+    def work(cls, worker, limit=10):
+        """Claim and run one round of jobs; returns how many were claimed"""
+        jobs = cls.claim(worker, limit)
+        for job in jobs:
+            cls.run(job)
+        return len(jobs)
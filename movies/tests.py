@@ -1,3 +1,1599 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import requests
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from movieflick.metrics import RequestTimings, clear_metrics
+from movieflick.routers import PrimaryReplicaRouter, read_from_replica
+from movieflick.sqlite3 import copy_sqlite_database, sqlite_database
+from moods.cache import get_active_moods, invalidate_active_moods
+from moods.models import Mood
+from .async_services import AsyncTMDBService
+from .benchmarking import StubTMDBServer, fake_discover_results
+from .exports import COLUMNS
+from .management.commands.benchmark_db_contention import Command as ContentionBenchmark
+from .models import Movie, MoodCandidate, MoviePayload, PrecomputedPick, PrecomputeJob, Recommendation
+from .payloads import decode_payload
+from .seen import SeenSet
+from .services import (
+    CandidatePool,
+    CircuitBreaker,
+    CircuitOpenError,
+    LocalResponseCache,
+    PrecomputedBatch,
+    PrecomputeQueue,
+    RateLimited,
+    RecommendationService,
+    TMDBService,
+    TMDBUnavailable,
+    reset_http_session,
+)
+from .throttling import CacheTokenBucket, FileTokenBucket, LocalTokenBucket, TokenBucket
+from .transports import FixtureStore, ReplayTransport
+
+
+class QueryPlanAssertionsMixin:
+    """
+    Runs EXPLAIN on every SELECT issued by a block of code and fails if the
+    plan falls back to a full table scan or a temporary sort
+    """
+
+    def assertQueriesUseIndexes(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        selects = [query['sql'] for query in context.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects, 'No SELECT queries were captured')
+        for sql in selects:
+            problems = self.find_plan_problems(sql)
+            self.assertFalse(problems, f"Unindexed plan for:\n{sql}\n" + '\n'.join(problems))
+
+    def find_plan_problems(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                details = [row[-1] for row in cursor.fetchall()]
+                return [
+                    detail for detail in details
+                    if detail.startswith('SCAN ') or 'TEMP B-TREE' in detail
+                ]
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+                details = [row[0] for row in cursor.fetchall()]
+                return [
+                    detail for detail in details
+                    if 'Seq Scan' in detail or detail.strip().startswith('-> Sort')
+                ]
+        self.skipTest(f'No query plan checks for {connection.vendor}')
+
+
+def fake_discover_by_genre(genre_id, page=1):
+    return fake_discover_results([genre_id], page)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ResponseCacheTests(TestCase):
+    """Tests for the TMDB response cache"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = LocalResponseCache(max_entries=2, clock=self.clock)
+
+    def test_entries_expire_after_their_ttl(self):
+        self.cache.set('a', 1, ttl=10)
+        self.clock.now = 9.9
+        self.assertEqual(self.cache.get('a'), 1)
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_least_recently_used_entry_is_evicted_at_capacity(self):
+        self.cache.set('a', 1, ttl=10)
+        self.cache.set('b', 2, ttl=10)
+        self.cache.get('a')
+        self.cache.set('c', 3, ttl=10)
+
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual((self.cache.get('a'), self.cache.get('c')), (1, 3))
+
+    def test_cache_key_leaves_out_the_api_key(self):
+        params = {'with_genres': 35, 'page': 1}
+        key = TMDBService._cache_key('/discover/movie', params)
+        self.assertEqual(key, TMDBService._cache_key('/discover/movie', {'page': 1, 'with_genres': 35, 'api_key': 'a'}))
+        self.assertEqual(key, TMDBService._cache_key('/discover/movie', {**params, 'api_key': 'b'}))
+        self.assertNotEqual(key, TMDBService._cache_key('/discover/movie', {**params, 'page': 2}))
+
+    def test_repeated_requests_are_served_from_the_cache(self):
+        self.addCleanup(TMDBService.set_response_cache, None)
+        self.addCleanup(TMDBService.set_transport, None)
+        TMDBService.set_response_cache(LocalResponseCache(clock=self.clock))
+        transport = mock.Mock()
+        transport.get.return_value = {'results': fake_discover_results([35], 1)}
+        TMDBService.set_transport(transport)
+
+        with override_settings(TMDB_COALESCE=False, TMDB_RATE_LIMIT=0, TMDB_CACHE_TTLS={'/discover/movie': 60}):
+            TMDBService.set_rate_limiter(None)
+            self.addCleanup(TMDBService.set_rate_limiter, None)
+            TMDBService.discover_by_genre(35)
+            TMDBService.discover_by_genre(35)
+            self.assertEqual(transport.get.call_count, 1)
+            self.clock.now = 60
+            TMDBService.discover_by_genre(35)
+        self.assertEqual(transport.get.call_count, 2)
+
+
+class GenreStubTransport:
+    """Answers discover calls per genre: a result list, an exception to raise, or an Event to block on"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def get(self, endpoint, params):
+        self.calls.append((params['with_genres'], params['page']))
+        response = self.responses[params['with_genres']]
+        if isinstance(response, Exception):
+            raise response
+        if isinstance(response, threading.Event):
+            response.wait(5)
+            return {'results': []}
+        return {'results': response}
+
+
+def stub_movie(tmdb_id, genre_ids, popularity):
+    return {'id': tmdb_id, 'title': f'Movie {tmdb_id}', 'genre_ids': genre_ids, 'popularity': popularity}
+
+
+@override_settings(TMDB_COALESCE=False, TMDB_RATE_LIMIT=0)
+class GenreFanOutTests(TestCase):
+    """Tests for querying every genre of a mood concurrently (Excited: 28, 12, 53)"""
+
+    def setUp(self):
+        cache.clear()
+        TMDBService.get_response_cache().clear()
+        TMDBService.set_rate_limiter(None)
+        self.addCleanup(TMDBService.set_rate_limiter, None)
+        self.addCleanup(TMDBService.set_transport, None)
+        self.addCleanup(TMDBService.set_circuit_breaker, None)
+
+    def use_transport(self, responses):
+        transport = GenreStubTransport(responses)
+        TMDBService.set_transport(transport)
+        return transport
+
+    def fetch(self):
+        return TMDBService.fetch_movies_by_mood('Excited', count=None, fan_out=True)
+
+    def test_results_are_merged_deduplicated_and_ranked(self):
+        both = stub_movie(1, [28, 12], popularity=1)
+        action = stub_movie(2, [28], popularity=10)
+        adventure = stub_movie(3, [12], popularity=50)
+        transport = self.use_transport({28: [action, both], 12: [both, adventure], 53: [action]})
+
+        movies = self.fetch()
+
+        # Most mood genres first, then by popularity; each movie once
+        self.assertEqual([movie['id'] for movie in movies], [1, 3, 2])
+        self.assertEqual(sorted(transport.calls), [(12, 1), (28, 1), (53, 1)])
+
+    def test_a_failing_genre_is_dropped(self):
+        self.use_transport({
+            28: [stub_movie(1, [28], 5)],
+            12: requests.exceptions.ConnectionError('down'),
+            53: [stub_movie(2, [53], 9)],
+        })
+        self.assertEqual([movie['id'] for movie in self.fetch()], [2, 1])
+
+    def test_genres_missing_the_deadline_are_dropped(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.use_transport({28: [stub_movie(1, [28], 5)], 12: release, 53: release})
+
+        start = time.monotonic()
+        with override_settings(TMDB_FANOUT_DEADLINE=0.2):
+            movies = self.fetch()
+
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual([movie['id'] for movie in movies], [1])
+
+    def test_raises_when_every_genre_fails(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        error = requests.exceptions.ConnectionError('down')
+        self.use_transport({28: error, 12: error, 53: release})
+
+        with override_settings(TMDB_FANOUT_DEADLINE=0.2), self.assertRaisesMessage(TMDBUnavailable, 'All genre queries failed'):
+            self.fetch()
+
+
+@override_settings(CANDIDATE_POOL_BACKGROUND_REFILL=False)
+class RecommendationServiceTests(TestCase):
+    """Tests for the batched recommendation write path"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        self.mood = Mood.objects.get(name='Happy')
+
+    def test_write_cost_is_constant(self):
+        """Recommending 2 or 20 movies fetched from TMDB costs the same number of queries"""
+        # Warm the cached mood catalog and seen-set so both calls start alike
+        get_active_moods()
+        SeenSet.for_user(self.user)
+        excited = Mood.objects.get(name='Excited')
+
+        def fetch_pages(mood_name, pages):
+            genre_id = TMDBService.get_genres_for_mood(mood_name)[0]
+            return fake_discover_results([genre_id], 1) + fake_discover_results([genre_id], 2)
+
+        with mock.patch.object(TMDBService, 'fetch_pages_by_mood', side_effect=fetch_pages):
+            with self.assertNumQueries(15):
+                RecommendationService.recommend(self.user, self.mood, count=2)
+            with self.assertNumQueries(15):
+                RecommendationService.recommend(self.user, excited, count=20)
+
+        self.assertEqual(Movie.objects.count(), 22)
+        self.assertEqual(Recommendation.objects.filter(user=self.user).count(), 22)
+
+    def test_writes_roll_back_together(self):
+        with mock.patch.object(TMDBService, 'fetch_pages_by_mood', return_value=fake_discover_results([35], 1)), \
+                mock.patch.object(PrecomputeQueue, 'enqueue_user', side_effect=IntegrityError('queue')), \
+                self.assertRaises(IntegrityError):
+            RecommendationService.recommend(self.user, self.mood, count=2)
+
+        self.assertFalse(Movie.objects.exists())
+        self.assertFalse(Recommendation.objects.exists())
+
+    def test_record_returns_movies_in_input_order(self):
+        tmdb_movies_data = fake_discover_results([35], 1)[:5]
+        movies, recommendations = RecommendationService.record(self.user, self.mood, tmdb_movies_data)
+
+        self.assertEqual([movie.tmdb_id for movie in movies], [data['id'] for data in tmdb_movies_data])
+        self.assertEqual([rec.movie_id for rec in recommendations], [movie.id for movie in movies])
+        self.assertTrue(all(rec.pk for rec in recommendations))
+
+
+class MovieListFilterTests(TestCase):
+    """Tests for the movie list filters"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        TMDBService.create_or_update_movies([
+            {'id': 1, 'title': 'Comedy', 'genre_ids': [35], 'vote_average': 6.5, 'release_date': '2001-05-01'},
+            {'id': 2, 'title': 'Animated comedy', 'genre_ids': [35, 16], 'vote_average': 8.0, 'release_date': '2015-07-10'},
+            {'id': 3, 'title': 'Drama', 'genre_ids': [18], 'vote_average': 9.1, 'release_date': '2022-01-01'},
+            {'id': 4, 'title': 'Unrated', 'genre_ids': [18], 'vote_average': None, 'release_date': None},
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tmdb_ids(self, query):
+        response = self.client.get(f'/api/movies/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return sorted(movie['tmdb_id'] for movie in response.data['results'])
+
+    def test_filters_by_genre(self):
+        self.assertEqual(self.tmdb_ids('genre=35'), [1, 2])
+        self.assertEqual(self.tmdb_ids('genre=16'), [2])
+        self.assertEqual(self.tmdb_ids('genre=99'), [])
+
+    def test_filters_by_rating_range(self):
+        self.assertEqual(self.tmdb_ids('min_rating=8'), [2, 3])
+        self.assertEqual(self.tmdb_ids('max_rating=8'), [1, 2])
+        self.assertEqual(self.tmdb_ids('min_rating=7&max_rating=9'), [2])
+
+    def test_filters_by_release_date(self):
+        self.assertEqual(self.tmdb_ids('released_after=2015-07-10'), [2, 3])
+        self.assertEqual(self.tmdb_ids('released_before=2015-01-01'), [1])
+        self.assertEqual(self.tmdb_ids('genre=18&released_after=2000-01-01'), [3])
+
+    def test_rejects_invalid_filters(self):
+        for query in ('genre=comedy', 'min_rating=-1', 'max_rating=10.5', 'released_after=2020-13-01',
+                      'released_before=yesterday'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/movies/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(query.split('=')[0], response.data)
+
+
+class MovieGenreIndexTests(TestCase):
+    """Tests for the normalized MovieGenre index"""
+
+    def test_upsert_keeps_genre_rows_in_sync(self):
+        data = fake_discover_results([35], 1)[:1]
+        data[0]['genre_ids'] = [35, 16]
+        movie = TMDBService.create_or_update_movie(data[0])
+        self.assertEqual(sorted(movie.genres.values_list('genre_id', flat=True)), [16, 35])
+
+        data[0]['genre_ids'] = [18]
+        TMDBService.create_or_update_movie(data[0])
+        self.assertEqual(list(movie.genres.values_list('genre_id', flat=True)), [18])
+
+    def test_with_genres_ranks_by_overlap(self):
+        one, both, other = fake_discover_results([28], 1)[:3]
+        both['genre_ids'] = [28, 12]
+        other['genre_ids'] = [99]
+        TMDBService.create_or_update_movies([one, both, other])
+
+        ranked = list(Movie.objects.with_genres([28, 12]))
+
+        self.assertEqual([movie.tmdb_id for movie in ranked], [both['id'], one['id']])
+        self.assertEqual([movie.genre_overlap for movie in ranked], [2, 1])
+
+
+class MoviePayloadTests(TestCase):
+    """Tests for the Movie.external_api_data accessor backed by MoviePayload"""
+
+    def test_payload_round_trips_through_the_side_table(self):
+        data = fake_discover_results([35], 1)[0]
+        movie = Movie(title='Stub', overview='', tmdb_id=data['id'])
+        movie.external_api_data = data
+        movie.save()
+
+        payload = MoviePayload.objects.get(movie=movie)
+        self.assertEqual(payload.encoding, 'zlib')
+        self.assertEqual(Movie.objects.get(pk=movie.pk).external_api_data, data)
+
+        movie.external_api_data = {'id': data['id'], 'title': 'Changed'}
+        movie.save()
+        self.assertEqual(MoviePayload.objects.count(), 1)
+        self.assertEqual(Movie.objects.get(pk=movie.pk).external_api_data['title'], 'Changed')
+
+    def test_none_and_missing_payloads_read_as_empty(self):
+        movie = Movie(title='Stub', overview='', tmdb_id=1)
+        self.assertEqual(movie.external_api_data, {})
+        movie.external_api_data = None
+        self.assertEqual(movie.external_api_data, {})
+        movie.save()
+        self.assertEqual(Movie.objects.get(pk=movie.pk).external_api_data, {})
+
+        MoviePayload.objects.filter(movie=movie).delete()
+        self.assertEqual(Movie.objects.get(pk=movie.pk).external_api_data, {})
+
+    def test_saving_without_a_new_payload_keeps_the_stored_one(self):
+        movie = TMDBService.create_or_update_movie(fake_discover_results([35], 1)[0])
+        movie = Movie.objects.get(pk=movie.pk)
+        movie.title = 'Renamed'
+        movie.save()
+        self.assertEqual(Movie.objects.get(pk=movie.pk).external_api_data['id'], movie.tmdb_id)
+
+
+class PayloadMigrationTests(TransactionTestCase):
+    """Tests for the 0003 data migration moving external_api_data into MoviePayload"""
+    serialized_rollback = True
+    before = [('movies', '0002_moodcandidate')]
+    after = [('movies', '0003_moviepayload')]
+
+    def setUp(self):
+        self.addCleanup(self.migrate_to_latest)
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_payloads_move_to_the_side_table_and_back(self):
+        apps = self.migrate(self.before)
+        OldMovie = apps.get_model('movies', 'Movie')
+        data = fake_discover_results([35], 1)[0]
+        with_data = OldMovie.objects.create(title='Stub', overview='', tmdb_id=data['id'], external_api_data=data)
+        empty = OldMovie.objects.create(title='Empty', overview='', tmdb_id=2)
+
+        apps = self.migrate(self.after)
+        Payload = apps.get_model('movies', 'MoviePayload')
+        payloads = {payload.movie_id: payload for payload in Payload.objects.all()}
+        self.assertEqual(set(payloads), {with_data.pk, empty.pk})
+        self.assertEqual(payloads[with_data.pk].encoding, 'zlib')
+        self.assertEqual(decode_payload(payloads[with_data.pk].encoding, payloads[with_data.pk].data), data)
+        self.assertEqual(decode_payload(payloads[empty.pk].encoding, payloads[empty.pk].data), {})
+
+        apps = self.migrate(self.before)
+        OldMovie = apps.get_model('movies', 'Movie')
+        self.assertEqual(OldMovie.objects.get(pk=with_data.pk).external_api_data, data)
+        self.assertEqual(OldMovie.objects.get(pk=empty.pk).external_api_data, {})
+
+
+class BulkUpsertTests(TestCase):
+    """Tests for TMDBService.create_or_update_movies"""
+
+    def test_returns_movies_in_input_order(self):
+        data = fake_discover_results([35], 1)[:5]
+        data.reverse()
+        movies = TMDBService.create_or_update_movies(data)
+        self.assertEqual([movie.tmdb_id for movie in movies], [item['id'] for item in data])
+        self.assertTrue(all(movie.pk for movie in movies))
+
+    def test_duplicate_tmdb_ids_keep_the_last_occurrence(self):
+        first = fake_discover_results([35], 1)[0]
+        other = fake_discover_results([35], 1)[1]
+        movies = TMDBService.create_or_update_movies([first, other, {**first, 'title': 'Latest'}])
+
+        self.assertEqual(Movie.objects.filter(tmdb_id=first['id']).count(), 1)
+        self.assertEqual([movie.tmdb_id for movie in movies], [first['id'], other['id'], first['id']])
+        self.assertEqual(movies[0].pk, movies[2].pk)
+        self.assertEqual(Movie.objects.get(tmdb_id=first['id']).title, 'Latest')
+
+    def test_updates_existing_rows_in_place(self):
+        data = fake_discover_results([35], 1)[:2]
+        created = TMDBService.create_or_update_movies(data)
+        Movie.objects.filter(pk=created[0].pk).update(created_at=timezone.now() - timedelta(days=1))
+        original = Movie.objects.get(pk=created[0].pk)
+
+        updated = TMDBService.create_or_update_movies([
+            {**data[0], 'title': 'Renamed', 'vote_average': 9.9, 'genre_ids': [18]},
+        ])
+
+        movie = Movie.objects.get(pk=created[0].pk)
+        self.assertEqual(updated[0].pk, original.pk)
+        self.assertEqual(Movie.objects.count(), 2)
+        self.assertEqual((movie.title, movie.rating), ('Renamed', 9.9))
+        self.assertEqual(movie.created_at, original.created_at)
+        self.assertEqual(list(movie.genres.values_list('genre_id', flat=True)), [18])
+        self.assertEqual(movie.external_api_data['title'], 'Renamed')
+
+    def test_statement_count_does_not_grow_with_the_batch(self):
+        # Movies, re-read, payloads, genre delete, genre insert
+        for size in (1, 20):
+            with self.subTest(size=size), self.assertNumQueries(5):
+                TMDBService.create_or_update_movies(fake_discover_results([28, 12], 1)[:size] * 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(TMDBService.create_or_update_movies([]), [])
+
+
+@override_settings(CANDIDATE_POOL_BACKGROUND_REFILL=False)
+class RecommendMoviesViewTests(TestCase):
+    """Tests for POST /api/movies/recommend/"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        self.mood = Mood.objects.get(name='Happy')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @mock.patch.object(TMDBService, 'fetch_pages_by_mood')
+    def test_recommend_creates_recommendations(self, fetch_pages_by_mood):
+        fetch_pages_by_mood.return_value = fake_discover_results([35], 1)[:2]
+
+        response = self.client.post('/api/movies/recommend/', {'mood_id': self.mood.id}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            sorted(response.data['recommendations']),
+            sorted(Recommendation.objects.filter(user=self.user).values_list('id', flat=True))
+        )
+
+    @mock.patch.object(TMDBService, 'fetch_pages_by_mood')
+    def test_recommend_without_results_returns_404(self, fetch_pages_by_mood):
+        fetch_pages_by_mood.return_value = []
+
+        response = self.client.post('/api/movies/recommend/', {'mood_id': self.mood.id}, format='json')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Recommendation.objects.exists())
+
+
+@override_settings(CANDIDATE_POOL_BACKGROUND_REFILL=False)
+class CandidatePoolTests(TestCase):
+    """Tests for serving recommendations from the local candidate pool"""
+    fixtures = ['candidate_pool.json']
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        self.mood = Mood.objects.get(name='Happy')
+
+    @mock.patch.object(TMDBService, '_make_request', side_effect=AssertionError('TMDB called'))
+    def test_recommend_serves_from_pool_offline(self, make_request):
+        # Precomputed batch miss, pool chunk, recommendation insert, next-batch
+        # job insert and the one-off seen-set build, plus two savepoints
+        with self.assertNumQueries(9):
+            movies, recommendations = RecommendationService.recommend(self.user, self.mood, count=2)
+
+        self.assertEqual([movie.pk for movie in movies], [1, 2])
+        self.assertEqual(len(recommendations), 2)
+        make_request.assert_not_called()
+
+    @mock.patch.object(TMDBService, '_make_request', side_effect=AssertionError('TMDB called'))
+    def test_recommend_skips_movies_already_seen(self, make_request):
+        RecommendationService.recommend(self.user, self.mood, count=2)
+
+        # The seen-set is now cached, so no history query is needed
+        with self.assertNumQueries(8):
+            movies, _ = RecommendationService.recommend(self.user, self.mood, count=2)
+        self.assertEqual([movie.pk for movie in movies], [3, 4])
+
+    @mock.patch.object(TMDBService, '_make_request', side_effect=AssertionError('TMDB called'))
+    def test_recommend_serves_a_short_pool_without_waiting_on_tmdb(self, make_request):
+        SeenSet.for_user(self.user).add([1, 2, 3, 4])
+
+        movies, recommendations = RecommendationService.recommend(self.user, self.mood, count=2)
+
+        self.assertEqual([movie.pk for movie in movies], [5])
+        self.assertEqual(len(recommendations), 1)
+
+    @mock.patch.object(TMDBService, 'discover_by_genre', side_effect=fake_discover_by_genre)
+    def test_recommend_walks_tmdb_pages_once_pool_is_seen(self, discover_by_genre):
+        seen_tmdb_ids = {data['id'] for data in fake_discover_results([35], 1)}
+        Recommendation.objects.bulk_create([
+            Recommendation(user=self.user, movie=movie, mood=self.mood)
+            for movie in TMDBService.create_or_update_movies(fake_discover_results([35], 1))
+        ])
+
+        movies, _ = RecommendationService.recommend(self.user, self.mood, count=2)
+
+        self.assertEqual(len(movies), 2)
+        self.assertTrue(seen_tmdb_ids.isdisjoint(movie.tmdb_id for movie in movies))
+        # Both synchronous pages are fetched in one concurrent round
+        discover_by_genre.assert_any_call(35, 2)
+
+    def test_recommend_uses_local_catalog_before_tmdb(self):
+        TMDBService.create_or_update_movies(fake_discover_results([18], 1)[:3])
+        sad = Mood.objects.get(name='Sad')
+
+        with mock.patch.object(TMDBService, '_make_request') as make_request:
+            movies, _ = RecommendationService.recommend(self.user, sad, count=2)
+
+        self.assertEqual(len(movies), 2)
+        genre_ids = Movie.objects.filter(pk__in=[movie.pk for movie in movies]).values_list('genre_ids', flat=True)
+        self.assertTrue(all(18 in ids for ids in genre_ids))
+        make_request.assert_not_called()
+
+    @mock.patch.object(TMDBService, 'discover_by_genre', side_effect=fake_discover_by_genre)
+    def test_recommend_falls_back_to_tmdb_when_pool_is_short(self, discover_by_genre):
+        sad = Mood.objects.get(name='Sad')
+        Movie.objects.filter(genres__genre_id__in=[18, 10749]).delete()
+
+        movies, _ = RecommendationService.recommend(self.user, sad, count=2)
+
+        self.assertEqual(len(movies), 2)
+        discover_by_genre.assert_called()
+
+    @mock.patch.object(TMDBService, 'discover_by_genre', side_effect=fake_discover_by_genre)
+    def test_refresh_command_builds_ranked_pool(self, discover_by_genre):
+        call_command('refresh_candidate_pool', '--pages', '2', '--mood', 'Excited', stdout=mock.Mock())
+
+        excited = Mood.objects.get(name='Excited')
+        candidates = list(MoodCandidate.objects.filter(mood=excited).order_by('rank'))
+        # 3 genres x 2 pages x 20 results
+        self.assertEqual(len(candidates), 120)
+        popularity = [candidate.popularity for candidate in candidates]
+        self.assertEqual(popularity, sorted(popularity, reverse=True))
+        self.assertEqual(discover_by_genre.call_count, 6)
+
+    def test_refresh_fetches_all_pages_in_one_round(self):
+        with mock.patch.object(TMDBService, 'fetch_pages_by_mood', return_value=fake_discover_results([35], 1)) as fetch:
+            self.assertEqual(CandidatePool.refresh(self.mood, pages=3), 20)
+        fetch.assert_called_once_with('Happy', range(1, 4), fan_out=True)
+
+    @override_settings(CANDIDATE_POOL_LOW_WATER=3)
+    @mock.patch.object(CandidatePool, 'schedule_refill')
+    def test_refill_is_scheduled_after_commit_once_the_pool_runs_low(self, schedule_refill):
+        # 5 unseen candidates cover this pick and the low-water mark
+        with self.captureOnCommitCallbacks(execute=True):
+            RecommendationService.recommend(self.user, self.mood, count=2)
+        schedule_refill.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            RecommendationService.recommend(self.user, self.mood, count=2)
+        schedule_refill.assert_not_called()
+        for callback in callbacks:
+            callback()
+        schedule_refill.assert_called_once_with(self.mood)
+
+    @override_settings(CANDIDATE_POOL_BACKGROUND_REFILL=True)
+    @mock.patch('movies.services.threading.Thread')
+    def test_schedule_refill_runs_once_per_interval(self, thread):
+        self.assertTrue(CandidatePool.schedule_refill(self.mood))
+        self.assertFalse(CandidatePool.schedule_refill(self.mood))
+        thread.return_value.start.assert_called_once()
+
+
+@override_settings(FAST_SERIALIZERS=False)
+class RecommendationHistoryTests(TestCase):
+    """Tests for the cursor-paginated recommendation history"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        self.mood = Mood.objects.get(name='Happy')
+        self.movies = TMDBService.create_or_update_movies(
+            fake_discover_results([35], 1) + fake_discover_results([35], 2)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def recommend(self, movies):
+        Recommendation.objects.bulk_create([
+            Recommendation(user=self.user, movie=movie, mood=self.mood) for movie in movies
+        ])
+
+    def test_query_count_does_not_grow_with_history(self):
+        self.recommend(self.movies[:3])
+        with self.assertNumQueries(1):
+            small = self.client.get('/api/movies/recommendations/?page_size=50')
+
+        self.recommend(self.movies[3:])
+        with self.assertNumQueries(1):
+            large = self.client.get('/api/movies/recommendations/?page_size=50')
+
+        self.assertEqual((len(small.data['results']), len(large.data['results'])), (3, 40))
+
+
+class RecommendationQueryPlanTests(QueryPlanAssertionsMixin, TestCase):
+    """Every recommendation view must be served from indexes"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        self.mood = Mood.objects.get(name='Happy')
+        movies = TMDBService.create_or_update_movies(fake_discover_results([35], 1))
+        self.recommendations = Recommendation.objects.bulk_create([
+            Recommendation(user=self.user, movie=movie, mood=self.mood) for movie in movies
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_history_view(self):
+        self.assertQueriesUseIndexes(lambda: self.client.get('/api/movies/recommendations/?page_size=5'))
+
+    def test_history_view_next_page(self):
+        next_url = self.client.get('/api/movies/recommendations/?page_size=5').data['next']
+        self.assertQueriesUseIndexes(lambda: self.client.get(next_url))
+
+    def test_history_view_filtered_by_mood(self):
+        url = f'/api/movies/recommendations/?mood_id={self.mood.id}&page_size=5'
+        self.assertQueriesUseIndexes(lambda: self.client.get(url))
+
+    def test_detail_view(self):
+        pk = self.recommendations[0].pk
+        self.assertQueriesUseIndexes(lambda: self.client.get(f'/api/movies/recommendations/{pk}/'))
+
+    def test_mark_viewed_view(self):
+        pk = self.recommendations[0].pk
+        self.assertQueriesUseIndexes(lambda: self.client.post(f'/api/movies/recommendations/{pk}/view/'))
+
+    def test_delete_view(self):
+        pk = self.recommendations[0].pk
+        self.assertQueriesUseIndexes(lambda: self.client.delete(f'/api/movies/recommendations/{pk}/delete/'))
+
+    def test_history_template_view(self):
+        self.client.force_login(self.user)
+        self.assertQueriesUseIndexes(lambda: self.client.get('/movies/history/'))
+
+
+class ConditionalDetailTests(TestCase):
+    """Tests for ETag / Last-Modified on the detail endpoints"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        self.mood = Mood.objects.get(name='Happy')
+        self.movie = TMDBService.create_or_update_movie(fake_discover_results([35], 1)[0])
+        self.recommendation = Recommendation.objects.create(user=self.user, movie=self.movie, mood=self.mood)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_movie_detail_revalidates_with_one_query(self):
+        url = f'/api/movies/{self.movie.pk}/'
+        response = self.client.get(url)
+
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        not_modified = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_movie_detail_etag_changes_on_update(self):
+        url = f'/api/movies/{self.movie.pk}/'
+        etag = self.client.get(url)['ETag']
+        TMDBService.create_or_update_movie({**fake_discover_results([35], 1)[0], 'title': 'Changed'})
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'Changed')
+
+    def test_recommendation_detail_etag_changes_when_viewed(self):
+        url = f'/api/movies/recommendations/{self.recommendation.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post(f'{url}view/')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['viewed'])
+
+
+class FastSerializerTests(TestCase):
+    """The .values() fast path must render exactly what the model serializers do"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        self.mood = Mood.objects.get(name='Happy')
+        movies = TMDBService.create_or_update_movies(
+            fake_discover_results([35], 1) + fake_discover_results([35], 2)
+        )
+        Movie.objects.filter(pk=movies[0].pk).update(rating=None, release_date=None, poster_url=None)
+        Recommendation.objects.bulk_create([
+            Recommendation(user=self.user, movie=movie, mood=self.mood, viewed=index % 2 == 0, user_rating=index % 5 or None)
+            for index, movie in enumerate(movies)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertSameBytes(self, url):
+        """Walk every page of `url` with both paths and compare the raw bodies"""
+        pages = 0
+        while url:
+            with override_settings(FAST_SERIALIZERS=False):
+                slow = self.client.get(url)
+            with override_settings(FAST_SERIALIZERS=True):
+                fast = self.client.get(url)
+            self.assertEqual(slow.status_code, 200)
+            self.assertEqual(fast.content, slow.content)
+            url = fast.data['next']
+            pages += 1
+        return pages
+
+    def test_movie_list_is_byte_identical(self):
+        self.assertEqual(self.assertSameBytes('/api/movies/?page_size=15'), 3)
+
+    def test_history_is_byte_identical(self):
+        self.assertEqual(self.assertSameBytes('/api/movies/recommendations/?page_size=15'), 3)
+
+    def test_history_projection_is_byte_identical(self):
+        self.assertSameBytes('/api/movies/recommendations/?page_size=15&fields=id,viewed')
+        self.assertSameBytes('/api/movies/recommendations/?page_size=15&fields=id,movie,user')
+
+    def test_fast_history_reads_one_query_per_page(self):
+        with override_settings(FAST_SERIALIZERS=True), self.assertNumQueries(1):
+            self.client.get('/api/movies/recommendations/?page_size=15')
+
+
+class TMDBTransportTests(TestCase):
+    """Tests for the record / replay TMDB transports"""
+
+    def setUp(self):
+        cache.clear()
+        self.fixture_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.fixture_dir)
+        self.addCleanup(TMDBService.set_transport, None)
+        self.addCleanup(reset_http_session)
+        TMDBService.get_response_cache().clear()
+
+    def use_transport(self, mode, **extra):
+        overrides = override_settings(**{
+            'TMDB_TRANSPORT': mode, 'TMDB_FIXTURE_DIR': self.fixture_dir, 'TMDB_API_KEY': 'test-key', **extra
+        })
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        TMDBService.set_transport(None)
+        reset_http_session()
+
+    def test_replay_serves_recorded_responses_offline(self):
+        with StubTMDBServer() as stub:
+            self.use_transport('record', TMDB_BASE_URL=stub.base_url)
+            recorded = TMDBService.discover_by_genre(35, page=2)
+        self.assertEqual(len(FixtureStore(self.fixture_dir).keys()), 1)
+
+        # The stub is gone: replay must not touch the network
+        self.use_transport('replay', TMDB_BASE_URL='http://127.0.0.1:9', TMDB_API_KEY='')
+        replayed = TMDBService._make_request(
+            '/discover/movie', {'with_genres': 35, 'sort_by': 'popularity.desc', 'page': 2}, use_cache=False
+        )
+        self.assertEqual(replayed['results'], recorded)
+
+    def test_recorded_fixtures_leave_out_the_api_key(self):
+        with StubTMDBServer() as stub:
+            self.use_transport('record', TMDB_BASE_URL=stub.base_url)
+            TMDBService.discover_by_genre(35)
+        for name in os.listdir(self.fixture_dir):
+            with open(os.path.join(self.fixture_dir, name), 'rb') as fixture:
+                self.assertNotIn(b'test-key', zlib.decompress(fixture.read()))
+
+    def test_replay_miss_raises(self):
+        self.use_transport('replay')
+        with self.assertRaisesMessage(Exception, 'No recorded TMDB response'):
+            TMDBService.discover_by_genre(35)
+
+    @mock.patch('movies.transports.time.sleep')
+    def test_replay_injects_latency(self, sleep):
+        store = FixtureStore(self.fixture_dir)
+        key = TMDBService._cache_key('/genre/movie/list', {})
+        store.save(key, {'endpoint': '/genre/movie/list', 'params': {}, 'elapsed': 0.25, 'data': {'genres': []}})
+
+        ReplayTransport(store, TMDBService._cache_key, latency=0.1).get('/genre/movie/list', {})
+        ReplayTransport(store, TMDBService._cache_key, latency='recorded').get('/genre/movie/list', {})
+
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.1, 0.25])
+
+
+@override_settings(METRICS_AUTH_TOKEN='scrape-me')
+class PerformanceMetricsTests(TestCase):
+    """Tests for the request instrumentation middleware and /metrics"""
+
+    def scrape(self):
+        return self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me').content.decode()
+
+    def setUp(self):
+        cache.clear()
+        clear_metrics()
+        TMDBService.get_response_cache().clear()
+        self.addCleanup(TMDBService.set_transport, None)
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        self.mood = Mood.objects.get(name='Happy')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_reports_queries_and_serialization(self):
+        TMDBService.create_or_update_movies(fake_discover_results([35], 1))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/movies/')
+
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertIn('tmdb;dur=0.00;desc="0 calls"', timing)
+        self.assertRegex(timing, r'serialize;dur=\d+\.\d+, total;dur=\d+\.\d+')
+
+    @override_settings(CANDIDATE_POOL_BACKGROUND_REFILL=False, RECOMMEND_SYNC_PAGES=1)
+    def test_tmdb_calls_are_exported_per_view(self):
+        transport = mock.Mock()
+        transport.get.return_value = {'results': fake_discover_results([35], 1)}
+        TMDBService.set_transport(transport)
+
+        response = self.client.post('/api/movies/recommend/', {'mood_id': self.mood.id}, format='json')
+        self.assertIn('desc="1 calls"', response['Server-Timing'])
+
+        exported = self.scrape()
+        self.assertIn('movieflick_tmdb_call_duration_seconds_count{view="movie-recommend"} 1', exported)
+        self.assertIn(
+            'movieflick_request_duration_seconds_count{view="movie-recommend",method="POST",status="200"} 1',
+            exported,
+        )
+        self.assertIn('movieflick_tmdb_calls_bucket{view="movie-recommend",le="1"} 1', exported)
+        self.assertNotIn('view="metrics"', exported)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_instrumented(self):
+        response = self.client.get('/api/moods/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('movieflick_request_duration_seconds_count', self.scrape())
+
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    @override_settings(METRICS_AUTH_TOKEN='')
+    def test_metrics_without_token_only_in_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_timings_are_thread_safe(self):
+        timings = RequestTimings()
+
+        def record():
+            for _ in range(1000):
+                timings.add_query(0.001)
+                timings.add_serialization(0.001)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for _ in range(8):
+                executor.submit(record)
+        self.assertEqual(timings.db_queries, 8000)
+        self.assertAlmostEqual(timings.serialize_time, 8.0)
+
+
+class CircuitBreakerTests(TestCase):
+    """Tests for the TMDB circuit breaker and stale-while-revalidate"""
+
+    def setUp(self):
+        cache.clear()
+        TMDBService.get_response_cache().clear()
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(window=4, min_calls=4, error_rate=0.5, slow_call=1.0, slow_rate=0.75,
+                                      cooldown=30, clock=self.clock)
+        TMDBService.set_circuit_breaker(self.breaker)
+        self.addCleanup(TMDBService.set_circuit_breaker, None)
+        self.transport = mock.Mock()
+        TMDBService.set_transport(self.transport)
+        self.addCleanup(TMDBService.set_transport, None)
+
+    def trip(self):
+        with self.assertLogs('movies.services', 'WARNING'):
+            for failed in (True, True, False, False):
+                self.breaker.record(0.1, failed=failed)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_trips_on_error_rate_and_recovers_after_a_trial(self):
+        self.trip()
+        self.assertFalse(self.breaker.allow_request())
+
+        self.clock.now = 30
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())  # one trial at a time
+        self.breaker.record(0.1, failed=False)
+        self.assertTrue(self.breaker.is_closed)
+
+    def test_trips_on_slow_calls(self):
+        with self.assertLogs('movies.services', 'WARNING'):
+            for elapsed in (1.5, 2.0, 0.1, 3.0):
+                self.breaker.record(elapsed, failed=False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_failed_trial_reopens(self):
+        self.trip()
+        self.clock.now = 30
+        self.assertTrue(self.breaker.allow_request())
+        with self.assertLogs('movies.services', 'WARNING'):
+            self.breaker.record(0.1, failed=True)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.retry_after(), 30)
+
+    def test_open_breaker_fails_fast_without_stale_data(self):
+        self.trip()
+        with self.assertRaises(CircuitOpenError):
+            TMDBService.discover_by_genre(35)
+        self.transport.get.assert_not_called()
+
+    @mock.patch('movies.services.threading.Thread')
+    def test_open_breaker_serves_stale_and_refreshes_in_background(self, thread):
+        results = fake_discover_results([35], 1)
+        self.transport.get.return_value = {'results': results}
+        TMDBService.discover_by_genre(35)
+        TMDBService.get_response_cache().clear()
+        self.transport.get.reset_mock()
+
+        self.trip()
+        self.assertEqual(TMDBService.discover_by_genre(35), results)
+        self.assertEqual(TMDBService.discover_by_genre(35), results)
+
+        self.transport.get.assert_not_called()
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once()
+
+    def test_failed_call_falls_back_to_stale(self):
+        results = fake_discover_results([35], 1)
+        self.transport.get.return_value = {'results': results}
+        TMDBService.discover_by_genre(35)
+        TMDBService.get_response_cache().clear()
+
+        self.transport.get.side_effect = requests.exceptions.ReadTimeout('slow')
+        self.assertEqual(TMDBService.discover_by_genre(35), results)
+
+    @override_settings(CANDIDATE_POOL_BACKGROUND_REFILL=False)
+    def test_recommend_view_returns_503_when_tmdb_is_down(self):
+        user = User.objects.create_user(username='tester', password='testpass123')
+        client = APIClient()
+        client.force_authenticate(user)
+        self.transport.get.side_effect = requests.exceptions.ConnectionError('secret internal detail')
+
+        with self.assertLogs('movies.views', 'WARNING'):
+            response = client.post('/api/movies/recommend/', {'mood_id': Mood.objects.get(name='Happy').id}, format='json')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertNotIn('secret internal detail', response.content.decode())
+
+
+@override_settings(CANDIDATE_POOL_BACKGROUND_REFILL=False)
+class AsyncRecommendTests(TestCase):
+    """Tests for the async recommend views and TMDB client"""
+
+    def setUp(self):
+        cache.clear()
+        TMDBService.get_response_cache().clear()
+        self.addCleanup(TMDBService.set_transport, None)
+        self.addCleanup(TMDBService.set_circuit_breaker, None)
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        self.mood = Mood.objects.get(name='Happy')
+
+    async def test_async_recommend_matches_sync_response(self):
+        transport = mock.Mock()
+        transport.get.return_value = {'results': fake_discover_results([35], 1)}
+        TMDBService.set_transport(transport)
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.post(
+            '/api/movies/recommend/async/', {'mood_id': self.mood.id}, content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['mood']['name'], 'Happy')
+        self.assertEqual(len(data['recommendations']), 2)
+        self.assertEqual(await Recommendation.objects.filter(user=self.user).acount(), 2)
+
+        # The movies are now seen, so the next call picks different ones from the catalog
+        transport.get.reset_mock()
+        second = (await self.async_client.post(
+            '/api/movies/recommend/async/', {'mood_id': self.mood.id}, content_type='application/json'
+        )).json()
+        self.assertFalse({movie['id'] for movie in data['movies']} & {movie['id'] for movie in second['movies']})
+        transport.get.assert_not_called()
+
+    async def test_async_recommend_requires_login_and_valid_mood(self):
+        response = await self.async_client.post('/api/movies/recommend/async/', {'mood_id': self.mood.id})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(
+            '/api/movies/recommend/async/', {'mood_id': 9999}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_async_recommend_returns_503_when_tmdb_is_down(self):
+        transport = mock.Mock()
+        transport.get.side_effect = requests.exceptions.ConnectionError('secret internal detail')
+        TMDBService.set_transport(transport)
+        await self.async_client.aforce_login(self.user)
+
+        with self.assertLogs('movies.views', 'WARNING'):
+            response = await self.async_client.post(
+                '/api/movies/recommend/async/', {'mood_id': self.mood.id}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertNotIn('secret internal detail', response.content.decode())
+
+    @override_settings(TMDB_API_KEY='test-key', TMDB_BACKOFF_FACTOR=0, TMDB_BACKOFF_JITTER=0)
+    def test_async_client_calls_tmdb_with_retries(self):
+        with StubTMDBServer(error_rate=0.5) as stub, override_settings(TMDB_BASE_URL=stub.base_url, TMDB_MAX_RETRIES=10):
+            results = async_to_sync(AsyncTMDBService.discover_by_genre)(35, page=2)
+        self.assertEqual(results, fake_discover_results([35], 2))
+
+
+    def test_async_client_shares_the_sync_request_policy(self):
+        self.addCleanup(TMDBService.set_rate_limiter, None)
+        results = fake_discover_results([35], 1)
+        transport = mock.Mock()
+        transport.get.return_value = {'results': results}
+        TMDBService.set_transport(transport)
+        discover = async_to_sync(AsyncTMDBService.discover_by_genre)
+        self.assertEqual(discover(35), results)
+
+        # Open breaker: both clients serve the same stale response without calling TMDB
+        TMDBService.get_response_cache().clear()
+        breaker = CircuitBreaker(window=1, min_calls=1, cooldown=60)
+        breaker.record(0, failed=True)
+        TMDBService.set_circuit_breaker(breaker)
+        transport.get.reset_mock()
+        with mock.patch.object(TMDBService, 'schedule_revalidate') as revalidate:
+            self.assertEqual(discover(35), results)
+            self.assertEqual(TMDBService.discover_by_genre(35), results)
+        self.assertEqual(revalidate.call_count, 2)
+        transport.get.assert_not_called()
+        with self.assertRaises(CircuitOpenError):
+            discover(36)
+
+        # Rate limit exhausted: both refuse without calling TMDB
+        TMDBService.set_circuit_breaker(None)
+        TMDBService.set_rate_limiter(mock.Mock(**{'reserve.return_value': None}))
+        with self.assertRaises(RateLimited):
+            discover(36)
+        with self.assertRaises(RateLimited):
+            TMDBService.discover_by_genre(36)
+        transport.get.assert_not_called()
+
+
+class CoalescingAndRateLimitTests(TestCase):
+    """Tests for coalesced TMDB calls and the outbound token bucket"""
+
+    def setUp(self):
+        cache.clear()
+        TMDBService.get_response_cache().clear()
+        self.addCleanup(TMDBService.set_transport, None)
+        self.addCleanup(TMDBService.set_rate_limiter, None)
+        TMDBService.set_rate_limiter(None)
+        self.results = fake_discover_results([35], 1)
+
+    def slow_transport(self, release):
+        transport = mock.Mock()
+
+        def get(endpoint, params):
+            release.wait(5)
+            return {'results': self.results}
+        transport.get.side_effect = get
+        TMDBService.set_transport(transport)
+        return transport
+
+    def test_identical_calls_in_flight_share_one_fetch(self):
+        release = threading.Event()
+        transport = self.slow_transport(release)
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(TMDBService.discover_by_genre, 35) for _ in range(5)]
+            time.sleep(0.1)
+            release.set()
+            answers = [future.result() for future in futures]
+
+        transport.get.assert_called_once()
+        self.assertEqual(answers, [self.results] * 5)
+
+    def test_waits_for_the_worker_holding_the_flight(self):
+        transport = mock.Mock()
+        TMDBService.set_transport(transport)
+        params = {'with_genres': 35, 'sort_by': 'popularity.desc', 'page': 1}
+        cache_key = TMDBService._cache_key('/discover/movie', params)
+        # Another worker is fetching and publishes its result shortly
+        cache.add(TMDBService.FLIGHT_KEY.format(key=cache_key), True, 5)
+        result_key = TMDBService.FLIGHT_RESULT_KEY.format(key=cache_key)
+        timer = threading.Timer(0.1, cache.set, (result_key, {'results': self.results}))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        self.assertEqual(TMDBService.discover_by_genre(35), self.results)
+        transport.get.assert_not_called()
+
+    def test_fetches_itself_when_the_other_worker_gives_up(self):
+        transport = mock.Mock()
+        transport.get.return_value = {'results': self.results}
+        TMDBService.set_transport(transport)
+        params = {'with_genres': 35, 'sort_by': 'popularity.desc', 'page': 1}
+        flight_key = TMDBService.FLIGHT_KEY.format(key=TMDBService._cache_key('/discover/movie', params))
+        cache.add(flight_key, True, 5)
+        timer = threading.Timer(0.1, cache.delete, (flight_key,))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        self.assertEqual(TMDBService.discover_by_genre(35), self.results)
+        transport.get.assert_called_once()
+
+    def test_async_calls_in_flight_share_one_fetch(self):
+        transport = mock.Mock()
+        transport.get.side_effect = lambda endpoint, params: time.sleep(0.1) or {'results': self.results}
+        TMDBService.set_transport(transport)
+
+        async def burst():
+            return await asyncio.gather(*(AsyncTMDBService.discover_by_genre(35) for _ in range(5)))
+
+        self.assertEqual(async_to_sync(burst)(), [self.results] * 5)
+        transport.get.assert_called_once()
+
+    def test_token_bucket_allows_bursts_then_paces_calls(self):
+        clock = FakeClock()
+        bucket = LocalTokenBucket(rate=10, burst=2, clock=clock)
+        self.assertEqual([bucket.reserve(), bucket.reserve()], [0, 0])
+        self.assertAlmostEqual(bucket.reserve(), 0.1)
+        self.assertAlmostEqual(bucket.reserve(), 0.2)
+        # Too long a wait takes nothing
+        self.assertIsNone(bucket.reserve(max_wait=0.25))
+        clock.now = 1.0
+        self.assertEqual(bucket.reserve(max_wait=0), 0)
+
+    def test_cache_and_file_buckets_are_shared_between_workers(self):
+        path = os.path.join(tempfile.mkdtemp(), 'ratelimit')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        for make in (lambda: CacheTokenBucket(key='test:ratelimit', rate=1, burst=2),
+                     lambda: FileTokenBucket(path, rate=1, burst=2)):
+            first, second = make(), make()
+            self.assertEqual(first.reserve(), 0)
+            self.assertEqual(second.reserve(), 0)
+            self.assertIsNone(first.reserve(max_wait=0.5))
+            self.assertGreater(second.reserve(), 0.9)
+
+    def test_cache_bucket_gives_up_on_a_stuck_lock_without_releasing_it(self):
+        bucket = CacheTokenBucket(key='test:ratelimit', rate=1, burst=2)
+        bucket.LOCK_WAIT = 0.05
+        cache.add(bucket.lock_key, 'other-worker', 5)
+
+        self.assertIsNone(bucket.reserve())
+        self.assertEqual(cache.get(bucket.lock_key), 'other-worker')
+
+        cache.delete(bucket.lock_key)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertIsNone(cache.get(bucket.lock_key))
+
+    def test_token_bucket_is_abstract(self):
+        with self.assertRaises(TypeError):
+            TokenBucket(rate=1)
+
+    def test_coalesced_result_does_not_close_a_half_open_breaker(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(window=2, min_calls=2, cooldown=30, clock=clock)
+        TMDBService.set_circuit_breaker(breaker)
+        self.addCleanup(TMDBService.set_circuit_breaker, None)
+        with self.assertLogs('movies.services', 'WARNING'):
+            breaker.record(0.1, failed=True)
+            breaker.record(0.1, failed=True)
+        clock.now = 30
+        transport = mock.Mock()
+        TMDBService.set_transport(transport)
+        params = {'with_genres': 35, 'sort_by': 'popularity.desc', 'page': 1}
+        cache_key = TMDBService._cache_key('/discover/movie', params)
+        # Another worker is fetching and publishes its result
+        cache.add(TMDBService.FLIGHT_KEY.format(key=cache_key), True, 5)
+        cache.set(TMDBService.FLIGHT_RESULT_KEY.format(key=cache_key), {'results': self.results}, 5)
+
+        self.assertEqual(TMDBService.discover_by_genre(35), self.results)
+
+        transport.get.assert_not_called()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # The trial slot was handed back for a real call
+        self.assertTrue(breaker.allow_request())
+
+    def test_rate_limited_calls_fail_fast_without_calling_tmdb(self):
+        transport = mock.Mock()
+        TMDBService.set_transport(transport)
+        limiter = mock.Mock()
+        limiter.reserve.return_value = None
+        TMDBService.set_rate_limiter(limiter)
+
+        with self.assertRaises(RateLimited):
+            TMDBService.discover_by_genre(35)
+        transport.get.assert_not_called()
+
+    @override_settings(TMDB_RATE_LIMIT=0)
+    def test_rate_limit_can_be_disabled(self):
+        TMDBService.set_rate_limiter(None)
+        self.assertIsNone(TMDBService.get_rate_limiter())
+
+
+@override_settings(CANDIDATE_POOL_BACKGROUND_REFILL=False)
+class PrecomputeTests(TestCase):
+    """Tests for the precompute queue, worker and batch serving"""
+    fixtures = ['candidate_pool.json']
+
+    def setUp(self):
+        cache.clear()
+        invalidate_active_moods()
+        self.user = User.objects.create_user(username='tester', password='testpass123', last_login=timezone.now())
+        self.mood = Mood.objects.get(name='Happy')
+        patcher = mock.patch.object(TMDBService, 'discover_by_genre', side_effect=fake_discover_by_genre)
+        self.discover_by_genre = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def drain(self):
+        call_command('precompute_worker', '--once', stdout=mock.Mock())
+
+    def test_serving_queues_the_next_batch_for_every_mood(self):
+        RecommendationService.recommend(self.user, self.mood, count=2)
+
+        self.assertEqual(
+            set(PrecomputeJob.objects.filter(user=self.user).values_list('mood_id', flat=True)),
+            set(Mood.objects.filter(is_active=True).values_list('id', flat=True)),
+        )
+        self.drain()
+        self.assertFalse(PrecomputeJob.objects.exists())
+
+        picks = PrecomputedPick.objects.filter(user=self.user)
+        self.assertEqual(list(picks.filter(mood=self.mood).order_by('rank').values_list('movie_id', flat=True)), [3, 4])
+        # Batches never repeat a movie across moods
+        movie_ids = list(picks.values_list('movie_id', flat=True))
+        self.assertEqual(len(movie_ids), len(set(movie_ids)))
+
+    @mock.patch.object(TMDBService, '_make_request', side_effect=AssertionError('TMDB called'))
+    def test_recommend_pops_a_ready_batch(self, make_request):
+        RecommendationService.recommend(self.user, self.mood, count=2)
+        self.drain()
+
+        # Batch claim (DELETE ... RETURNING), movie read, recommendation
+        # insert, next-batch job insert, plus two savepoints
+        with self.assertNumQueries(8):
+            movies, recommendations = RecommendationService.recommend(self.user, self.mood, count=2)
+        self.assertEqual([movie.pk for movie in movies], [3, 4])
+        self.assertEqual(len(recommendations), 2)
+        self.assertFalse(PrecomputedPick.objects.filter(user=self.user, movie_id__in=[3, 4]).exists())
+
+    def test_pop_claims_a_batch_in_one_statement(self):
+        PrecomputedBatch.build(self.user, self.mood, size=3)
+        other = Mood.objects.get(name='Sad')
+        PrecomputedPick.objects.filter(user=self.user, mood=self.mood, rank=3).update(mood=other, rank=1)
+
+        with CaptureQueriesContext(connection) as context:
+            movies = PrecomputedBatch.pop(self.user, self.mood, 2, seen=set())
+        self.assertEqual([movie.pk for movie in movies], [1, 2])
+        self.assertTrue(context.captured_queries[0]['sql'].startswith('DELETE'))
+        self.assertIn('RETURNING', context.captured_queries[0]['sql'])
+        self.assertEqual(list(PrecomputedPick.objects.values_list('mood_id', 'movie_id')), [(other.pk, 3)])
+
+        # A short batch is a miss and is left in place
+        with self.assertNumQueries(1):
+            self.assertEqual(PrecomputedBatch.pop(self.user, other, 2, seen=set()), [])
+        self.assertEqual(PrecomputedPick.objects.count(), 1)
+
+    def test_pop_without_returning_support(self):
+        PrecomputedBatch.build(self.user, self.mood, size=2)
+        with mock.patch.object(connection.features, 'can_return_columns_from_insert', False):
+            movies = PrecomputedBatch.pop(self.user, self.mood, 2, seen=set())
+        self.assertEqual([movie.pk for movie in movies], [1, 2])
+        self.assertFalse(PrecomputedPick.objects.exists())
+
+    def test_stale_batch_falls_back_to_the_live_path(self):
+        RecommendationService.recommend(self.user, self.mood, count=2)
+        self.drain()
+        # Served through another path since the batch was built
+        SeenSet.for_user(self.user).add([3])
+
+        movies, _ = RecommendationService.recommend(self.user, self.mood, count=2)
+        self.assertEqual([movie.pk for movie in movies], [4, 5])
+
+    def test_pool_refresh_drops_invalidated_picks_and_requeues_active_users(self):
+        other = User.objects.create_user(username='other', last_login=timezone.now())
+        idle = User.objects.create_user(username='idle', last_login=timezone.now() - timedelta(days=60))
+        PrecomputedBatch.build(self.user, self.mood)
+        PrecomputedBatch.build(idle, self.mood)
+        # A pick from the catalog, which the refreshed pool won't contain
+        dropped = TMDBService.create_or_update_movie(fake_discover_results([16], 3)[0])
+        PrecomputedPick.objects.create(user=other, mood=self.mood, movie=dropped, rank=1)
+
+        CandidatePool.refresh(self.mood)
+
+        self.assertFalse(PrecomputedPick.objects.filter(movie=dropped).exists())
+        self.assertEqual(PrecomputedPick.objects.filter(mood=self.mood).count(), 4)
+        # Active users and those who lost picks are queued; idle ones keep their batch
+        self.assertEqual(
+            set(PrecomputeJob.objects.values_list('user_id', 'mood_id')),
+            {(self.user.pk, self.mood.pk), (other.pk, self.mood.pk)},
+        )
+
+    def test_build_reuses_the_cached_seen_set(self):
+        RecommendationService.recommend(self.user, self.mood, count=2)
+
+        with mock.patch.object(SeenSet, 'from_history', side_effect=AssertionError('history rescanned')):
+            self.drain()
+
+        self.assertEqual(list(PrecomputedPick.objects.filter(user=self.user, mood=self.mood).order_by('rank').values_list('movie_id', flat=True)), [3, 4])
+
+    def test_workers_never_claim_the_same_job(self):
+        PrecomputeQueue.enqueue([self.user.pk], [self.mood.pk])
+        PrecomputeQueue.enqueue([self.user.pk], [self.mood.pk])
+        self.assertEqual(PrecomputeJob.objects.count(), 1)
+
+        self.assertEqual(len(PrecomputeQueue.claim('worker-a')), 1)
+        self.assertEqual(PrecomputeQueue.claim('worker-b'), [])
+
+        # worker-a died: its claim expires
+        with override_settings(PRECOMPUTE_JOB_TIMEOUT=-1):
+            self.assertEqual(len(PrecomputeQueue.claim('worker-b')), 1)
+
+    @override_settings(PRECOMPUTE_MAX_ATTEMPTS=2, PRECOMPUTE_RETRY_DELAY=0)
+    def test_failed_jobs_are_retried_then_kept_as_failed(self):
+        PrecomputeQueue.enqueue([self.user.pk], [self.mood.pk])
+        with mock.patch.object(PrecomputedBatch, 'build', side_effect=TMDBUnavailable('down')), \
+                self.assertLogs('movies.services', 'WARNING'):
+            self.drain()
+
+        job = PrecomputeJob.objects.get()
+        self.assertEqual((job.status, job.attempts, job.last_error), (PrecomputeJob.FAILED, 2, 'down'))
+
+
+class DatabaseProfileTests(TestCase):
+    """Tests for the production SQLite profile"""
+
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'profile.sqlite3')
+
+    def connect(self, **options):
+        database = sqlite_database(self.path, 'production', busy_timeout=0.1)
+        database['OPTIONS'].update(options)
+        # configure_settings() fills in the defaults Django gives every alias
+        connections.configure_settings({'default': database})
+        patch = mock.patch.dict(connections.settings, {'profile': database})
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(connections.__delitem__, 'profile')
+        self.addCleanup(lambda: connections['profile'].close())
+        return connections['profile']
+
+    def test_connection_runs_pragmas_and_begins_immediate(self):
+        conn = self.connect()
+        with conn.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 100)
+
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with transaction.atomic(using='profile'):
+            # The write lock is taken at BEGIN, before any write
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+                other.execute('BEGIN IMMEDIATE')
+        other.execute('BEGIN IMMEDIATE')
+        other.rollback()
+
+    def test_invalid_transaction_mode_is_rejected(self):
+        conn = self.connect(transaction_mode='SOMETIMES')
+        with self.assertRaises(ImproperlyConfigured):
+            conn.ensure_connection()
+        with self.assertRaises(ValueError):
+            sqlite_database(self.path, 'staging')
+
+    def test_replica_copy_is_readable(self):
+        conn = self.connect()
+        with conn.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x INTEGER)')
+            cursor.execute('INSERT INTO t VALUES (1)')
+        replica = self.path + '.replica'
+        copy_sqlite_database(self.path, replica)
+        with sqlite3.connect(replica) as copy:
+            self.assertEqual(copy.execute('SELECT x FROM t').fetchall(), [(1,)])
+        copy.close()
+
+
+    def test_contention_benchmark_gives_readers_a_migrated_replica(self):
+        replica = self.path + '.replica'
+        with sqlite3.connect(self.path) as primary:
+            primary.execute('CREATE TABLE auth_user (id INTEGER)')
+        primary.close()
+        with self.assertRaisesMessage(CommandError, 'no movies_recommendation table'):
+            ContentionBenchmark().prepare_replica(self.path, replica)
+
+        with sqlite3.connect(self.path) as primary:
+            primary.execute('CREATE TABLE movies_recommendation (id INTEGER)')
+        primary.close()
+        open(replica + '-wal', 'wb').close()  # Left over from an earlier profile
+        ContentionBenchmark().prepare_replica(self.path, replica)
+        self.assertFalse(os.path.exists(replica + '-wal'))
+        with sqlite3.connect(replica) as copy:
+            tables = {name for name, in copy.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        copy.close()
+        self.assertEqual(tables, {'auth_user', 'movies_recommendation'})
+
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    """Tests for the read replica router (no queries: it only picks aliases)"""
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def test_reads_go_to_replica_only_when_asked_and_configured(self):
+        with mock.patch.dict(settings.DATABASES):
+            settings.DATABASES.pop('replica', None)
+            with read_from_replica():
+                self.assertEqual(self.router.db_for_read(Movie), 'default')  # No replica configured
+
+        with mock.patch.dict(settings.DATABASES, {'replica': {}}):
+            self.assertEqual(self.router.db_for_read(Movie), 'default')
+            with read_from_replica():
+                self.assertEqual(self.router.db_for_read(Recommendation), 'replica')
+                self.assertEqual(self.router.db_for_write(Recommendation), 'default')
+                with mock.patch.object(connections['default'], 'in_atomic_block', True):
+                    # Reads in a transaction on the primary must see its writes
+                    self.assertEqual(self.router.db_for_read(Recommendation), 'default')
+            self.assertEqual(self.router.db_for_read(Movie), 'default')
+
+    def test_replica_is_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'movies'))
+        self.assertTrue(self.router.allow_migrate('default', 'movies'))
+
+
+@override_settings(EXPORT_CHUNK_SIZE=4)
+class RecommendationExportTests(TestCase):
+    """Tests for the streaming recommendation history export"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='testpass123')
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.mood = Mood.objects.get(name='Happy')
+        movies = TMDBService.create_or_update_movies(fake_discover_results([35], 1))
+        Movie.objects.filter(pk=movies[0].pk).update(rating=None, release_date=None)
+        Recommendation.objects.bulk_create(
+            [Recommendation(user=self.user, movie=movie, mood=self.mood, user_rating=index % 5 or None)
+             for index, movie in enumerate(movies[:10])]
+            + [Recommendation(user=other, movie=movies[10], mood=self.mood)]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_ndjson_export_streams_the_users_history_in_chunks(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/movies/recommendations/export.ndjson')
+            self.assertTrue(response.streaming)
+            chunks = [chunk for chunk in response.streaming_content if chunk]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(chunks), 3)  # 10 rows, 4 per chunk
+
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        history = Recommendation.objects.filter(user=self.user).order_by('recommended_at', 'id')
+        self.assertEqual([row['id'] for row in rows], [recommendation.pk for recommendation in history])
+        self.assertEqual(set(rows[0]), set(COLUMNS))
+        self.assertEqual({row['username'] for row in rows}, {'tester'})
+        self.assertIn(None, [row['release_date'] for row in rows])
+
+    def test_csv_export_is_gzipped_when_accepted(self):
+        response = self.client.get('/api/movies/recommendations/export.csv', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        rows = list(csv.reader(io.StringIO(gzip.decompress(b''.join(response.streaming_content)).decode())))
+        self.assertEqual(tuple(rows[0]), COLUMNS)
+        self.assertEqual(len(rows), 11)
+        self.assertEqual(rows[1][COLUMNS.index('mood')], 'Happy')
+
+    def test_export_filters_by_mood_and_rejects_unknown_formats(self):
+        response = self.client.get(f'/api/movies/recommendations/export.ndjson?mood_id={self.mood.pk + 1}')
+        self.assertEqual(b''.join(response.streaming_content), b'')
+        self.assertEqual(self.client.get('/api/movies/recommendations/export.xml').status_code, 404)
+
+    def test_export_negotiates_the_media_type_of_its_suffix(self):
+        response = self.client.get('/api/movies/recommendations/export.csv', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(len(list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))), 11)
+
+        response = self.client.get(
+            '/api/movies/recommendations/export.ndjson', HTTP_ACCEPT='application/x-ndjson, application/json;q=0.5',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 10)
+
+        response = self.client.get('/api/movies/recommendations/export.csv', HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, 406)
+
+    def test_export_rejects_a_non_integer_mood_id(self):
+        response = self.client.get('/api/movies/recommendations/export.ndjson?mood_id=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {'mood_id': ['A valid integer is required.']})
+
+        response = self.client.get('/api/movies/recommendations/export.csv?mood_id=abc', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content.decode().splitlines(), ['mood_id', 'A valid integer is required.'])
+
+    async def test_async_export_streams_without_buffering(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/api/movies/recommendations/export.ndjson')
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(body.splitlines()), 10)
+
+    def test_command_exports_every_user_or_one(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'export.ndjson.gz')
+
+        call_command('export_recommendations', '--gzip', '--output', path, '--chunk-size', '3', stderr=io.StringIO())
+        with gzip.open(path, 'rt') as export:
+            self.assertEqual(len(export.readlines()), 11)
+
+        stderr = io.StringIO()
+        call_command('export_recommendations', '--user', 'other', '--format', 'csv', '--output', path, stderr=stderr)
+        with open(path) as export:
+            self.assertEqual(len(list(csv.reader(export))), 2)
+        self.assertIn('1 recommendations exported', stderr.getvalue())
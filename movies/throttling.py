@@ -0,0 +1,211 @@
+"""
+Outbound call control for TMDBService
+SingleFlight coalesces identical calls in flight in one process, so one
+fetch answers every caller waiting on it. The token buckets pace calls to
+TMDB_RATE_LIMIT per second with bursts of TMDB_RATE_LIMIT_BURST, per
+process (local), across workers sharing a Django cache (cache) or across
+workers on one host (file)
+"""
+import abc
+import asyncio
+import os
+import struct
+import threading
+import time
+import uuid
+import weakref
+from concurrent.futures import Future
+
+from django.core.cache import caches
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class SingleFlight:
+    """Run one call per key at a time; concurrent callers share its outcome"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines, one set of in-flight calls per event loop"""
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key, func, *args):
+        calls = self._calls.setdefault(asyncio.get_running_loop(), {})
+        while key in calls:
+            future = calls[key]
+            try:
+                # A cancelled waiter must not cancel the call others wait on
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled: take over
+
+        future = calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await func(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Retrieved: no "never retrieved" warning without waiters
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if calls.get(key) is future:
+                del calls[key]
+
+
+class TokenBucket(abc.ABC):
+    """
+    Token bucket refilled at `rate` tokens per second, holding up to `burst`
+    reserve() takes a token ahead of time and returns how long to wait for
+    it, so concurrent callers are served in arrival order without polling.
+    Subclasses keep the (tokens, updated) state where all workers see it
+    """
+
+    def __init__(self, rate, burst=1, clock=time.time):
+        if rate <= 0:
+            raise ValueError('Token bucket rate must be positive')
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.clock = clock
+
+    @abc.abstractmethod
+    def reserve(self, max_wait=None):
+        """Seconds to wait for a token, or None if that's longer than max_wait (nothing is taken)"""
+
+    def _take(self, state, max_wait):
+        """Return (new_state, wait); new_state is None when the token isn't taken"""
+        now = self.clock()
+        tokens, updated = state if state is not None else (self.burst, now)
+        tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+        wait = max(0.0, (1 - tokens) / self.rate)
+        if max_wait is not None and wait > max_wait:
+            return None, wait
+        return (tokens - 1, now), wait
+
+
+class LocalTokenBucket(TokenBucket):
+    """Token bucket for this process only"""
+
+    def __init__(self, rate, burst=1, clock=time.time):
+        super().__init__(rate, burst, clock)
+        self._state = None
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait=None):
+        with self._lock:
+            state, wait = self._take(self._state, max_wait)
+            if state is None:
+                return None
+            self._state = state
+            return wait
+
+
+class CacheTokenBucket(TokenBucket):
+    """
+    Token bucket kept in a Django cache, shared by every worker using it
+    Updates are serialized by a lock taken with cache.add(), which is
+    atomic on Redis, Memcached and the database cache. A caller that can't
+    get the lock within LOCK_WAIT seconds takes no token
+    """
+    LOCK_TIMEOUT = 2
+    LOCK_WAIT = 2.0
+
+    def __init__(self, alias='default', key='tmdb:ratelimit', rate=1, burst=1, clock=time.time):
+        super().__init__(rate, burst, clock)
+        self.alias = alias
+        self.key = key
+        self.lock_key = f'{key}:lock'
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def reserve(self, max_wait=None):
+        token = self._acquire()
+        if token is None:
+            return None
+        try:
+            state, wait = self._take(self.cache.get(self.key), max_wait)
+            if state is None:
+                return None
+            # Once idle long enough to refill, a missing entry means a full bucket
+            self.cache.set(self.key, state, int(self.burst / self.rate) + 60)
+            return wait
+        finally:
+            self._release(token)
+
+    def _acquire(self):
+        """Take the lock and return this caller's token, or None after LOCK_WAIT seconds"""
+        # A worker that died holding the lock releases it after LOCK_TIMEOUT
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.LOCK_WAIT
+        while not self.cache.add(self.lock_key, token, self.LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.001)
+        return token
+
+    def _release(self, token):
+        # The lock may have expired and been taken by another worker meanwhile
+        if self.cache.get(self.lock_key) == token:
+            self.cache.delete(self.lock_key)
+
+
+class FileTokenBucket(TokenBucket):
+    """Token bucket in a small file locked with flock(), shared by workers on one host"""
+    STATE = struct.Struct('dd')
+
+    def __init__(self, path, rate=1, burst=1, clock=time.time):
+        if fcntl is None:
+            raise ValueError('The file rate limiter needs fcntl (not available on this platform)')
+        super().__init__(rate, burst, clock)
+        self.path = os.fspath(path)
+
+    def reserve(self, max_wait=None):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            data = os.pread(fd, self.STATE.size, 0)
+            state, wait = self._take(self.STATE.unpack(data) if len(data) == self.STATE.size else None, max_wait)
+            if state is None:
+                return None
+            os.pwrite(fd, self.STATE.pack(*state), 0)
+            return wait
+        finally:
+            os.close(fd)
@@ -0,0 +1,124 @@
+"""
+Record/replay transports for TMDBService
+A transport takes (endpoint, params) and returns the decoded JSON body.
+Recording wraps the live transport and saves every response to a
+FixtureStore; replay serves them from disk so load tests run offline
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+from .payloads import ENCODINGS, ZLIB, decode_payload, encode_payload
+
+
+class ReplayMiss(requests.exceptions.RequestException):
+    """No recorded response for a request made in replay mode"""
+
+
+class FixtureStore:
+    """
+    Directory of recorded TMDB responses, one compressed file per request
+    Files are named <key>.<encoding>, where key is the response cache key,
+    so the api_key never ends up on disk
+    """
+
+    def __init__(self, path, compression=ZLIB):
+        self.path = os.fspath(path)
+        self.compression = compression
+
+    def load(self, key):
+        """The recorded entry for key, or None"""
+        for encoding in ENCODINGS:
+            filename = self._filename(key, encoding)
+            try:
+                with open(filename, 'rb') as fixture:
+                    return decode_payload(encoding, fixture.read())
+            except FileNotFoundError:
+                continue
+        return None
+
+    def save(self, key, entry):
+        """Write an entry atomically, replacing any earlier recording"""
+        os.makedirs(self.path, exist_ok=True)
+        encoding, blob = encode_payload(entry, self.compression)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fixture:
+            fixture.write(blob)
+        os.replace(tmp_path, self._filename(key, encoding))
+        # Drop copies of the same key left by a different compression
+        for other in ENCODINGS:
+            if other != encoding:
+                try:
+                    os.remove(self._filename(key, other))
+                except FileNotFoundError:
+                    pass
+
+    def keys(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted({
+            name.rsplit('.', 1)[0]
+            for name in os.listdir(self.path)
+            if name.rsplit('.', 1)[-1] in ENCODINGS
+        })
+
+    def _filename(self, key, encoding):
+        return os.path.join(self.path, f"{key.replace(':', '-')}.{encoding}")
+
+
+class RecordingTransport:
+    """Passes requests through to `inner` and records each successful response"""
+
+    def __init__(self, inner, store, key_func):
+        self.inner = inner
+        self.store = store
+        self.key_func = key_func
+
+    def get(self, endpoint, params):
+        start = time.perf_counter()
+        data = self.inner.get(endpoint, params)
+        self.store.save(self.key_func(endpoint, params), {
+            'endpoint': endpoint,
+            'params': {key: value for key, value in params.items() if key != 'api_key'},
+            'elapsed': round(time.perf_counter() - start, 6),
+            'recorded_at': datetime.now(timezone.utc).isoformat(),
+            'data': data,
+        })
+        return data
+
+
+class ReplayTransport:
+    """
+    Serves recorded responses from a FixtureStore
+    `latency` is a fixed delay in seconds, or 'recorded' to replay the
+    latency observed while recording
+    """
+    RECORDED = 'recorded'
+
+    def __init__(self, store, key_func, latency=0.0):
+        self.store = store
+        self.key_func = key_func
+        self.latency = latency
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint, params):
+        key = self.key_func(endpoint, params)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self.store.load(key)
+            if entry is None:
+                query = json.dumps(params, sort_keys=True, default=str)
+                raise ReplayMiss(f"No recorded TMDB response for {endpoint} {query}")
+            with self._lock:
+                self._entries[key] = entry
+
+        delay = entry.get('elapsed', 0.0) if self.latency == self.RECORDED else float(self.latency or 0)
+        if delay > 0:
+            time.sleep(delay)
+        return entry['data']
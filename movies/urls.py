@@ -7,6 +7,7 @@ urlpatterns = [
     # Template views (HTML frontend)
     path('moods/', views.mood_selection_template_view, name='mood-selection'),
     path('recommend/<int:mood_id>/', views.get_recommendations_template_view, name='get-recommendations'),
+    path('recommend/<int:mood_id>/async/', views.get_recommendations_async_template_view, name='get-recommendations-async'),
     path('history/', views.recommendation_history_template_view, name='recommendation-history'),
 ]
 
@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 # API URLs - no app_name needed as it's only included once
@@ -9,9 +9,12 @@ urlpatterns = [
     
     # Recommendation endpoints
     path('recommend/', views.recommend_movies_view, name='movie-recommend'),
+    path('recommend/async/', views.recommend_movies_async_view, name='movie-recommend-async'),
     path('recommendations/', views.recommendation_history_view, name='recommendation-history'),
     path('recommendations/<int:pk>/', views.recommendation_detail_view, name='recommendation-detail'),
     path('recommendations/<int:pk>/view/', views.mark_recommendation_viewed_view, name='mark-recommendation-viewed'),
     path('recommendations/<int:pk>/delete/', views.delete_recommendation_view, name='delete-recommendation'),
+    re_path(r'^recommendations/export\.(?P<format>ndjson|csv)$', views.export_recommendations_view,
+            name='export-recommendations'),
 ]
 
@@ -1,24 +1,58 @@
+import json
+import logging
+import re
+
+from asgiref.sync import sync_to_async
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.authentication import CSRFCheck
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.utils import timezone
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.utils.cache import patch_vary_headers
+from django.utils.http import quote_etag
+from accounts.authentication import SignedTokenAuthentication, averify_token, get_token, token_user
+from movieflick.conditional import make_etag, not_modified_response, set_validators
+from movieflick.routers import read_from_replica
 from .models import Movie, Recommendation
 from .serializers import (
     MovieSerializer,
+    MovieFilterSerializer,
+    MovieValuesSerializer,
     RecommendationSerializer,
+    RecommendationValuesSerializer,
     RecommendationCreateSerializer,
     MovieRecommendationResponseSerializer
 )
-from .services import TMDBService
+from .async_services import AsyncRecommendationService
+from .exports import CSVRenderer, Exporter, NDJSONRenderer, export_queryset
+from .pagination import MovieCursorPagination, RecommendationCursorPagination
+from .seen import SeenSet
+from .services import RecommendationService, TMDBService, TMDBUnavailable
+from moods.cache import get_active_moods
 from moods.models import Mood
 from moods.serializers import MoodSerializer
 
 
+logger = logging.getLogger(__name__)
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+# Per-user responses: browsers may keep them but must revalidate each time
+PRIVATE_REVALIDATE = {'private': True, 'no_cache': True}
+
+TMDB_UNAVAILABLE_MESSAGE = 'Movie recommendations are temporarily unavailable. Please try again shortly.'
+
+
 @csrf_exempt
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -49,33 +83,15 @@ def recommend_movies_view(request):
         )
     
     try:
-        # Fetch 2 movies from TMDB
-        tmdb_movies_data = TMDBService.fetch_movies_by_mood(mood.name, count=2)
+        # Fetch 2 movies and record them as recommendations
+        movies, recommendations = RecommendationService.recommend(request.user, mood, count=2)
         
-        if not tmdb_movies_data:
+        if not movies:
             return Response(
                 {'error': 'No movies found for this mood'},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Create or update Movie objects and Recommendation objects
-        movies = []
-        recommendation_ids = []
-        
-        for tmdb_movie in tmdb_movies_data:
-            # Create or update movie
-            movie = TMDBService.create_or_update_movie(tmdb_movie)
-            movies.append(movie)
-            
-            # Create recommendation (always create new entry)
-            recommendation = Recommendation.objects.create(
-                user=request.user,
-                movie=movie,
-                mood=mood,
-                recommended_at=timezone.now()
-            )
-            recommendation_ids.append(recommendation.id)
-        
         # Serialize response
         movie_serializer = MovieSerializer(movies, many=True)
         mood_serializer = MoodSerializer(mood)
@@ -83,71 +99,246 @@ def recommend_movies_view(request):
         response_data = {
             'mood': mood_serializer.data,
             'movies': movie_serializer.data,
-            'recommendations': recommendation_ids,
+            'recommendations': [recommendation.id for recommendation in recommendations],
             'count': len(movies)
         }
         
         return Response(response_data, status=status.HTTP_200_OK)
         
-    except Exception as e:
+    except TMDBUnavailable:
+        logger.warning('Recommendations for mood %s failed: TMDB unavailable', mood.name, exc_info=True)
+        retry_after = TMDBService.get_circuit_breaker().retry_after()
         return Response(
-            {'error': str(e)},
+            {'error': TMDB_UNAVAILABLE_MESSAGE},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Retry-After': str(max(1, round(retry_after)))}
+        )
+    except Exception:
+        logger.exception('Recommendations for mood %s failed', mood.name)
+        return Response(
+            {'error': 'Could not get recommendations'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
 
+def unauthorized_response(detail):
+    """401 with the challenge DRF sends through SignedTokenAuthentication.authenticate_header"""
+    response = JsonResponse({'detail': detail}, status=status.HTTP_401_UNAUTHORIZED)
+    response['WWW-Authenticate'] = SignedTokenAuthentication().authenticate_header(None)
+    return response
+
+
+async def authenticate_async(request):
+    """
+    The user of a bearer token or, failing that, of the session, with the
+    CSRF check DRF applies to session users; (user, error response)
+    """
+    try:
+        token = get_token(request)
+        if token is not None:
+            return token_user(await averify_token(token)), None
+    except AuthenticationFailed as e:
+        return None, unauthorized_response(e.detail)
+    
+    user = await request.auser()
+    if not user.is_authenticated:
+        return None, unauthorized_response('Authentication credentials were not provided.')
+    check = CSRFCheck(lambda request: None)
+    check.process_request(request)
+    reason = check.process_view(request, None, (), {})
+    if reason:
+        return None, JsonResponse({'detail': f'CSRF Failed: {reason}'}, status=status.HTTP_403_FORBIDDEN)
+    return user, None
+
+
+@csrf_exempt
+@require_POST
+async def recommend_movies_async_view(request):
+    """
+    Async version of recommend_movies_view for ASGI deployments
+    Same request, response and authentication; TMDB is awaited without
+    holding a worker thread
+    """
+    user, error = await authenticate_async(request)
+    if error is not None:
+        return error
+    
+    try:
+        data = json.loads(request.body or b'{}') if request.content_type == 'application/json' else request.POST
+        mood_id = int(data.get('mood_id'))
+    except (TypeError, ValueError, AttributeError):
+        return JsonResponse({'mood_id': ['A valid integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+    
+    mood = await Mood.objects.filter(id=mood_id, is_active=True).afirst()
+    if mood is None:
+        return JsonResponse({'mood_id': ['Invalid mood ID']}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        movies, recommendations = await AsyncRecommendationService.recommend(user, mood, count=2)
+    except TMDBUnavailable:
+        logger.warning('Recommendations for mood %s failed: TMDB unavailable', mood.name, exc_info=True)
+        retry_after = TMDBService.get_circuit_breaker().retry_after()
+        response = JsonResponse({'error': TMDB_UNAVAILABLE_MESSAGE}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = str(max(1, round(retry_after)))
+        return response
+    except Exception:
+        logger.exception('Recommendations for mood %s failed', mood.name)
+        return JsonResponse(
+            {'error': 'Could not get recommendations'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    
+    if not movies:
+        return JsonResponse(
+            {'error': 'No movies found for this mood'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    return JsonResponse({
+        'mood': MoodSerializer(mood).data,
+        'movies': MovieSerializer(movies, many=True).data,
+        'recommendations': [recommendation.id for recommendation in recommendations],
+        'count': len(movies)
+    })
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica()
 def movie_list_view(request):
-    """List all movies in the database"""
-    movies = Movie.objects.all()
-    serializer = MovieSerializer(movies, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    """
+    List movies in the database, newest first
+    Cursor-paginated; optional filters: genre, min_rating, max_rating,
+    released_after and released_before (YYYY-MM-DD)
+    """
+    filters = MovieFilterSerializer(data=request.query_params)
+    if not filters.is_valid():
+        return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    movies = Movie.objects.lean().filter_catalog(**filters.validated_data)
+    
+    paginator = MovieCursorPagination()
+    if use_fast_serializers():
+        fast = MovieValuesSerializer()
+        movies = movies.values(*fast.value_fields, *paginator.ordering_fields)
+        page = paginator.paginate_queryset(movies, request)
+        return paginator.get_paginated_response(fast.serialize(page))
+    
+    page = paginator.paginate_queryset(movies, request)
+    serializer = MovieSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica()
 def movie_detail_view(request, pk):
-    """Get movie details by ID"""
+    """
+    Get movie details by ID
+    Supports If-None-Match / If-Modified-Since, driven by updated_at
+    """
+    # Unordered slice rather than .first(), which would add an ORDER BY
+    versions = list(Movie.objects.filter(pk=pk).order_by().values_list('updated_at', flat=True)[:1])
+    if not versions:
+        return Response(
+            {'error': 'Movie not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    updated_at = versions[0]
+    etag = quote_etag(f"movie-{pk}-{updated_at.timestamp():.6f}")
+    not_modified = not_modified_response(request, etag=etag, last_modified=updated_at, **PRIVATE_REVALIDATE)
+    if not_modified is not None:
+        return not_modified
+    
     try:
-        movie = Movie.objects.get(pk=pk)
+        movie = Movie.objects.lean().get(pk=pk)
     except Movie.DoesNotExist:
         return Response(
             {'error': 'Movie not found'},
             status=status.HTTP_404_NOT_FOUND
         )
     serializer = MovieSerializer(movie)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    response = Response(serializer.data, status=status.HTTP_200_OK)
+    return set_validators(response, etag=etag, last_modified=movie.updated_at, **PRIVATE_REVALIDATE)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica()
 def recommendation_history_view(request):
-    """Get user's recommendation history"""
+    """
+    Get user's recommendation history, newest first
+    Cursor-paginated; `fields=id,movie,...` limits the returned fields
+    """
+    fields = parse_fields_param(request)
+    
+    # Only join the relations that will be serialized
     recommendations = Recommendation.objects.filter(user=request.user)
+    if fields is None or 'movie' in fields:
+        recommendations = recommendations.with_movie()
+    related = [name for name in ('mood', 'user') if fields is None or name in fields]
+    recommendations = recommendations.select_related(*related)
     
     # Optional: Filter by mood
     mood_id = request.query_params.get('mood_id')
     if mood_id:
         recommendations = recommendations.filter(mood_id=mood_id)
     
-    serializer = RecommendationSerializer(recommendations, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    paginator = RecommendationCursorPagination()
+    if use_fast_serializers():
+        # .values() joins exactly the relations the projection reads
+        fast = RecommendationValuesSerializer(fields=fields)
+        recommendations = recommendations.values(*fast.value_fields, *paginator.ordering_fields)
+        page = paginator.paginate_queryset(recommendations, request)
+        return paginator.get_paginated_response(fast.serialize(page))
+    
+    page = paginator.paginate_queryset(recommendations, request)
+    serializer = RecommendationSerializer(page, many=True, fields=fields)
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica()
 def recommendation_detail_view(request, pk):
-    """Get specific recommendation details"""
+    """
+    Get specific recommendation details
+    Supports If-None-Match; the ETag hashes the row's mutable columns and
+    the movie's updated_at
+    """
+    versions = list(
+        Recommendation.objects
+        .filter(pk=pk, user=request.user)
+        .order_by()
+        .values_list('viewed', 'user_rating', 'recommended_at', 'movie_id', 'movie__updated_at', 'mood_id')[:1]
+    )
+    if not versions:
+        return Response(
+            {'error': 'Recommendation not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    version = versions[0]
+    mood_etag = get_active_moods()['etags'].get(version[-1])
+    etag = make_etag([pk, *version, mood_etag])
+    not_modified = not_modified_response(request, etag=etag, **PRIVATE_REVALIDATE)
+    if not_modified is not None:
+        return not_modified
+    
     try:
-        recommendation = Recommendation.objects.get(pk=pk, user=request.user)
+        recommendation = (
+            Recommendation.objects
+            .with_movie()
+            .select_related('mood', 'user')
+            .get(pk=pk, user=request.user)
+        )
     except Recommendation.DoesNotExist:
         return Response(
             {'error': 'Recommendation not found'},
             status=status.HTTP_404_NOT_FOUND
         )
     serializer = RecommendationSerializer(recommendation)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    response = Response(serializer.data, status=status.HTTP_200_OK)
+    return set_validators(response, etag=etag, **PRIVATE_REVALIDATE)
 
 
 @csrf_exempt
@@ -156,7 +347,12 @@ def recommendation_detail_view(request, pk):
 def mark_recommendation_viewed_view(request, pk):
     """Mark a recommendation as viewed"""
     try:
-        recommendation = Recommendation.objects.get(pk=pk, user=request.user)
+        recommendation = (
+            Recommendation.objects
+            .with_movie()
+            .select_related('mood', 'user')
+            .get(pk=pk, user=request.user)
+        )
     except Recommendation.DoesNotExist:
         return Response(
             {'error': 'Recommendation not found'},
@@ -164,7 +360,7 @@ def mark_recommendation_viewed_view(request, pk):
         )
     
     recommendation.viewed = True
-    recommendation.save()
+    recommendation.save(update_fields=['viewed'])
     
     serializer = RecommendationSerializer(recommendation)
     return Response(serializer.data, status=status.HTTP_200_OK)
@@ -184,17 +380,65 @@ def delete_recommendation_view(request, pk):
         )
     
     recommendation.delete()
+    SeenSet.invalidate(request.user.pk)
     return Response(
         {'message': 'Recommendation deleted successfully'},
         status=status.HTTP_200_OK
     )
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([NDJSONRenderer, CSVRenderer])
+@read_from_replica()
+def export_recommendations_view(request, format):
+    """
+    Stream the user's full recommendation history, oldest first, as NDJSON
+    or CSV; gzipped when the client accepts it. Optional filter: mood_id
+    The URL suffix picks the format, so Accept must allow its media type
+    """
+    recommendations = export_queryset(Recommendation.objects.filter(user=request.user))
+    mood_id = request.query_params.get('mood_id')
+    if mood_id:
+        try:
+            recommendations = recommendations.filter(mood_id=int(mood_id))
+        except ValueError:
+            return Response({'mood_id': ['A valid integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+    # The rows are read after the view returns: pin the database chosen now
+    recommendations = recommendations.using(recommendations.db)
+    
+    compress = bool(ACCEPTS_GZIP.search(request.headers.get('Accept-Encoding', '')))
+    exporter = Exporter(format, compress=compress)
+    if isinstance(request._request, ASGIRequest):
+        content = exporter.astream(recommendations)
+    else:
+        content = exporter.stream(recommendations)
+    response = StreamingHttpResponse(content, content_type=exporter.content_type)
+    response['Content-Disposition'] = f'attachment; filename="recommendations.{format}"'
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
+
+
+def use_fast_serializers():
+    """Whether list endpoints use the .values() fast serializers"""
+    return getattr(settings, 'FAST_SERIALIZERS', False)
+
+
+def parse_fields_param(request):
+    """Parse the optional comma-separated `fields` query param"""
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
 # Template Views for HTML frontend
 @login_required
 def mood_selection_template_view(request):
     """Template view for mood selection"""
-    moods = Mood.objects.filter(is_active=True)
+    moods = get_active_moods()['moods']
     return render(request, 'movies/mood_selection.html', {'moods': moods})
 
 
@@ -204,39 +448,64 @@ def get_recommendations_template_view(request, mood_id):
     mood = get_object_or_404(Mood, id=mood_id, is_active=True)
     
     try:
-        # Fetch 2 movies from TMDB
-        tmdb_movies_data = TMDBService.fetch_movies_by_mood(mood.name, count=2)
+        # Fetch 2 movies and record them as recommendations
+        movies, _ = RecommendationService.recommend(request.user, mood, count=2)
         
-        if not tmdb_movies_data:
+        if not movies:
             messages.error(request, 'No movies found for this mood. Please try again.')
             return redirect('movies:mood-selection')
         
-        # Create or update Movie objects and Recommendation objects
-        movies = []
-        
-        for tmdb_movie in tmdb_movies_data:
-            # Create or update movie
-            movie = TMDBService.create_or_update_movie(tmdb_movie)
-            movies.append(movie)
-            
-            # Create recommendation (always create new entry)
-            Recommendation.objects.create(
-                user=request.user,
-                movie=movie,
-                mood=mood,
-                recommended_at=timezone.now()
-            )
-        
         messages.success(request, f'Found {len(movies)} movies for {mood.name} mood!')
         return render(request, 'movies/movie_list.html', {'movies': movies, 'mood': mood})
         
-    except Exception as e:
-        messages.error(request, f'Error fetching movies: {str(e)}')
+    except TMDBUnavailable:
+        logger.warning('Recommendations for mood %s failed: TMDB unavailable', mood.name, exc_info=True)
+        messages.error(request, TMDB_UNAVAILABLE_MESSAGE)
+        return redirect('movies:mood-selection')
+    except Exception:
+        logger.exception('Recommendations for mood %s failed', mood.name)
+        messages.error(request, 'Error fetching movies. Please try again.')
         return redirect('movies:mood-selection')
 
 
+async def get_recommendations_async_template_view(request, mood_id):
+    """Async version of get_recommendations_template_view"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    mood = await Mood.objects.filter(id=mood_id, is_active=True).afirst()
+    if mood is None:
+        raise Http404('No Mood matches the given query.')
+    
+    try:
+        movies, _ = await AsyncRecommendationService.recommend(user, mood, count=2)
+    except TMDBUnavailable:
+        logger.warning('Recommendations for mood %s failed: TMDB unavailable', mood.name, exc_info=True)
+        messages.error(request, TMDB_UNAVAILABLE_MESSAGE)
+        return redirect('movies:mood-selection')
+    except Exception:
+        logger.exception('Recommendations for mood %s failed', mood.name)
+        messages.error(request, 'Error fetching movies. Please try again.')
+        return redirect('movies:mood-selection')
+    
+    if not movies:
+        messages.error(request, 'No movies found for this mood. Please try again.')
+        return redirect('movies:mood-selection')
+    
+    messages.success(request, f'Found {len(movies)} movies for {mood.name} mood!')
+    # Context processors read request.user synchronously
+    return await sync_to_async(render)(request, 'movies/movie_list.html', {'movies': movies, 'mood': mood})
+
+
 @login_required
+@read_from_replica()
 def recommendation_history_template_view(request):
     """Template view for recommendation history"""
-    recommendations = Recommendation.objects.filter(user=request.user).order_by('-recommended_at')
+    recommendations = (
+        Recommendation.objects
+        .filter(user=request.user)
+        .with_movie()
+        .select_related('mood')
+        .order_by('-recommended_at')
+    )
     return render(request, 'movies/recommendation_history.html', {'recommendations': recommendations})